@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+パーサの性能計測用のパッケージ。リポジトリのルートから実行する。
+
+    python -m bench.synth_cflow --lines 1000000 -o synth.txt
+    python -m bench.run_parsers --sizes 10k,100k,1M --results bench_results.json
+"""
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+cflow2dot.py の各パーサ経路のスループット (行/秒) とピークメモリを計測し、JSON に記録する。
+
+    python -m bench.run_parsers --sizes 10k,100k,1M
+
+入力は bench.synth_cflow で生成し、--data-dir に (行数, 種) ごとにキャッシュする。
+1 回の計測は新しい子プロセスで行う。ピークメモリは、子プロセスとそのワーカーの RSS の合計を
+/proc から一定間隔で読んだ最大値 (/proc がなければ子プロセス自身の ru_maxrss)。
+結果ファイル (既定: bench/results.json。git では無視する) には実行ごとの記録
+(コミット、Python の版、各計測値) を追記し、直前の記録と比べた速度比も表示する。
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench.synth_cflow import generate_cflow, parse_count
+
+# 計測するパーサ経路
+#   regex:    parse_cflow_line() による行パーサ
+#   mmap:     parse_cflow_bytes() による mmap パーサ
+#   stream:   標準入力・圧縮入力と同じ逐次パーサ
+#   parallel: レベル 0 の木の境界で分割したプロセス並列パース (エッジまで)
+#   to_dot:   mmap パーサから DOT の書き出しまで (cflow2dot.py の既定の経路)
+PATHS = ('regex', 'mmap', 'stream', 'parallel', 'to_dot')
+
+DEFAULT_SIZES = '10k,100k,1M'
+
+# ワーカーを含めた RSS の合計を読む間隔 (秒)
+RSS_SAMPLE_INTERVAL = 0.02
+
+
+def default_data_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), 'cflow_bench')
+
+
+def default_results_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.json')
+
+
+def process_tree_rss_kb(root_pid: int):
+    """
+    root_pid とその子孫プロセスの RSS の合計 (KiB)。/proc が読めなければ None。
+    """
+    parents = {}
+    rss = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                # "pid (comm) state ppid ..." の comm は空白を含みうるので、最後の ')' の後を読む
+                fields = f.read().rsplit(b')', 1)[1].split()
+            parents[pid] = int(fields[1])
+            with open(f'/proc/{pid}/statm', 'rb') as f:
+                rss[pid] = int(f.read().split()[1]) * (os.sysconf('SC_PAGE_SIZE') // 1024)
+        except (OSError, IndexError, ValueError):
+            continue
+    if root_pid not in rss:
+        return None
+
+    tree = {root_pid}
+    added = True
+    while added:
+        added = False
+        for pid, ppid in parents.items():
+            if ppid in tree and pid not in tree:
+                tree.add(pid)
+                added = True
+    return sum(rss.get(pid, 0) for pid in tree)
+
+
+class TreeRssSampler(threading.Thread):
+    """
+    計測中、このプロセスとワーカーの RSS の合計を RSS_SAMPLE_INTERVAL ごとに読み、最大値を peak_kb に残す。
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak_kb = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            total = process_tree_rss_kb(os.getpid())
+            if total is not None:
+                self.peak_kb = max(self.peak_kb or 0, total)
+            if self._stop_event.wait(RSS_SAMPLE_INTERVAL):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def ensure_input(data_dir: str, lines: int, seed: int) -> str:
+    """
+    (lines, seed) の合成入力を data_dir に用意してパスを返す (既にあれば再利用する)。
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"synth-{lines}-{seed}.txt")
+    if not os.path.exists(path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            generate_cflow(f, lines, seed)
+        os.replace(tmp, path)
+    return path
+
+
+def run_path(path: str, file_path: str, jobs: int) -> int:
+    """
+    file_path を path の経路で最後まで処理し、処理した行数 (エッジ数) を返す。
+    """
+    import cflow2dot
+
+    if path in ('regex', 'mmap'):
+        return sum(1 for _ in cflow2dot.open_cflow_entries(file_path, path))
+    if path == 'stream':
+        with open(file_path, 'rb') as f:
+            return sum(1 for _ in cflow2dot.iter_cflow_entries_stream(f))
+    if path == 'parallel':
+        return sum(1 for _ in cflow2dot.parse_cflow_parallel(file_path, jobs))
+    if path == 'to_dot':
+        entries = cflow2dot.open_cflow_entries(file_path, 'mmap')
+        with open(os.devnull, 'w') as out:
+            cflow2dot.write_dot(cflow2dot.unique_edges(cflow2dot.edges_from_entries(entries)), out)
+        return 0
+    raise ValueError(f"unknown path: {path}")
+
+
+def _child(path: str, file_path: str, jobs: int):
+    """
+    子プロセス側。計測して結果を JSON で標準出力に書く。
+    """
+    import cflow2dot  # noqa: F401  import の時間とメモリを計測から外す
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 並列経路ではワーカーのメモリも合計して数える
+    sampler = TreeRssSampler()
+    sampler.start()
+    t0 = time.perf_counter()
+    items = run_path(path, file_path, jobs)
+    seconds = time.perf_counter() - t0
+    sampler.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    json.dump({"seconds": seconds, "items": items, "base_rss_kb": base_rss,
+               "peak_rss_kb": max(peak_rss, sampler.peak_kb or 0)}, sys.stdout)
+
+
+def measure(path: str, file_path: str, jobs: int, repeat: int):
+    """
+    子プロセスで path を repeat 回計測し、最速の回の結果を返す。
+    """
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-m', 'bench.run_parsers', '--child', path,
+                               file_path, '--jobs', str(jobs)],
+                              stdout=subprocess.PIPE, check=True)
+        result = json.loads(proc.stdout)
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def git_commit() -> str:
+    try:
+        proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True)
+        return proc.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(results_path: str):
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def lines_per_sec(lines: int, seconds: float):
+    """
+    行/秒 (整数)。入力が小さすぎて計測時間が 0 になった場合は None (結果の JSON では null)。
+    """
+    if seconds <= 0:
+        return None
+    return round(lines / seconds)
+
+
+def previous_rates(runs):
+    """
+    直前の記録から (行数, 経路) -> 行/秒 の dict を作る。
+    """
+    if not runs:
+        return {}
+    return {(r["lines"], r["path"]): r["lines_per_sec"] for r in runs[-1]["results"]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="cflow2dot.py のパーサ経路ごとの速度とメモリを計測する")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES,
+                    help="計測する入力の行数 (カンマ区切り、例: 10k,100k,1M,10M。既定: %(default)s)")
+    ap.add_argument("--paths", default=','.join(PATHS),
+                    help="計測する経路 (カンマ区切り。既定: %(default)s)")
+    ap.add_argument("--seed", type=int, default=0, help="合成入力の乱数の種")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="parallel 経路のプロセス数 (既定: CPU 数)")
+    ap.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数 (最速を採る)")
+    ap.add_argument("--data-dir", default=default_data_dir(),
+                    help="合成入力を置くディレクトリ (既定: %(default)s)")
+    ap.add_argument("--results", default=default_results_path(),
+                    help="結果を追記する JSON ファイル (既定: %(default)s)")
+    ap.add_argument("--child", nargs=2, metavar=("PATH", "FILE"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _child(args.child[0], args.child[1], args.jobs)
+        return
+
+    paths = args.paths.split(',')
+    unknown = [p for p in paths if p not in PATHS]
+    if unknown:
+        print("Unknown path: " + ", ".join(unknown), file=sys.stderr)
+        sys.exit(1)
+
+    runs = load_results(args.results)
+    previous = previous_rates(runs)
+    results = []
+    for lines in map(parse_count, args.sizes.split(',')):
+        file_path = ensure_input(args.data_dir, lines, args.seed)
+        with open(file_path, 'rb') as f:
+            actual_lines = sum(1 for _ in f)
+        for path in paths:
+            r = measure(path, file_path, args.jobs, args.repeat)
+            rate = lines_per_sec(actual_lines, r["seconds"])
+            results.append({
+                "lines": lines, "path": path, "seconds": round(r["seconds"], 6),
+                "lines_per_sec": rate, "peak_rss_kb": r["peak_rss_kb"],
+                "base_rss_kb": r["base_rss_kb"],
+            })
+            prev = previous.get((lines, path))
+            change = f"  x{rate / prev:.2f} vs previous" if prev and rate is not None else ''
+            rate_text = f"{rate:>12,}" if rate is not None else f"{'n/a':>12}"
+            print(f"{lines:>10,} {path:>8}: {r['seconds']:.3f}s  {rate_text} lines/s  "
+                  f"peak {r['peak_rss_kb'] / 1024:.1f} MiB{change}")
+
+    runs.append({
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "jobs": args.jobs,
+        "results": results,
+    })
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
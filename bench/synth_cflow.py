@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+PostgreSQL 規模の cflow 出力 (POSIX 形式、行番号つき、-b の後方参照あり) を決定的に生成する。
+
+同じ (lines, seed, ...) なら常に同じ内容になるので、コミット間の計測の入力に使える。
+  - 関数名は PostgreSQL 風の接頭辞 + 番号 (小文字で始まるもの、Assert、*Main も混ぜる)
+  - レベル 0 の木は main / *Main と一部の関数から始まる
+  - 既に部分木を展開した関数が再び現れたら、backref_ratio の確率で "name: 行番号" の参照にする
+  - 深さは max_depth まで、子の数は 0 〜 fanout (深いほど少なくする)
+"""
+
+import argparse
+import random
+import sys
+
+PREFIXES = ('', 'Exec', 'Heap', 'Pg', 'Btree', 'Xlog', 'Lock', 'Slru', 'heap_', 'pg_', 'list_')
+STEMS = ('Init', 'Insert', 'Fetch', 'Update', 'Scan', 'Flush', 'Release', 'Acquire', 'Begin',
+         'End', 'Process', 'Read', 'Write', 'Check', 'Get', 'Set')
+LEAVES = ('Assert', 'palloc', 'pfree', 'elog', 'ereport', 'errmsg', 'memcpy', 'strlen')
+ROOTS = ('main', 'PostgresMain', 'PostmasterMain', 'BackgroundWriterMain', 'CheckpointerMain',
+         'WalWriterMain', 'AutoVacWorkerMain', 'StartupProcessMain')
+
+
+def parse_count(text: str) -> int:
+    """
+    "10k" / "1M" / "10000" を行数にする (k = 1000, M = 1000000)。
+    """
+    text = text.strip()
+    units = {'k': 10 ** 3, 'K': 10 ** 3, 'm': 10 ** 6, 'M': 10 ** 6}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def make_functions(rng: random.Random, count: int):
+    """
+    (関数名, 定義ファイル, 定義行) のリストを作る。
+    """
+    functions = []
+    for i in range(count):
+        name = rng.choice(PREFIXES) + rng.choice(STEMS) + str(i)
+        functions.append((name, f"src/backend/d{i % 97}/f{i % 1013}.c", rng.randint(1, 5000)))
+    return functions
+
+
+def generate_cflow(out, lines: int, seed: int = 0, functions: int = None, max_depth: int = 8,
+                   fanout: int = 6, backref_ratio: float = 0.5):
+    """
+    lines 行程度 (レベル 0 の木の切れ目まで) の cflow 出力を out (テキスト) に書く。
+    書いた行数を返す。
+    """
+    rng = random.Random(seed)
+    if functions is None:
+        functions = max(1000, lines // 25)
+    defined = make_functions(rng, functions)
+    roots = list(ROOTS) + [name for name, _, _ in defined[:50]]
+    locations = {name: (file, line) for name, file, line in defined}
+    for name in ROOTS:
+        locations[name] = ("src/backend/main/main.c", rng.randint(1, 500))
+
+    expanded = {}   # 関数名 -> 展開した行番号
+    buf = []
+    line_number = 0
+
+    def emit(level: int, text: str):
+        nonlocal line_number
+        line_number += 1
+        buf.append(f"{line_number:5d} {'    ' * level}{text}\n")
+        if len(buf) >= 8192:
+            out.write(''.join(buf))
+            buf.clear()
+
+    # 再帰の代わりに明示的なスタックで木をたどる: (関数名, レベル)
+    while line_number < lines:
+        stack = [(rng.choice(roots), 0)]
+        while stack:
+            name, level = stack.pop()
+            if name in LEAVES or name not in locations:
+                emit(level, f"{name}: <>")
+                continue
+            if name in expanded and rng.random() < backref_ratio:
+                emit(level, f"{name}: {expanded[name]}")
+                continue
+            file, def_line = locations[name]
+            emit(level, f"{name}: int (void), <{file} {def_line}>")
+            if level >= max_depth:
+                continue
+            n_children = rng.randint(0, max(1, fanout - level))
+            # cflow が参照にするのは部分木を展開した行だけ
+            if n_children and name not in expanded:
+                expanded[name] = line_number
+            children = []
+            for _ in range(n_children):
+                if rng.random() < 0.2:
+                    children.append(rng.choice(LEAVES))
+                else:
+                    children.append(defined[int(rng.paretovariate(1.2)) % len(defined)][0]
+                                    if rng.random() < 0.3 else rng.choice(defined)[0])
+            for child in reversed(children):
+                stack.append((child, level + 1))
+
+    out.write(''.join(buf))
+    return line_number
+
+
+def main():
+    ap = argparse.ArgumentParser(description="計測用の cflow 出力を決定的に生成する")
+    ap.add_argument("--lines", type=parse_count, default=100000, help="おおよその行数 (例: 10k, 1M)")
+    ap.add_argument("--seed", type=int, default=0, help="乱数の種")
+    ap.add_argument("--functions", type=int, help="関数の数 (既定: 行数 / 25、最低 1000)")
+    ap.add_argument("--max-depth", type=int, default=8, help="木の最大の深さ")
+    ap.add_argument("--fanout", type=int, default=6, help="レベル 0 での最大の子の数")
+    ap.add_argument("--backref-ratio", type=float, default=0.5,
+                    help="展開済みの関数を行番号の参照にする確率")
+    ap.add_argument("-o", "--output", metavar="PATH", help="出力先 (既定: 標準出力)")
+    args = ap.parse_args()
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        generate_cflow(out, args.lines, args.seed, args.functions, args.max_depth, args.fanout,
+                       args.backref_ratio)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
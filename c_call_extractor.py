@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cflow を使わずに C ソースから (呼び出し元, 呼び出し先) のエッジを取り出す簡易フロントエンド。
+
+字句解析でコメント・文字列・文字定数・数値・プリプロセッサ行を読み飛ばし、
+  - 波括弧の外で "名前 ( ... ) {" となっている箇所を関数定義
+  - 関数本体の中で "名前 (" となっている箇所 (制御構文のキーワードを除く) を呼び出し
+とみなす。cflow をプリプロセッサなしで動かした場合と同じく、関数形式マクロ (Assert など)
+も呼び出しとして数える。"obj->fn (" / "obj.fn (" のようなメンバ経由の呼び出しと
+"(*fp) (" のような関数ポインタ経由の呼び出しは、呼び出し先の関数が分からないので数えない。
+
+#if / #ifdef / #elif は、-D / -U で与えたマクロとファイル内の #define / #undef から評価し、
+成り立たない分岐を読み飛ばす。ヘッダは読まないので、ヘッダで定義されたマクロは未定義 (0) とみなす。
+
+    python c_call_extractor.py src/backend/main/main.c ... > main.dot
+    python c_call_extractor.py -DWIN32 src/port/*.c > port.dot
+    python c_call_extractor.py --compare cflow.dot src/backend/**/*.c
+"""
+
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from callgraph_core import merge_sorted_edges
+from cflow2dot import filter_edges, open_dot_output, write_dot
+from filter_lower_case_symbols_from_dots import should_remove_edge
+
+TOKEN_RE = re.compile(r'''
+      (?P<comment>/\*.*?\*/|//[^\n]*)
+    | (?P<pp>^[ \t]*\#(?:\\\n|[^\n])*)
+    | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+    | (?P<ident>[A-Za-z_]\w*)
+    | (?P<punct>->|[(){};=.*&,\[\]])
+''', re.VERBOSE | re.MULTILINE | re.DOTALL)
+
+PP_DIRECTIVE_RE = re.compile(r'#\s*(\w+)\s*(.*)', re.DOTALL)
+PP_DEFINE_RE = re.compile(r'([A-Za-z_]\w*)(\()?\s*(.*)', re.DOTALL)
+
+# "名前 (" の形でも呼び出しではないもの
+NOT_CALLS = frozenset((
+    'if', 'for', 'while', 'switch', 'return', 'sizeof', 'do', 'else', 'case', 'goto',
+    'typeof', '__typeof__', 'alignof', '_Alignof', '__alignof__', 'offsetof',
+    '_Static_assert', 'static_assert', '_Generic', 'defined',
+    '__attribute__', '__declspec', '__asm__', 'asm', '__asm', 'volatile', '__volatile__',
+))
+
+# 関数定義の頭で "型 (" となっても関数名ではないもの ("void (*signal (...)) (int)" など)
+TYPE_KEYWORDS = frozenset((
+    'void', 'char', 'short', 'int', 'long', 'float', 'double', 'signed', 'unsigned',
+    '_Bool', 'const', 'struct', 'union', 'enum', 'static', 'extern', 'inline', 'register',
+))
+
+# 直前にあると、続く "名前 (" が関数の呼び出しではなくメンバの呼び出しになるもの
+MEMBER_ACCESS = frozenset(('->', '.'))
+
+
+def _is_attribute(name: str) -> bool:
+    # 関数定義の前後に付く属性マクロや型は関数名ではない
+    return name in NOT_CALLS or name in TYPE_KEYWORDS or name.startswith('pg_attribute_')
+
+
+def parse_macro_args(args):
+    """
+    -DNAME / -DNAME=VALUE / -UNAME の引数列 (cflow_driver の TranslationUnit.args と同じ形) から
+    {マクロ名: 値} を作る。-D だけで値がなければ 1 (cc -D と同じ)。-I などは無視する。
+    """
+    macros = {}
+    for arg in args:
+        if arg.startswith('-D'):
+            name, sep, value = arg[2:].partition('=')
+            macros[name] = value if sep else '1'
+        elif arg.startswith('-U'):
+            macros.pop(arg[2:], None)
+    return macros
+
+
+PP_EXPR_TOKEN_RE = re.compile(r'''\s*(?:
+      (?P<number>(?:0[xX][0-9A-Fa-f]+|\d+)[uUlL]*)
+    | (?P<char>'(?:\\.|[^'\\])')
+    | (?P<ident>[A-Za-z_]\w*)
+    | (?P<op>&&|\|\||<<|>>|<=|>=|==|!=|[-+*/%<>&^|!~?:(),])
+)''', re.VERBOSE)
+
+# 二項演算子の優先順位 (大きいほど強く結びつく)
+PP_BINARY_OPS = {
+    '*': 10, '/': 10, '%': 10, '+': 9, '-': 9, '<<': 8, '>>': 8,
+    '<': 7, '>': 7, '<=': 7, '>=': 7, '==': 6, '!=': 6,
+    '&': 5, '^': 4, '|': 3, '&&': 2, '||': 1,
+}
+
+# マクロの値を展開して評価するときの入れ子の上限
+PP_EXPAND_DEPTH = 8
+
+
+class _PPExpression:
+    """
+    #if / #elif の式を評価する。C のプリプロセッサと同じく、未定義の名前と
+    関数形式マクロの呼び出しは 0、defined X / defined (X) はマクロが定義されていれば 1。
+    """
+
+    def __init__(self, text: str, macros, depth: int = 0):
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            m = PP_EXPR_TOKEN_RE.match(text, pos)
+            if not m or m.end() == pos:
+                raise ValueError(f"cannot parse #if expression: {text}")
+            self.tokens.append((m.lastgroup, m.group(m.lastgroup)))
+            pos = m.end()
+        self.pos = 0
+        self.macros = macros
+        self.depth = depth
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError("unexpected end of #if expression")
+        self.pos += 1
+        return token
+
+    def _expect(self, op: str):
+        if self._next() != ('op', op):
+            raise ValueError(f"expected {op!r} in #if expression")
+
+    def evaluate(self) -> int:
+        value = self._conditional()
+        if self.pos != len(self.tokens):
+            raise ValueError("trailing tokens in #if expression")
+        return value
+
+    def _conditional(self) -> int:
+        cond = self._binary(1)
+        if self._peek() == ('op', '?'):
+            self._next()
+            then = self._conditional()
+            self._expect(':')
+            other = self._conditional()
+            return then if cond else other
+        return cond
+
+    def _binary(self, min_prec: int) -> int:
+        left = self._unary()
+        while True:
+            kind, op = self._peek()
+            prec = PP_BINARY_OPS.get(op) if kind == 'op' else None
+            if prec is None or prec < min_prec:
+                return left
+            self._next()
+            right = self._binary(prec + 1)
+            left = self._apply(op, left, right)
+
+    @staticmethod
+    def _apply(op: str, left: int, right: int) -> int:
+        if op in ('/', '%') and right == 0:
+            return 0
+        return {
+            '*': lambda: left * right, '/': lambda: int(left / right),
+            '%': lambda: left - int(left / right) * right,
+            '+': lambda: left + right, '-': lambda: left - right,
+            '<<': lambda: left << max(right, 0), '>>': lambda: left >> max(right, 0),
+            '<': lambda: int(left < right), '>': lambda: int(left > right),
+            '<=': lambda: int(left <= right), '>=': lambda: int(left >= right),
+            '==': lambda: int(left == right), '!=': lambda: int(left != right),
+            '&': lambda: left & right, '^': lambda: left ^ right, '|': lambda: left | right,
+            '&&': lambda: int(bool(left) and bool(right)),
+            '||': lambda: int(bool(left) or bool(right)),
+        }[op]()
+
+    def _unary(self) -> int:
+        kind, tok = self._next()
+        if kind == 'op':
+            if tok == '(':
+                value = self._conditional()
+                self._expect(')')
+                return value
+            if tok in ('!', '~', '-', '+'):
+                value = self._unary()
+                return {'!': int(not value), '~': ~value, '-': -value, '+': value}[tok]
+            raise ValueError(f"unexpected {tok!r} in #if expression")
+        if kind == 'number':
+            return int(tok.rstrip('uUlL'), 0 if tok[:2].lower() == '0x' else 10)
+        if kind == 'char':
+            return ord(tok[1:-1].encode('utf-8').decode('unicode_escape')[0])
+        if tok == 'defined':
+            parenthesized = self._peek() == ('op', '(')
+            if parenthesized:
+                self._next()
+            name_kind, name = self._next()
+            if name_kind != 'ident':
+                raise ValueError("defined needs a macro name")
+            if parenthesized:
+                self._expect(')')
+            return int(name in self.macros)
+        if self._peek() == ('op', '('):
+            # 関数形式マクロ (__has_attribute(x) など) の呼び出しは読み飛ばして 0
+            self._skip_parenthesized()
+            return 0
+        return self._macro_value(tok)
+
+    def _skip_parenthesized(self):
+        level = 0
+        while True:
+            kind, tok = self._next()
+            if kind == 'op' and tok == '(':
+                level += 1
+            elif kind == 'op' and tok == ')':
+                level -= 1
+                if level == 0:
+                    return
+
+    def _macro_value(self, name: str) -> int:
+        value = self.macros.get(name)
+        if not value or self.depth >= PP_EXPAND_DEPTH:
+            return 0
+        try:
+            return _PPExpression(value, self.macros, self.depth + 1).evaluate()
+        except ValueError:
+            return 0
+
+
+def evaluate_pp_condition(expression: str, macros) -> bool:
+    """
+    #if / #elif の式 expression を macros ({マクロ名: 値}) のもとで評価する。
+    評価できない式 (C 以外の字句を含むなど) は偽とする。
+    """
+    try:
+        return _PPExpression(expression, macros).evaluate() != 0
+    except ValueError:
+        return False
+
+
+def iter_tokens(text: str, macros=None):
+    """
+    (種類, 文字列) のトークンを yield する。コメント・文字列・数値は読み飛ばし、
+    #if 系の条件分岐は macros ({マクロ名: 値}、parse_macro_args() を参照) と
+    ファイル内の #define / #undef で評価して、成り立つ分岐だけを残す。
+    """
+    macros = dict(macros or {})
+    # 条件分岐のネストごとに [外側の分岐を読んでいるか, 既にどれかの分岐を読んだか]
+    cond_stack = []
+    active = True
+
+    for m in TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind in ('comment', 'string', 'number'):
+            continue
+
+        if kind == 'pp':
+            dm = PP_DIRECTIVE_RE.match(m.group().strip())
+            if not dm:
+                continue
+            directive = dm.group(1)
+            rest = dm.group(2).replace('\\\n', ' ')
+            # 行末のコメントは条件に含めない
+            rest = TOKEN_RE.sub(lambda c: ' ' if c.lastgroup == 'comment' else c.group(),
+                                rest).strip()
+            if directive in ('if', 'ifdef', 'ifndef'):
+                if not active:
+                    take = False
+                elif directive == 'if':
+                    take = evaluate_pp_condition(rest, macros)
+                else:
+                    name = rest.split()[0] if rest else ''
+                    take = (name in macros) == (directive == 'ifdef')
+                cond_stack.append([active, take])
+                active = take
+            elif directive in ('elif', 'else') and cond_stack:
+                # 既に読んだ分岐があれば、以降の分岐は読まない
+                outer, taken = cond_stack[-1]
+                active = outer and not taken
+                if active and directive == 'elif':
+                    active = evaluate_pp_condition(rest, macros)
+                cond_stack[-1][1] = taken or active
+            elif directive == 'endif' and cond_stack:
+                active = cond_stack.pop()[0]
+            elif active and directive == 'define':
+                dm = PP_DEFINE_RE.match(rest)
+                if dm:
+                    # 関数形式マクロは #ifdef でだけ意味を持つ
+                    macros[dm.group(1)] = '' if dm.group(2) else dm.group(3).strip()
+            elif active and directive == 'undef':
+                macros.pop(rest.split()[0] if rest else '', None)
+            continue
+
+        if active:
+            yield kind, m.group()
+
+
+def extract_calls(text: str, macros=None):
+    """
+    C ソースのテキストから (呼び出し元, 呼び出し先) のエッジを出現順に yield する (重複あり)。
+    macros は iter_tokens() と同じ。
+    """
+    depth = 0          # 波括弧の深さ
+    paren = 0          # 波括弧の外での丸括弧の深さ
+    candidate = None   # 関数名の候補 (波括弧の外で最後に見た "名前 (")
+    saw_assign = False # 初期化子の '=' を見たか
+    before = None      # prev の 1 つ前のトークン
+    prev_kind = prev = None
+    current = None     # 現在の関数定義の名前
+
+    for kind, tok in iter_tokens(text, macros):
+        if depth == 0:
+            if kind == 'punct':
+                if tok == '(':
+                    if paren == 0 and prev_kind == 'ident' and not _is_attribute(prev):
+                        candidate = prev
+                    paren += 1
+                elif tok == ')':
+                    paren = max(paren - 1, 0)
+                elif tok == '=' and paren == 0:
+                    saw_assign = True
+                elif tok == ';' and paren == 0:
+                    candidate = None
+                    saw_assign = False
+                elif tok == '{':
+                    depth = 1
+                    if candidate is not None and not saw_assign and paren == 0:
+                        current = candidate
+                    else:
+                        current = None
+                    candidate = None
+                    saw_assign = False
+                elif tok == '}':
+                    candidate = None
+                    saw_assign = False
+        else:
+            if kind == 'punct':
+                if tok == '{':
+                    depth += 1
+                elif tok == '}':
+                    depth -= 1
+                    if depth == 0:
+                        current = None
+                elif tok == '(' and current is not None and prev_kind == 'ident' \
+                        and prev not in NOT_CALLS and before not in MEMBER_ACCESS:
+                    yield current, prev
+
+        before = prev
+        prev_kind, prev = kind, tok
+
+
+def extract_file_edges(path: str, args=()):
+    """
+    1 つのソースファイルから、ソート済みでユニークな (呼び出し元, 呼び出し先) のリストを返す。
+    args は -D / -U の引数列 (parse_macro_args() を参照)。
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    return sorted(set(extract_calls(text, parse_macro_args(args))))
+
+
+def extract_edges_parallel(paths, jobs: int = None, args=()):
+    """
+    paths を jobs 個のプロセスで並列に処理し、ファイル単位のソート済みエッジのリストを返す。
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(partial(extract_file_edges, args=tuple(args)), paths, chunksize=16))
+
+
+def compare_edges(ours, reference):
+    """
+    2 つのエッジ集合を比べ、(共通のエッジ数, ours だけのエッジ数, reference だけのエッジ数) を返す。
+    """
+    ours = set(ours)
+    reference = set(reference)
+    return len(ours & reference), len(ours - reference), len(reference - ours)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="C ソースから呼び出しエッジを取り出し DOT で出力する")
+    ap.add_argument("sources", nargs='+', help="C ソースファイル")
+    ap.add_argument("-D", dest="macro_args", action="append", default=[], metavar="NAME[=VALUE]",
+                    type=lambda value: '-D' + value,
+                    help="#if の評価でマクロを定義する (cc -D と同じ。複数指定可)")
+    ap.add_argument("-U", dest="macro_args", action="append", metavar="NAME",
+                    type=lambda value: '-U' + value,
+                    help="#if の評価でマクロを未定義にする (複数指定可)")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="並列数 (既定: CPU 数)")
+    ap.add_argument("-o", "--output", metavar="PATH", help="DOT の出力先 (既定: 標準出力)")
+    ap.add_argument("--filter-lower-case", action="store_true",
+                    help="cflow2dot.py --filter-lower-case と同じ規則でエッジを除く")
+    ap.add_argument("--compare", metavar="DOT",
+                    help="DOT を出力する代わりに、cflow2dot.py の出力 DOT とエッジ集合を比べる")
+    args = ap.parse_args()
+
+    edges = merge_sorted_edges(extract_edges_parallel(args.sources, args.jobs, args.macro_args))
+    edges = filter_edges(edges, should_remove_edge if args.filter_lower_case else None)
+
+    if args.compare:
+        from split_dots_with_main_suffix_nodes import parse_dotfile
+        common, only_ours, only_ref = compare_edges(edges, parse_dotfile(args.compare))
+        total_ref = common + only_ref
+        recall = common / total_ref if total_ref else 1.0
+        precision = common / (common + only_ours) if common + only_ours else 1.0
+        print(f"common: {common}, only here: {only_ours}, only in {args.compare}: {only_ref}")
+        print(f"precision: {precision:.3f}, recall: {recall:.3f}")
+        return
+
+    with open_dot_output(args.output) as out:
+        write_dot(edges, out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,712 @@
+# -*- coding: utf-8 -*-
+"""
+コールグラフの共通データ構造。
+
+関数名は SymbolTable で一度だけ整数 ID に変換 (intern) し、
+エッジは (親ID << 32 | 子ID) の int64 を詰めた配列として保持する。
+(str, str) のタプルの set / list に比べて 1 エッジあたり 8 バイトで済む。
+"""
+
+import heapq
+import os
+import tempfile
+from array import array
+
+import numpy as np
+
+# 1 つの int64 に (親ID, 子ID) を詰めるためのシフト幅とマスク
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+
+# 未整理のエッジがこの数を超えたら finalize() して配列にまとめる
+PENDING_LIMIT = 1 << 22
+
+
+class SymbolTable:
+    """
+    関数名 <-> 整数 ID の対応表。ID は登録順に 0, 1, 2, ... と振られる。
+    """
+
+    def __init__(self, names=()):
+        self.ids = {}     # 関数名 -> ID
+        self.names = []   # ID -> 関数名
+        for name in names:
+            self.intern(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        """
+        name の ID を返す。未登録なら新しい ID を振る。
+        """
+        sym_id = self.ids.get(name)
+        if sym_id is None:
+            sym_id = len(self.names)
+            self.ids[name] = sym_id
+            self.names.append(name)
+        return sym_id
+
+    def get(self, name: str, default=None):
+        return self.ids.get(name, default)
+
+    def name(self, sym_id: int) -> str:
+        return self.names[sym_id]
+
+
+def pack_edges(src_ids, dst_ids):
+    """
+    親 ID / 子 ID の配列を int64 のエッジ配列に詰める。
+    """
+    src_ids = np.asarray(src_ids, dtype=np.int64)
+    dst_ids = np.asarray(dst_ids, dtype=np.int64)
+    return (src_ids << ID_BITS) | dst_ids
+
+
+def unpack_edges(packed):
+    """
+    int64 のエッジ配列を (親 ID の配列, 子 ID の配列) に分解する。
+    """
+    packed = np.asarray(packed, dtype=np.int64)
+    return packed >> ID_BITS, packed & ID_MASK
+
+
+def sorted_unique(values):
+    """
+    int64 配列をソートし、隣接要素の比較で重複を取り除いた配列を返す。
+    (np.unique と同じ結果だが、1 次元の整数配列ではこちらの方が速い)
+    """
+    values = np.sort(np.asarray(values, dtype=np.int64))
+    if len(values) < 2:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+def sorted_unique_counts(values, weights):
+    """
+    sorted_unique() と同じ結果に加えて、重複していた要素ごとの weights の合計を返す。
+    """
+    values = np.asarray(values, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.int64)
+    if len(values) == 0:
+        return values, weights
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    weights = weights[order]
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    starts = np.flatnonzero(keep)
+    return values[starts], np.add.reduceat(weights, starts)
+
+
+class CallGraph:
+    """
+    関数名を intern した有向グラフ。
+
+    add_edge() で追加したエッジは array('q') にそのまま積んでおき、
+    finalize() (または edges 参照時) に sorted_unique_counts() でまとめて重複除去する。
+    重複除去後のエッジは (親ID, 子ID) の昇順に並び、counts に各エッジの出現回数を持つ。
+    未整理のエッジが PENDING_LIMIT を超えると途中で finalize() するので、
+    メモリはユニークなエッジ数 + PENDING_LIMIT に比例する。
+    """
+
+    def __init__(self, symbols: SymbolTable = None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self._pending = array('q')                  # 未整理のエッジ
+        self._pending_counts = array('q')           # 未整理のエッジの回数
+        self._edges = np.empty(0, dtype=np.int64)   # 重複除去済みのエッジ
+        self._counts = np.empty(0, dtype=np.int64)  # 各エッジの出現回数
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        (親関数, 子関数) の列から CallGraph を作る。
+        """
+        graph = cls()
+        graph.add_edges(edges)
+        graph.finalize()
+        return graph
+
+    def add_edge(self, src: str, dst: str, count: int = 1):
+        intern = self.symbols.intern
+        self._pending.append((intern(src) << ID_BITS) | intern(dst))
+        self._pending_counts.append(count)
+        if len(self._pending) >= PENDING_LIMIT:
+            self.finalize()
+
+    def add_edges(self, edges):
+        self.add_counted_edges(edges, counted=False)
+
+    def add_counted_edges(self, counted_edges, counted: bool = True):
+        """
+        (親関数, 子関数, 回数) の列を追加する。
+        counted が偽なら (親関数, 子関数) の列として読み、回数は 1 とする。
+        """
+        ids = self.symbols.ids
+        intern = self.symbols.intern
+        pending = self._pending
+        pending_counts = self._pending_counts
+        for edge in counted_edges:
+            if counted:
+                src, dst, count = edge
+            else:
+                src, dst = edge
+                count = 1
+            src_id = ids.get(src)
+            if src_id is None:
+                src_id = intern(src)
+            dst_id = ids.get(dst)
+            if dst_id is None:
+                dst_id = intern(dst)
+            pending.append((src_id << ID_BITS) | dst_id)
+            pending_counts.append(count)
+            if len(pending) >= PENDING_LIMIT:
+                self.finalize()
+                pending = self._pending
+                pending_counts = self._pending_counts
+
+    def finalize(self):
+        """
+        積んであるエッジを確定済みの配列にマージし、ソートと重複除去を行う。
+        """
+        if self._pending:
+            pending = np.frombuffer(self._pending, dtype=np.int64)
+            pending_counts = np.frombuffer(self._pending_counts, dtype=np.int64)
+            self._edges, self._counts = sorted_unique_counts(
+                np.concatenate((self._edges, pending)),
+                np.concatenate((self._counts, pending_counts)))
+            self._pending = array('q')
+            self._pending_counts = array('q')
+        return self
+
+    @property
+    def edges(self):
+        """
+        重複除去済みの int64 エッジ配列。
+        """
+        return self.finalize()._edges
+
+    @property
+    def counts(self):
+        """
+        edges と同じ並びの、各エッジの出現回数の配列。
+        """
+        return self.finalize()._counts
+
+    def __len__(self):
+        return len(self.edges)
+
+    @property
+    def num_nodes(self):
+        return len(self.symbols)
+
+    def edge_ids(self):
+        """
+        (親 ID の配列, 子 ID の配列) を返す。
+        """
+        return unpack_edges(self.edges)
+
+    def iter_edges(self):
+        """
+        (親関数, 子関数) を関数名で yield する。
+        """
+        names = self.symbols.names
+        src_ids, dst_ids = self.edge_ids()
+        for src_id, dst_id in zip(src_ids.tolist(), dst_ids.tolist()):
+            yield names[src_id], names[dst_id]
+
+    def iter_counted_edges(self):
+        """
+        (親関数, 子関数, 回数) を関数名で yield する。
+        """
+        names = self.symbols.names
+        src_ids, dst_ids = self.edge_ids()
+        for src_id, dst_id, count in zip(src_ids.tolist(), dst_ids.tolist(),
+                                         self.counts.tolist()):
+            yield names[src_id], names[dst_id], count
+
+    def nbytes(self):
+        """
+        エッジと回数の配列が占めるバイト数 (関数名の文字列は含まない)。
+        """
+        return self.edges.nbytes + self.counts.nbytes
+
+
+class NodeAttrTable:
+    """
+    関数ごとの定義位置 (ソースファイル, 行番号) を列指向で保持する表。
+
+    ファイルパスは files (SymbolTable) で intern し、
+    file_ids / lines は関数 ID を添字とする int 配列 (不明な位置は -1)。
+    symbols を CallGraph と共有すれば、エッジと同じ ID で引ける。
+    """
+
+    def __init__(self, symbols: SymbolTable = None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.files = SymbolTable()
+        self.file_ids = array('i')
+        self.lines = array('i')
+
+    def _grow(self):
+        missing = len(self.symbols) - len(self.file_ids)
+        if missing > 0:
+            self.file_ids.extend([-1] * missing)
+            self.lines.extend([-1] * missing)
+
+    def set(self, name: str, file: str, line: int):
+        """
+        name の定義位置を登録する。
+        """
+        sym_id = self.symbols.intern(name)
+        self._grow()
+        self.file_ids[sym_id] = self.files.intern(file)
+        self.lines[sym_id] = line
+
+    def has(self, name: str) -> bool:
+        sym_id = self.symbols.get(name)
+        return sym_id is not None and sym_id < len(self.file_ids) and self.file_ids[sym_id] >= 0
+
+    def get(self, name: str):
+        """
+        name の (ファイル, 行番号) を返す。不明なら (None, None)。
+        """
+        if not self.has(name):
+            return None, None
+        sym_id = self.symbols.get(name)
+        return self.files.name(self.file_ids[sym_id]), self.lines[sym_id]
+
+    def __iter__(self):
+        """
+        位置が分かっている関数について (関数名, ファイル, 行番号) を yield する。
+        """
+        names = self.symbols.names
+        files = self.files.names
+        for sym_id, (file_id, line) in enumerate(zip(self.file_ids, self.lines)):
+            if file_id >= 0:
+                yield names[sym_id], files[file_id], line
+
+    def __len__(self):
+        return sum(1 for file_id in self.file_ids if file_id >= 0)
+
+    def names_in_file(self, file: str):
+        """
+        file で定義されている関数名のリストを返す。
+        """
+        file_id = self.files.get(file)
+        if file_id is None:
+            return []
+        file_ids = np.frombuffer(self.file_ids, dtype=np.int32)
+        return [self.symbols.name(i) for i in np.flatnonzero(file_ids == file_id).tolist()]
+
+    def to_json_obj(self):
+        """
+        JSON に書き出せる列指向の dict を返す。
+        """
+        self._grow()
+        return {
+            "names": list(self.symbols.names),
+            "files": list(self.files.names),
+            "file_ids": self.file_ids.tolist(),
+            "lines": self.lines.tolist(),
+        }
+
+    @classmethod
+    def from_json_obj(cls, obj):
+        table = cls(SymbolTable(obj["names"]))
+        table.files = SymbolTable(obj["files"])
+        table.file_ids = array('i', obj["file_ids"])
+        table.lines = array('i', obj["lines"])
+        return table
+
+
+class CsrGraph:
+    """
+    整数 ID の有向グラフを CSR 形式で持つ。
+    ノード i の子は targets[offsets[i]:offsets[i + 1]]。
+    names はノード ID -> 関数名で、from_edges() ではエッジ列に最初に現れた順
+    (親, 子の順) に ID を振る。
+
+    from_ids() で作ると子は ID の昇順で重複なし (1 エッジあたり targets の 4 バイト)。
+    from_edges() で作ると子は入力の順で重複なし (同じエッジは最初の 1 本だけ残す) で、
+    positions (int32) に各エッジの入力での順位を持つ (1 エッジあたり計 8 バイト)。
+    positions が None なら、targets の並びがそのまま入力の順。
+    """
+
+    def __init__(self, names, offsets, targets, positions=None):
+        self.names = names
+        self.offsets = offsets
+        self.targets = targets
+        self.positions = positions
+        self._ids = None
+        self._masks = {}
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        (親関数, 子関数) の列から作る。重複したエッジは最初に現れた 1 本にする。
+        """
+        ids = {}
+        names = []
+        src_ids = array('q')
+        dst_ids = array('q')
+        for src, dst in edges:
+            src_id = ids.get(src)
+            if src_id is None:
+                src_id = ids[src] = len(names)
+                names.append(src)
+            dst_id = ids.get(dst)
+            if dst_id is None:
+                dst_id = ids[dst] = len(names)
+                names.append(dst)
+            src_ids.append(src_id)
+            dst_ids.append(dst_id)
+        src_ids = np.frombuffer(src_ids, dtype=np.int64)
+        dst_ids = np.frombuffer(dst_ids, dtype=np.int64)
+        # 各エッジの最初の出現だけを入力の順に残す
+        _, first = np.unique(pack_edges(src_ids, dst_ids), return_index=True)
+        first.sort()
+        src_ids, dst_ids = src_ids[first], dst_ids[first]
+        del first
+        positions = np.argsort(src_ids, kind='stable')
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src_ids, minlength=len(names)), out=offsets[1:])
+        return cls(names, offsets, dst_ids[positions].astype(np.int32),
+                   positions.astype(np.int32))
+
+    @classmethod
+    def from_ids(cls, names, src_ids, dst_ids):
+        """
+        関数名のリストと、(親 ID, 子 ID) の配列から作る。重複したエッジは 1 本にする。
+        """
+        src_ids, dst_ids = unpack_edges(sorted_unique(pack_edges(src_ids, dst_ids)))
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src_ids, minlength=len(names)), out=offsets[1:])
+        return cls(names, offsets, dst_ids.astype(np.int32))
+
+    @property
+    def num_nodes(self):
+        return len(self.names)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def node_id(self, name: str):
+        """
+        関数名のノード ID。なければ None。
+        """
+        if self._ids is None:
+            self._ids = {n: i for i, n in enumerate(self.names)}
+        return self._ids.get(name)
+
+    def successors(self, node_id: int):
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def out_edge_index(self, frontier):
+        """
+        frontier (ノード ID の配列) の全ノードから出るエッジの、targets 上の位置の配列。
+        """
+        starts = self.offsets[frontier]
+        counts = self.offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # k 番目のノードの子の位置 starts[k] .. starts[k] + counts[k] - 1 を一度に作る
+        return np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+
+    def edge_sources(self, index):
+        """
+        targets 上の位置の配列 index の各エッジの親 ID。
+        """
+        return np.searchsorted(self.offsets, index, side='right') - 1
+
+    def expand(self, frontier):
+        """
+        frontier の全ノードの子を連結した配列を返す (重複を含む)。
+        """
+        return self.targets[self.out_edge_index(frontier)]
+
+    def node_mask(self, predicate):
+        """
+        predicate(関数名) が真のノードの bool 配列。predicate ごとに一度だけ計算する。
+        """
+        mask = self._masks.get(predicate)
+        if mask is None:
+            mask = np.fromiter((predicate(name) for name in self.names), dtype=bool,
+                               count=len(self.names))
+            self._masks[predicate] = mask
+        return mask
+
+    def set_node_mask(self, predicate, mask):
+        """
+        node_mask(predicate) の結果として mask を使う (別プロセスで計算済みの配列を共有する場合)。
+        """
+        self._masks[predicate] = mask
+
+    def nbytes(self):
+        """
+        offsets / targets / positions が占めるバイト数 (関数名の文字列は含まない)。
+        """
+        size = self.offsets.nbytes + self.targets.nbytes
+        if self.positions is not None:
+            size += self.positions.nbytes
+        return size
+
+
+# ExternalEdgeSorter の既定のメモリ上限 (バイト)
+DEFAULT_MEMORY_LIMIT = 256 << 20
+
+# ソート済みランをマージするときに 1 ランから一度に読む (エッジ, 回数) の数
+MERGE_BLOCK = 1 << 16
+
+
+def parse_size(text: str) -> int:
+    """
+    "256M" / "2G" / "65536" のようなサイズ指定をバイト数にする (K/M/G は 1024 倍単位)。
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def merge_sorted_edges(edge_lists):
+    """
+    ソート済みの (親, 子) のリスト群を k-way マージし、重複を除いて yield する。
+    """
+    prev = None
+    for edge in heapq.merge(*edge_lists):
+        if edge != prev:
+            yield edge
+            prev = edge
+
+
+class ExternalEdgeSorter:
+    """
+    メモリ上限つきでエッジの重複除去 (と回数の合算) を行う。
+
+    エッジは CallGraph と同じく (親ID << 32 | 子ID) の int64 として溜め、
+    memory_limit に達するたびにソート・重複除去した (エッジ, 回数) のランを一時ファイルに書き出す。
+    最後にランを k-way マージしながら同じエッジの回数を合算して yield する。
+    メモリに残るのは関数名の表とバッファだけなので、ピークはユニークなエッジ数ではなく
+    memory_limit で決まる。ランは np.memmap で少しずつ読む。
+    """
+
+    def __init__(self, symbols: SymbolTable = None, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 tmp_dir: str = None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        # 1 エッジあたり、バッファ 16 バイト + ソート時の作業領域 (約 2 倍) を見込む
+        self.buffer_limit = max(memory_limit // 48, 1024)
+        self.tmp_dir = tmp_dir
+        self.runs = []                  # ランの一時ファイルのパス
+        self._pending = array('q')
+        self._pending_counts = array('q')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        ランの一時ファイルを削除する。
+        """
+        for path in self.runs:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self.runs = []
+
+    def add_edges(self, edges):
+        self.add_counted_edges(edges, counted=False)
+
+    def add_counted_edges(self, counted_edges, counted: bool = True):
+        """
+        (親関数, 子関数, 回数) の列を追加する。
+        counted が偽なら (親関数, 子関数) の列として読み、回数は 1 とする。
+        """
+        ids = self.symbols.ids
+        intern = self.symbols.intern
+        pending = self._pending
+        pending_counts = self._pending_counts
+        limit = self.buffer_limit
+        for edge in counted_edges:
+            if counted:
+                src, dst, count = edge
+            else:
+                src, dst = edge
+                count = 1
+            src_id = ids.get(src)
+            if src_id is None:
+                src_id = intern(src)
+            dst_id = ids.get(dst)
+            if dst_id is None:
+                dst_id = intern(dst)
+            pending.append((src_id << ID_BITS) | dst_id)
+            pending_counts.append(count)
+            if len(pending) >= limit:
+                self._spill()
+                pending = self._pending
+                pending_counts = self._pending_counts
+
+    def _sorted_pending(self):
+        edges, counts = sorted_unique_counts(np.frombuffer(self._pending, dtype=np.int64),
+                                             np.frombuffer(self._pending_counts, dtype=np.int64))
+        self._pending = array('q')
+        self._pending_counts = array('q')
+        return edges, counts
+
+    def _spill(self):
+        """
+        バッファをソート・重複除去し、(エッジ, 回数) を交互に並べた int64 のランとして書き出す。
+        """
+        edges, counts = self._sorted_pending()
+        fd, path = tempfile.mkstemp(prefix='edges-', suffix='.run', dir=self.tmp_dir)
+        self.runs.append(path)
+        with os.fdopen(fd, 'wb') as f:
+            np.stack((edges, counts), axis=1).tofile(f)
+
+    @staticmethod
+    def _iter_run(path):
+        run = np.memmap(path, dtype=np.int64, mode='r').reshape(-1, 2)
+        for start in range(0, len(run), MERGE_BLOCK):
+            block = np.array(run[start:start + MERGE_BLOCK])
+            yield from zip(block[:, 0].tolist(), block[:, 1].tolist())
+
+    def iter_counted_ids(self):
+        """
+        (int64 エッジ, 合計回数) をエッジの昇順に yield する。
+        """
+        if not self.runs:
+            edges, counts = self._sorted_pending()
+            yield from zip(edges.tolist(), counts.tolist())
+            return
+        if self._pending:
+            self._spill()
+
+        prev = None
+        total = 0
+        for edge, count in heapq.merge(*(self._iter_run(path) for path in self.runs)):
+            if edge == prev:
+                total += count
+                continue
+            if prev is not None:
+                yield prev, total
+            prev, total = edge, count
+        if prev is not None:
+            yield prev, total
+
+    def iter_counted_edges(self):
+        """
+        (親関数, 子関数, 回数) を関数名で、エッジの昇順に yield する。
+        """
+        names = self.symbols.names
+        for edge, count in self.iter_counted_ids():
+            yield names[edge >> ID_BITS], names[edge & ID_MASK], count
+
+    def iter_edges(self):
+        """
+        (親関数, 子関数) を関数名で、エッジの昇順に yield する。
+        """
+        names = self.symbols.names
+        for edge, _ in self.iter_counted_ids():
+            yield names[edge >> ID_BITS], names[edge & ID_MASK]
+
+
+# ConfigGraph で扱える設定の数 (マスクを int64 に収める)
+MAX_CONFIGS = 63
+
+
+class ConfigGraph:
+    """
+    複数のビルド設定 (cassert の有無、プラットフォームごとの #ifdef など) の
+    コールグラフを 1 つにまとめたもの。
+
+    エッジは CallGraph と同じ (親ID << 32 | 子ID) の昇順の int64 配列で持ち、
+    masks に「そのエッジを含む設定」のビットマスク (設定 i がビット i) を持つ。
+    設定ごとに DOT を丸ごと持つ代わりに、select() でマスクを指定して取り出す。
+    """
+
+    def __init__(self, symbols: SymbolTable = None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.configs = []                           # ビット番号 -> 設定名
+        self._edges = np.empty(0, dtype=np.int64)
+        self._masks = np.empty(0, dtype=np.int64)
+
+    def add_config(self, name: str, edges) -> int:
+        """
+        設定 name のエッジ列 ((親関数, 子関数) の列) を追加し、割り当てたビット番号を返す。
+        """
+        if name in self.configs:
+            raise ValueError(f"duplicate config name: {name}")
+        if len(self.configs) >= MAX_CONFIGS:
+            raise ValueError(f"too many configs (max {MAX_CONFIGS})")
+        bit = len(self.configs)
+        self.configs.append(name)
+
+        graph = CallGraph(self.symbols)
+        graph.add_edges(edges)
+        config_edges = graph.edges
+        # 設定ごとのエッジはユニークなので、ビットの合計がそのまま OR になる
+        self._edges, self._masks = sorted_unique_counts(
+            np.concatenate((self._edges, config_edges)),
+            np.concatenate((self._masks, np.full(len(config_edges), 1 << bit, dtype=np.int64))))
+        return bit
+
+    @property
+    def edges(self):
+        return self._edges
+
+    @property
+    def masks(self):
+        return self._masks
+
+    def __len__(self):
+        return len(self._edges)
+
+    @property
+    def all_mask(self) -> int:
+        return (1 << len(self.configs)) - 1
+
+    def mask_of(self, names) -> int:
+        """
+        設定名の列をビットマスクにする。
+        """
+        mask = 0
+        for name in names:
+            if name not in self.configs:
+                raise ValueError(f"unknown config: {name}")
+            mask |= 1 << self.configs.index(name)
+        return mask
+
+    def select(self, mask: int, require_all: bool = False):
+        """
+        mask の設定のどれか (require_all なら全部) に含まれるエッジの
+        (int64 エッジ配列, マスク配列) を返す。
+        """
+        hit = self._masks & mask
+        keep = (hit == mask) if require_all else (hit != 0)
+        return self._edges[keep], self._masks[keep]
+
+    def iter_edges(self, mask: int = None, require_all: bool = False):
+        """
+        (親関数, 子関数, マスク) を関数名で yield する。mask を渡すと select() で絞り込む。
+        """
+        if mask is None:
+            edges, masks = self._edges, self._masks
+        else:
+            edges, masks = self.select(mask, require_all)
+        names = self.symbols.names
+        src_ids, dst_ids = unpack_edges(edges)
+        for src_id, dst_id, edge_mask in zip(src_ids.tolist(), dst_ids.tolist(), masks.tolist()):
+            yield names[src_id], names[dst_id], edge_mask
@@ -1,6 +1,47 @@
 #!/usr/bin/env python3
+import argparse
+import gzip
+import io
+import json
+import lzma
+import math
+import mmap
+import os
 import re
+import shutil
+import subprocess
 import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain, islice
+from math import gcd
+from concurrent.futures import ProcessPoolExecutor
+
+from callgraph_core import (
+    DEFAULT_MEMORY_LIMIT,
+    CallGraph,
+    ConfigGraph,
+    ExternalEdgeSorter,
+    NodeAttrTable,
+    parse_size,
+)
+from filter_lower_case_symbols_from_dots import should_remove_edge
+from graph_snapshot import SNAPSHOT_SUFFIX, GraphSnapshot, write_snapshot, write_snapshot_stream
+
+# cflow が既に展開済みの部分木を行番号で指す後方参照
+#   GNU 形式 (-b):   "foo() <int foo (void) at foo.c:3> [see 12]"
+#   再帰呼び出し:    "foo() <int foo (void) at foo.c:3> (recursive: see 4) [see 4]"
+#   POSIX 形式 (-b): "foo: 12"
+BACKREF_RE = re.compile(r'\s*(?:\[see (\d+)\]|\(recursive: see (\d+)\))')
+BACKREF_BYTES_RE = re.compile(rb'\s*(?:\[see (\d+)\]|\(recursive: see (\d+)\))')
+
+# 行番号つきでパースした 1 行分の情報
+#   line_number: cflow の行番号 / ref: 後方参照先の行番号 (なければ None)
+CflowNode = namedtuple('CflowNode', 'line_number indent_level func_name ref')
+
 
 def parse_cflow_line(line: str):
     """
@@ -51,6 +92,10 @@ def parse_cflow_line(line: str):
     indent_count = len(leading_spaces)
     indent_level = indent_count // 4
 
+    # 後方参照 "[see N]" などは関数名の一部ではないので取り除く
+    if 'see ' in after_spaces:
+        after_spaces = BACKREF_RE.sub('', after_spaces)
+
     # after_spaces から関数名を取り出す
     #   多くの場合 "funcName: 戻り値 (...) ," のような形
     #   最初の ':' の手前が関数名
@@ -68,58 +113,1544 @@ def parse_cflow_line(line: str):
     return indent_level, func_name
 
 
-def cflow_to_dot(file_path: str) -> str:
+def parse_cflow_bytes(line: bytes):
     """
-    cflow の出力 (質問文例にある形式) をパースし、
-    Graphviz (DOT 形式) の文字列を生成して返す。
+    parse_cflow_line() のバイト列版。正規表現を使わず、bytes のメソッドだけで
+      行番号 -> インデント幅 -> ':' の手前の関数名
+    の順に走査する。関数名以外はデコードしない。
+    戻り値は (indent_level, 関数名のバイト列) で、取り出せない場合は (None, None)。
     """
-    edges = set()  # (親関数, 子関数) のセット
-    stack = []     # (indent_level, func_name) を保持するスタック
+    body = line.strip()
+    if not body:
+        return None, None
+
+    # 行番号 (数字の並び) を読み飛ばす
+    rest = body.lstrip(b'0123456789')
+    if len(rest) == len(body):
+        return None, None
+
+    # 行番号の後に続く空白の幅がインデント量
+    after_spaces = rest.lstrip()
+    indent_level = (len(rest) - len(after_spaces)) // 4
+
+    # 後方参照 "[see N]" などは関数名の一部ではないので取り除く
+    if b'see ' in after_spaces:
+        after_spaces = BACKREF_BYTES_RE.sub(b'', after_spaces)
+
+    # 最初の ':' の手前が関数名 (':' がなければ全体)
+    colon = after_spaces.find(b':')
+    if colon >= 0:
+        after_spaces = after_spaces[:colon]
+    func_name = after_spaces.strip()
+    if not func_name:
+        return None, None
+
+    return indent_level, func_name
+
+
+# cflow 出力の方言
+#   style: 'posix' ("name: decl, <file line>") / 'gnu' ("name() <decl at file:line>:")
+#   numbered: 行頭に行番号 (--number) があるか
+#   base_indent: レベル 0 の行のインデント幅 (行番号の後の区切りの空白を含む)
+#   indent_width: 1 レベルあたりのインデント幅 (--level-indent)
+CflowDialect = namedtuple('CflowDialect', 'style numbered base_indent indent_width')
+
+# parse_cflow_line() / parse_cflow_bytes() が前提としている方言
+DEFAULT_DIALECT = CflowDialect('posix', True, 1, 4)
+
+GNU_NAME_RE = re.compile(rb'[A-Za-z_$][\w$]*\(\)')
+
+
+def detect_cflow_dialect(file_path: str, sample_lines: int = 2000) -> CflowDialect:
+    """
+    cflow 出力ファイルの先頭 sample_lines 行から方言を推定する。
+    """
+    with open(file_path, 'rb') as f:
+        return detect_cflow_dialect_lines(islice(f, sample_lines))
+
+
+def detect_cflow_dialect_lines(lines) -> CflowDialect:
+    """
+    cflow 出力の行 (bytes) の列から方言を推定する。
+      - 行番号の有無
+      - 関数名の書き方 ("name:" なら POSIX、"name()" なら GNU)
+      - インデント幅 (レベル 0 の幅と、各行の幅の差の最大公約数)
+    判定できない場合は DEFAULT_DIALECT を返す。
+    """
+    numbered = 0
+    gnu = 0
+    total = 0
+    indents = []
+
+    for line in lines:
+        body = line.rstrip()
+        if not body.strip():
+            continue
+        total += 1
+
+        stripped = body.lstrip()
+        rest = stripped.lstrip(b'0123456789')
+        if len(rest) < len(stripped) and rest[:1].isspace():
+            numbered += 1
+        else:
+            rest = body
+
+        after_spaces = rest.lstrip()
+        indents.append(len(rest) - len(after_spaces))
+        if GNU_NAME_RE.match(after_spaces):
+            gnu += 1
+
+    if total == 0:
+        return DEFAULT_DIALECT
+
+    is_numbered = numbered * 2 > total
+    if numbered and not is_numbered:
+        # 行番号つきとそうでない行が混ざっている場合、インデントは当てにならない
+        indents = []
+
+    base_indent = min(indents) if indents else (1 if is_numbered else 0)
+    indent_width = 0
+    for indent in indents:
+        indent_width = gcd(indent_width, indent - base_indent)
+    if indent_width == 0:
+        indent_width = 4
+
+    return CflowDialect('gnu' if gnu * 2 > total else 'posix',
+                        is_numbered, base_indent, indent_width)
+
+
+def _gnu_func_name(after_spaces: bytes) -> bytes:
+    # GNU 形式では関数名の直後に "()" が付く
+    paren = after_spaces.find(b'(')
+    if paren > 0:
+        return after_spaces[:paren].strip()
+    # "()" がない行 (参照だけの行など) は ' <' か ':' の手前まで
+    if b'see ' in after_spaces:
+        after_spaces = BACKREF_BYTES_RE.sub(b'', after_spaces)
+    for sep in (b' <', b':'):
+        pos = after_spaces.find(sep)
+        if pos >= 0:
+            after_spaces = after_spaces[:pos]
+    return after_spaces.strip()
+
+
+def make_cflow_bytes_parser(dialect: CflowDialect = DEFAULT_DIALECT):
+    """
+    方言ごとに特化した行パーサ (parse_cflow_bytes() と同じ戻り値) を返す。
+    DEFAULT_DIALECT なら parse_cflow_bytes() そのもの。
+    """
+    if dialect == DEFAULT_DIALECT:
+        return parse_cflow_bytes
+
+    base_indent = dialect.base_indent
+    indent_width = dialect.indent_width
+
+    if dialect.style == 'posix' and dialect.numbered:
+        # POSIX 形式で --level-indent が既定以外
+        def parse_posix_numbered(line: bytes):
+            body = line.strip()
+            rest = body.lstrip(b'0123456789')
+            if len(rest) == len(body):
+                return None, None
+            after_spaces = rest.lstrip()
+            indent_level = max(len(rest) - len(after_spaces) - base_indent, 0) // indent_width
+            if b'see ' in after_spaces:
+                after_spaces = BACKREF_BYTES_RE.sub(b'', after_spaces)
+            colon = after_spaces.find(b':')
+            if colon >= 0:
+                after_spaces = after_spaces[:colon]
+            func_name = after_spaces.strip()
+            if not func_name:
+                return None, None
+            return indent_level, func_name
+        return parse_posix_numbered
+
+    if dialect.style == 'posix':
+        # 行番号なしの POSIX 形式 (行頭からインデント)
+        def parse_posix_plain(line: bytes):
+            body = line.rstrip()
+            after_spaces = body.lstrip()
+            if not after_spaces:
+                return None, None
+            indent_level = max(len(body) - len(after_spaces) - base_indent, 0) // indent_width
+            if b'see ' in after_spaces:
+                after_spaces = BACKREF_BYTES_RE.sub(b'', after_spaces)
+            colon = after_spaces.find(b':')
+            if colon >= 0:
+                after_spaces = after_spaces[:colon]
+            func_name = after_spaces.strip()
+            if not func_name:
+                return None, None
+            return indent_level, func_name
+        return parse_posix_plain
+
+    if dialect.numbered:
+        # GNU 形式 (--number)
+        def parse_gnu_numbered(line: bytes):
+            body = line.strip()
+            rest = body.lstrip(b'0123456789')
+            if len(rest) == len(body):
+                return None, None
+            after_spaces = rest.lstrip()
+            indent_level = max(len(rest) - len(after_spaces) - base_indent, 0) // indent_width
+            func_name = _gnu_func_name(after_spaces)
+            if not func_name:
+                return None, None
+            return indent_level, func_name
+        return parse_gnu_numbered
+
+    # GNU 形式 (cflow の既定の出力)
+    def parse_gnu_plain(line: bytes):
+        body = line.rstrip()
+        after_spaces = body.lstrip()
+        if not after_spaces:
+            return None, None
+        indent_level = max(len(body) - len(after_spaces) - base_indent, 0) // indent_width
+        func_name = _gnu_func_name(after_spaces)
+        if not func_name:
+            return None, None
+        return indent_level, func_name
+    return parse_gnu_plain
+
+
+def parse_cflow_node_bytes(line: bytes, parse_entry=parse_cflow_bytes, numbered: bool = True):
+    """
+    parse_entry (parse_cflow_bytes() など) の結果に加えて、行番号と後方参照先も取り出す。
+    戻り値は (line_number, indent_level, 関数名のバイト列, ref) で、
+    取り出せない場合は None。行番号のない出力では line_number は None。
+    """
+    indent_level, func_name = parse_entry(line)
+    if func_name is None:
+        return None
+
+    line_number = None
+    if numbered:
+        body = line.lstrip()
+        digits = len(body) - len(body.lstrip(b'0123456789'))
+        if digits == 0:
+            return None
+        line_number = int(body[:digits])
+
+    ref = None
+    if b'see ' in line:
+        match = BACKREF_BYTES_RE.search(line)
+        if match:
+            ref = int(match.group(1) or match.group(2))
+    else:
+        # POSIX 形式の -b では "name: N" の N が参照先
+        colon = line.find(b':')
+        if colon >= 0:
+            tail = line[colon + 1:].strip()
+            if tail.isdigit():
+                ref = int(tail)
+
+    return line_number, indent_level, func_name, ref
+
+
+def parse_cflow_location(line):
+    """
+    cflow 出力の 1 行から定義位置を取り出し、(ファイル, 行番号) を返す。
+      例: "    1 main: int (int argc, char *argv[]), <src/backend/main/main.c 71>"
+          -> ("src/backend/main/main.c", 71)
+    GNU 形式の "<int main (int argc,char **argv) at main.c:71>" も受け付ける。
+    "<>" (定義の見つからない関数) など、位置がない場合は (None, None)。
+    line は str / bytes のどちらでもよい。
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', 'replace')
+
+    # 行末側の "<ファイル 行番号>" を探す
+    lt = line.rfind('<')
+    if lt < 0:
+        return None, None
+    gt = line.find('>', lt)
+    if gt < 0:
+        return None, None
+
+    location = line[lt + 1:gt]
+    if ' at ' in location:
+        # GNU 形式: "宣言 at ファイル:行番号"
+        file, _, line_number = location.rpartition(' at ')[2].rpartition(':')
+    else:
+        file, _, line_number = location.rpartition(' ')
+    if not file or not line_number.isdigit():
+        return None, None
+    return file, int(line_number)
+
+
+def _record_location(attrs, func_name, line):
+    # 位置がまだ分かっていない関数についてだけ、行の残りを調べる
+    if not attrs.has(func_name):
+        file, line_number = parse_cflow_location(line)
+        if file is not None:
+            attrs.set(func_name, file, line_number)
+
+
+def iter_cflow_entries(lines, parse_line=parse_cflow_line, attrs=None):
+    """
+    cflow 出力の行イテラブルから (indent_level, func_name) を順に yield する。
+    パースできない行は読み飛ばす。
+    attrs (NodeAttrTable) を渡すと、各関数の定義位置もそこに記録する。
+    """
+    for line in lines:
+        indent_level, func_name = parse_line(line)
+        if func_name is not None:
+            if attrs is not None:
+                _record_location(attrs, func_name, line)
+            yield indent_level, func_name
+
+
+def iter_cflow_entries_mmap(file_path: str, start: int = 0, end: int = None, attrs=None,
+                            parse_entry=parse_cflow_bytes):
+    """
+    cflow 出力ファイルを mmap し、parse_entry (既定は parse_cflow_bytes()) で
+    1 行ずつ走査して (indent_level, func_name) を yield する。
+    start / end を指定した場合はそのバイト範囲 (行頭から始まること) だけを読む。
+    attrs (NodeAttrTable) を渡すと、各関数の定義位置もそこに記録する。
+    関数名のデコード結果はバイト列をキーにキャッシュし、同じ名前を何度もデコードしない。
+    結果は iter_cflow_entries(f) と一致する。
+    """
+    names = {}  # 関数名のバイト列 -> デコード済み文字列
+
+    with open(file_path, 'rb') as f:
+        # 空ファイルは mmap できない
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if end is None:
+                end = len(mm)
+            mm.seek(start)
+            while mm.tell() < end:
+                line = mm.readline()
+                indent_level, raw_name = parse_entry(line)
+                if raw_name is None:
+                    continue
+                func_name = names.get(raw_name)
+                if func_name is None:
+                    func_name = raw_name.decode('utf-8')
+                    names[raw_name] = func_name
+                if attrs is not None:
+                    _record_location(attrs, func_name, line)
+                yield indent_level, func_name
+
+
+def iter_cflow_nodes(file_path: str, start: int = 0, end: int = None, index=None,
+                     dialect: CflowDialect = DEFAULT_DIALECT, attrs=None):
+    """
+    cflow 出力ファイル (の start〜end のバイト範囲) を mmap で走査し、
+    CflowNode を順に yield する。
+
+    index (dict) を渡すと、行番号 -> 関数名の索引をそこに記録する。記録するのは
+    「子を持つ行」、つまり cflow が部分木を展開した行だけなので、全行を覚えるよりずっと小さい。
+    後方参照 ("[see N]" など) の行番号が index にあれば、参照先の部分木は展開済みである。
+    複数の範囲をまたいで調べたい場合は同じ dict を index に渡す。
+    後方参照の行自体にも関数名が書かれているので、エッジを作るだけなら index は要らない。
+    attrs (NodeAttrTable) を渡すと、各関数の定義位置もそこに記録する。
+    """
+    parse_entry = make_cflow_bytes_parser(dialect)
+    names = {}  # 関数名のバイト列 -> デコード済み文字列
+    prev = None  # 直前の行 (子を持つかどうかは次の行で分かる)
+
+    with open(file_path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if end is None:
+                end = len(mm)
+            mm.seek(start)
+            while mm.tell() < end:
+                line = mm.readline()
+                parsed = parse_cflow_node_bytes(line, parse_entry, dialect.numbered)
+                if parsed is None:
+                    continue
+                line_number, indent_level, raw_name, ref = parsed
+                func_name = names.get(raw_name)
+                if func_name is None:
+                    func_name = raw_name.decode('utf-8')
+                    names[raw_name] = func_name
+                if attrs is not None:
+                    _record_location(attrs, func_name, line)
+
+                # 直前の行より深ければ、直前の行は部分木の展開元
+                if (index is not None and prev is not None and prev.line_number is not None
+                        and indent_level > prev.indent_level):
+                    index[prev.line_number] = prev.func_name
+
+                prev = CflowNode(line_number, indent_level, func_name, ref)
+                yield prev
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            indent_level, func_name = parse_cflow_line(line)
-            if func_name is None:
+
+def check_backrefs(file_path: str, dialect: CflowDialect = DEFAULT_DIALECT):
+    """
+    すべての後方参照が、ファイル内で展開済みの部分木に解決できるかを調べ、
+    (後方参照の数, 解決できなかった参照先の行番号のリスト) を返す。
+    すべて解決できれば、後方参照を展開しなくてもエッジの集合は完全である。
+    """
+    index = {}
+    refs = 0
+    unresolved = []
+    for node in iter_cflow_nodes(file_path, index=index, dialect=dialect):
+        if node.ref is None:
+            continue
+        refs += 1
+        if node.ref not in index:
+            unresolved.append(node.ref)
+    return refs, unresolved
+
+
+# レベル 0 の木 1 本分の位置情報
+#   name: 根の関数名 / start, end: バイト範囲 / first_line: 先頭行の cflow 行番号
+TopTree = namedtuple('TopTree', 'name start end first_line')
+
+# サイドカー索引ファイルの拡張子と形式のバージョン
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+
+
+def build_toplevel_index(file_path: str, dialect: CflowDialect = DEFAULT_DIALECT):
+    """
+    cflow 出力を 1 回走査し、レベル 0 の木ごとの TopTree のリストを返す。
+    """
+    trees = []
+    parse_entry = make_cflow_bytes_parser(dialect)
+    current = None  # (name, start, first_line)
+    pos = 0
+
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return trees
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                parsed = parse_cflow_node_bytes(line, parse_entry, dialect.numbered)
+                if parsed is not None and parsed[1] == 0:
+                    if current is not None:
+                        trees.append(TopTree(current[0], current[1], pos, current[2]))
+                    current = (parsed[2].decode('utf-8'), pos, parsed[0])
+                pos += len(line)
+
+    if current is not None:
+        trees.append(TopTree(current[0], current[1], pos, current[2]))
+    return trees
+
+
+def load_toplevel_index(file_path: str, index_path: str = None,
+                        dialect: CflowDialect = DEFAULT_DIALECT):
+    """
+    file_path のサイドカー索引 (既定は file_path + INDEX_SUFFIX) を読んで TopTree のリストを返す。
+    索引がない、または cflow 出力のサイズ・更新時刻と合わない場合は作り直して保存する。
+    """
+    if index_path is None:
+        index_path = file_path + INDEX_SUFFIX
+    st = os.stat(file_path)
+
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if (saved.get("version") == INDEX_VERSION
+                and saved.get("size") == st.st_size
+                and saved.get("mtime_ns") == st.st_mtime_ns):
+            return [TopTree(*tree) for tree in saved["trees"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    trees = build_toplevel_index(file_path, dialect)
+    try:
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "trees": [list(tree) for tree in trees],
+            }, f)
+    except OSError:
+        # 書き込めない場所でも、索引をその場で使うだけなら問題ない
+        pass
+    return trees
+
+
+def _subtree_nodes(file_path: str, tree: TopTree, line_number: int, dialect, attrs=None):
+    """
+    tree の中で line_number の行を根とする部分木の CflowNode を yield する。
+    attrs には、yield した関数の定義位置だけを記録する。
+    """
+    # 部分木より前の行も読むので、位置はいったん別の表に集める
+    seen = NodeAttrTable() if attrs is not None else None
+    base_level = None
+    for node in iter_cflow_nodes(file_path, tree.start, tree.end, None, dialect, seen):
+        if base_level is None:
+            if node.line_number != line_number:
                 continue
+            base_level = node.indent_level
+        elif node.indent_level <= base_level:
+            break
+        if attrs is not None and not attrs.has(node.func_name):
+            file, def_line = seen.get(node.func_name)
+            if file is not None:
+                attrs.set(node.func_name, file, def_line)
+        yield node
+
+
+def iter_root_edges(file_path: str, roots, trees, dialect: CflowDialect = DEFAULT_DIALECT,
+                    remove_edge=None, attrs=None):
+    """
+    roots に挙げた関数を根とするレベル 0 の木だけをパースし、エッジを yield する (重複あり)。
+    木の中の後方参照が他の木で展開された部分木を指している場合は、
+    その部分木だけを追加で読み、-b 出力でもエッジが欠けないようにする。
+    attrs (NodeAttrTable) を渡すと、読んだ行にある定義位置をそこに記録する。
+    """
+    by_name = {}
+    for tree in trees:
+        by_name.setdefault(tree.name, []).append(tree)
+    # 行番号のない出力では後方参照を辿れない (first_line も None)
+    first_lines = [tree.first_line or 0 for tree in trees]
+
+    # yield した行の行番号。参照先の行を yield 済みなら、その部分木も出し終えている。
+    # _subtree_nodes() は部分木より前の行も読み飛ばしながら走査するので、
+    # iter_cflow_nodes の索引 (走査した展開行) では判定しない
+    emitted = set()
+    pending = []    # まだ読んでいない参照先の行番号
+    fetched = set()
+
+    def entries(nodes):
+        for node in nodes:
+            if node.line_number is not None:
+                emitted.add(node.line_number)
+            if node.ref is not None and node.ref not in emitted:
+                pending.append(node.ref)
+            yield node.indent_level, node.func_name
+
+    for root in roots:
+        for tree in by_name.get(root, []):
+            yield from edges_from_entries(
+                entries(iter_cflow_nodes(file_path, tree.start, tree.end, None, dialect, attrs)),
+                remove_edge)
+
+    while pending:
+        ref = pending.pop()
+        if ref in emitted or ref in fetched:
+            continue
+        fetched.add(ref)
+        # 参照先の行を含む木 (先頭行番号が ref 以下で最大のもの)
+        i = bisect_right(first_lines, ref) - 1
+        if i < 0:
+            continue
+        yield from edges_from_entries(
+            entries(_subtree_nodes(file_path, trees[i], ref, dialect, attrs)), remove_edge)
+
+
+def find_toplevel_chunks(file_path: str, n_chunks: int, parse_entry=parse_cflow_bytes):
+    """
+    cflow 出力を、インデントレベル 0 の行 (独立した木の先頭) の直前で
+    おおよそ n_chunks 個に分割し、(start, end) のバイト範囲のリストを返す。
+    木の途中で切ることはないので、各範囲を独立にパースしても結果は変わらない。
+    """
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = [0]
+            for k in range(1, n_chunks):
+                pos = max(size * k // n_chunks, bounds[-1])
+
+                # 次の行頭まで進める
+                newline = mm.find(b'\n', max(pos - 1, 0))
+                if newline < 0:
+                    break
+                pos = newline + 1
+
+                # レベル 0 の行が現れるまで読み進める
+                mm.seek(pos)
+                while pos < size:
+                    line = mm.readline()
+                    indent_level, func_name = parse_entry(line)
+                    if func_name is not None and indent_level == 0:
+                        break
+                    pos += len(line)
+
+                if pos >= size:
+                    break
+                if pos > bounds[-1]:
+                    bounds.append(pos)
+            bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_chunk(chunk):
+    """
+    プロセスプールのワーカー。1 つのバイト範囲をパースし、
+    その範囲内でユニークなエッジを初出順のリストで返す。
+    with_attrs が真なら、定義位置の (関数名, ファイル, 行番号) のリストも返す。
+    """
+    file_path, start, end, with_attrs, dialect, remove_edge = chunk
+    attrs = NodeAttrTable() if with_attrs else None
+    entries = iter_cflow_entries_mmap(file_path, start, end, attrs,
+                                      make_cflow_bytes_parser(dialect))
+    edges = list(unique_edges(edges_from_entries(entries, remove_edge)))
+    return edges, (list(attrs) if with_attrs else [])
+
+
+def parse_cflow_parallel(file_path: str, jobs: int, attrs=None,
+                         dialect: CflowDialect = DEFAULT_DIALECT, remove_edge=None):
+    """
+    cflow 出力をレベル 0 の境界で分割し、jobs 個のプロセスで並列にパースする。
+    各チャンクのエッジをファイル中の順に連結して yield する (チャンク間の重複は残る)。
+    unique_edges() を通せば、逐次パースと同じ順序・内容になる。
+    attrs (NodeAttrTable) を渡すと、各チャンクで見つけた定義位置をそこへマージする。
+    remove_edge は edges_from_entries() と同じで、ワーカー側で適用する
+    (プロセス間で受け渡すため、モジュールの最上位で定義された関数であること)。
+    """
+    # 木の大きさのばらつきを均すため、プロセス数より細かく分割する
+    parse_entry = make_cflow_bytes_parser(dialect)
+    chunks = [(file_path, start, end, attrs is not None, dialect, remove_edge)
+              for start, end in find_toplevel_chunks(file_path, jobs * 4, parse_entry)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for chunk_edges, locations in pool.map(_parse_chunk, chunks):
+            for func_name, file, line_number in locations:
+                if not attrs.has(func_name):
+                    attrs.set(func_name, file, line_number)
+            yield from chunk_edges
+
+
+def edges_from_entries(entries, remove_edge=None):
+    """
+    (indent_level, func_name) の列をスタックで辿り、
+    (親関数, 子関数) のエッジを見つけた順に yield する。
+    重複除去は行わない (unique_edges() を参照)。
+
+    remove_edge(親, 子) が真を返すエッジはその場で捨てる
+    (filter_lower_case_symbols_from_dots.should_remove_edge など)。
+    除外したノードもスタックには積むので、その子が祖先に付け替えられることはなく、
+    DOT を書いてから filter_lower_case_symbols_from_dots.py で落とすのと同じエッジが残る。
+    """
+    stack = []     # (indent_level, func_name) を保持するスタック
+
+    for indent_level, func_name in entries:
+        # スタックの先頭が現在より同じか深いレベルなら pop
+        while stack and stack[-1][0] >= indent_level:
+            stack.pop()
+
+        # 親子関係の登録
+        if indent_level > 0 and stack:
+            parent_func = stack[-1][1]
+            if remove_edge is None or not remove_edge(parent_func, func_name):
+                yield parent_func, func_name
+
+        # スタックに現在の関数を積む
+        stack.append((indent_level, func_name))
+
+
+def iter_cflow_edges(lines, parse_line=parse_cflow_line):
+    """
+    cflow 出力の行イテラブルを先頭から 1 行ずつ読み、
+    (親関数, 子関数) のエッジを見つけた順に yield する。
+    重複除去は行わない (unique_edges() を参照)。
+    """
+    return edges_from_entries(iter_cflow_entries(lines, parse_line))
+
+
+# cflow --xref (-x) の 1 行
+#   定義: "main * src/backend/main/main.c:71 int main (int argc, char *argv[])"
+#   参照: "startup_hacks   src/backend/main/main.c:88"
+XREF_RE = re.compile(r'^(\S+)\s+(?:(\*)\s+)?(\S+):(\d+)(?:\s|$)')
+
+
+def parse_xref_line(line: str):
+    """
+    cflow --xref 出力の 1 行から (関数名, 定義行か, ファイル, 行番号) を取り出す。
+    取り出せない場合は None。
+    """
+    match = XREF_RE.match(line)
+    if not match:
+        return None
+    func_name, star, file, line_number = match.groups()
+    return func_name, star is not None, file, int(line_number)
+
+
+def is_function_declaration(name: str, declaration: str) -> bool:
+    """
+    xref の定義行の宣言文 (例: "int main (int argc, char *argv[])") が関数の定義かを判定する。
+    -i x などで一覧に入る変数 ("static int counter"、関数ポインタ "int (*hook) (int)") は偽。
+    宣言文がなければ関数とみなす。
+    """
+    declaration = declaration.strip()
+    if not declaration:
+        return True
+    return re.search(r'\b' + re.escape(name) + r'\s*\(', declaration) is not None
+
+
+# C ソースの波括弧を数えるときに読み飛ばす字句 (コメント・文字列・文字定数・プリプロセッサ行)
+SOURCE_SKIP_RE = re.compile(
+    r'/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+    r'|^[ \t]*#(?:\\\n|[^\n])*|[{}\n]', re.S | re.M)
+
+
+def toplevel_blocks(text: str):
+    """
+    C ソースのファイルスコープにある { ... } の (開き括弧の行, 閉じ括弧の行) を順に返す。
+    関数本体のほか、構造体の定義や初期化子も含む。
+    """
+    blocks = []
+    line_number = 1
+    depth = 0
+    start = None
+    for m in SOURCE_SKIP_RE.finditer(text):
+        token = m.group()
+        if token == '{':
+            if depth == 0:
+                start = line_number
+            depth += 1
+        elif token == '}':
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    blocks.append((start, line_number))
+        else:
+            line_number += token.count('\n')
+    return blocks
+
+
+def function_extents(text: str, def_lines):
+    """
+    def_lines (関数の定義行) ごとに、その関数の本体が終わる行を返す ({定義行: 終わりの行})。
+    本体は定義行以降で最初のファイルスコープの { ... } とする。
+    """
+    blocks = toplevel_blocks(text)
+    starts = [start for start, _ in blocks]
+    extents = {}
+    for def_line in def_lines:
+        i = bisect_right(starts, def_line - 1)
+        if i < len(blocks):
+            extents[def_line] = blocks[i][1]
+    return extents
+
+
+def _read_function_extents(source_dir: str, file: str, def_lines):
+    try:
+        with open(os.path.join(source_dir, file), 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+    except OSError:
+        print(f"{file}: source not found; callers are guessed from definition lines",
+              file=sys.stderr)
+        return None
+    return function_extents(text, def_lines)
+
+
+def filter_edges(edges, remove_edge=None):
+    """
+    remove_edge(親, 子) が真を返すエッジを取り除く。
+    """
+    if remove_edge is None:
+        return edges
+    return ((src, dst) for src, dst in edges if not remove_edge(src, dst))
 
-            # スタックの先頭が現在より同じか深いレベルなら pop
-            while stack and stack[-1][0] >= indent_level:
-                stack.pop()
 
-            # 親子関係の登録
-            if indent_level > 0 and stack:
-                parent_func = stack[-1][1]
-                edges.add((parent_func, func_name))
+def iter_xref_edges(lines, attrs=None, source_dir: str = None):
+    """
+    cflow --xref 出力から (親関数, 子関数) のエッジを yield する (重複あり)。
+
+    xref 出力は「どの関数が、どのファイルの何行目で定義・参照されているか」の一覧なので、
+    参照位置を本体に含む関数を呼び出し元とする。入力は 1 回だけ読み、
+    木形式のような部分木の繰り返しもスタックも必要ない。
+    source_dir を渡すと、そこから xref に書かれたパスのソースを読んで関数本体の範囲を求め、
+    どの関数本体にも入らない参照 (ファイルスコープの関数ポインタ表の初期化子など) を捨てる。
+    ソースがなければ、同じファイルで参照行以前に定義された最後の関数を呼び出し元とみなす。
+    呼ばれる側は関数だけにする (定義行の宣言文が変数のシンボルへの参照は捨てる)。
+    attrs (NodeAttrTable) を渡すと、定義行の位置をそこに記録する。
+    """
+    defs = {}          # ファイル -> [(定義行, 関数名)]
+    variables = set()  # 関数でないと分かったシンボル
+    refs = []          # (ファイル, 参照行, 呼ばれる関数)
+
+    for line in lines:
+        match = XREF_RE.match(line)
+        if not match:
+            continue
+        func_name, star, file, line_number = match.groups()
+        if star is None:
+            refs.append((file, int(line_number), func_name))
+        elif is_function_declaration(func_name, line[match.end():]):
+            defs.setdefault(file, []).append((int(line_number), func_name))
+            if attrs is not None and not attrs.has(func_name):
+                attrs.set(func_name, file, int(line_number))
+        else:
+            variables.add(func_name)
+
+    def_lines = {}
+    extents = {}   # ファイル -> {定義行: 本体の終わりの行} (ソースを読めたファイルだけ)
+    for file, file_defs in defs.items():
+        file_defs.sort()
+        def_lines[file] = [line_number for line_number, _ in file_defs]
+        if source_dir is not None:
+            file_extents = _read_function_extents(source_dir, file, def_lines[file])
+            if file_extents is not None:
+                extents[file] = file_extents
+
+    for file, line_number, callee in refs:
+        if callee in variables:
+            continue
+        file_defs = defs.get(file)
+        if not file_defs:
+            continue
+        i = bisect_right(def_lines[file], line_number) - 1
+        if i < 0:
+            # 最初の関数定義より前 (宣言や初期化子) の参照
+            continue
+        def_line, caller = file_defs[i]
+        file_extents = extents.get(file)
+        if file_extents is not None and line_number > file_extents.get(def_line, def_line):
+            # 関数本体の外 (ファイルスコープ) の参照
+            continue
+        yield caller, callee
+
+
+# 形式の判定に使う空でない行の数
+FORMAT_SAMPLE_LINES = 100
+
+
+def detect_cflow_format(file_path: str) -> str:
+    """
+    cflow 出力ファイルの先頭の行を見て、木形式 ('tree') か --xref 形式 ('xref') かを判定する。
+    """
+    with open(file_path, 'rb') as f:
+        return detect_cflow_format_lines(f)
+
+
+def detect_cflow_format_lines(lines) -> str:
+    """
+    cflow 出力の行 (bytes) の列から、先頭の空でない FORMAT_SAMPLE_LINES 行で形式を判定する。
+    すべての行が同じ形式でなければ ValueError (--format で指定してもらう)。
+    """
+    kinds = set()
+    sampled = 0
+    for line in lines:
+        line = line.decode('utf-8', 'replace')
+        if not line.strip():
+            continue
+        kinds.add('xref' if _is_xref_line(line) else 'tree')
+        sampled += 1
+        if sampled >= FORMAT_SAMPLE_LINES:
+            break
+    if len(kinds) > 1:
+        raise ValueError("cannot tell the cflow output format (tree and xref lines are mixed); "
+                         "use --format")
+    return kinds.pop() if kinds else 'tree'
+
 
-            # スタックに現在の関数を積む
-            stack.append((indent_level, func_name))
+def _is_xref_line(line: str) -> bool:
+    # 木形式の行は空白か行番号で始まり、xref の行は関数名で始まる
+    return not (line[0].isspace() or line[0].isdigit() or parse_xref_line(line) is None)
 
-    # DOT 形式の出力を組み立てる
-    # 注意: 特殊文字を含む関数名の場合はダブルクォートで囲んでおく
-    #       ここでは単純にダブルクォートで囲うことにする
-    lines = []
-    lines.append('digraph cflow {')
-    lines.append('    rankdir=TB;')  # 上→下方向に階層を描画 (好みに応じて LR など)
-    lines.append('    node [shape=box];')
+
+# --format xref に xref のレコードのない入力を渡されたときのメッセージ
+XREF_FORMAT_MISMATCH = ("--format xref: no cflow --xref records found "
+                        "(the input looks like tree output; use --format tree or auto)")
+
+
+def check_xref_format(lines):
+    """
+    --format xref を指定された入力の先頭の空でない FORMAT_SAMPLE_LINES 行 (bytes) に
+    xref のレコードが 1 つもなければ ValueError。木形式の出力を xref として読むと、
+    エラーにならずに空のグラフになってしまうため。空の入力はそのまま通す。
+    """
+    sampled = 0
+    for line in lines:
+        line = line.decode('utf-8', 'replace')
+        if not line.strip():
+            continue
+        if _is_xref_line(line):
+            return
+        sampled += 1
+        if sampled >= FORMAT_SAMPLE_LINES:
+            break
+    if sampled:
+        raise ValueError(XREF_FORMAT_MISMATCH)
+
+
+def open_xref_edges(file_path: str, attrs=None, source_dir: str = None):
+    with open(file_path, 'r', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+        yield from iter_xref_edges(f, attrs, source_dir)
+
+
+# --parser で選べるパーサ。いずれも (indent_level, func_name) の列を返す。
+PARSERS = ('mmap', 'regex')
+
+
+def open_cflow_entries(file_path: str, parser: str = 'mmap', attrs=None,
+                       dialect: CflowDialect = DEFAULT_DIALECT):
+    """
+    parser で指定した方式で cflow 出力ファイルを読み、
+    (indent_level, func_name) の列を返す。
+    mmap パーサは dialect に特化した行パーサを使う。
+    regex パーサは DEFAULT_DIALECT (POSIX 形式、行番号つき、4 スペース) 専用。
+    """
+    if parser == 'mmap':
+        return iter_cflow_entries_mmap(file_path, attrs=attrs,
+                                       parse_entry=make_cflow_bytes_parser(dialect))
+    if parser == 'regex':
+        if dialect != DEFAULT_DIALECT:
+            raise ValueError(f"regex parser does not support {dialect}")
+        return _iter_cflow_entries_text(file_path, attrs)
+    raise ValueError(f"unknown parser: {parser}")
+
+
+def _iter_cflow_entries_text(file_path: str, attrs=None):
+    with open(file_path, 'r', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+        yield from iter_cflow_entries(f, attrs=attrs)
+
+
+def unique_edges(edges):
+    """
+    エッジ列から重複を取り除きながら、初出の順に逐次 yield する。
+    関数名は整数 ID に置き換え、seen には (親ID << 32 | 子ID) の int だけを保持する。
+    タプルを丸ごと保持するより小さく、メモリはユニークなエッジ数にのみ比例する。
+    """
+    ids = {}       # 関数名 -> 整数 ID
+    seen = set()   # 出力済みエッジのキー
 
     for src, dst in edges:
-        # グラフ中のノード名として安全に扱うため、ダブルクォートで囲む
-        s_quoted = f"\"{src}\""
-        d_quoted = f"\"{dst}\""
-        lines.append(f"    {s_quoted} -> {d_quoted};")
+        src_id = ids.setdefault(src, len(ids))
+        dst_id = ids.setdefault(dst, len(ids))
+        key = (src_id << 32) | dst_id
+        if key in seen:
+            continue
+        seen.add(key)
+        yield src, dst
+
+
+def count_edges(counted_edges):
+    """
+    (親関数, 子関数, 回数) の列を同じエッジごとに合算し、初出の順に
+    (親関数, 子関数, 合計回数) を yield する。
+    unique_edges() と同じく関数名を整数 ID にし、(親ID << 32 | 子ID) -> 回数 の
+    dict だけを保持するので、メモリはユニークなエッジ数に比例する。
+    """
+    ids = {}       # 関数名 -> 整数 ID
+    names = []     # 整数 ID -> 関数名
+    counts = {}    # エッジのキー -> 回数
+
+    for src, dst, count in counted_edges:
+        src_id = ids.get(src)
+        if src_id is None:
+            src_id = ids[src] = len(names)
+            names.append(src)
+        dst_id = ids.get(dst)
+        if dst_id is None:
+            dst_id = ids[dst] = len(names)
+            names.append(dst)
+        key = (src_id << 32) | dst_id
+        counts[key] = counts.get(key, 0) + count
+
+    for key, count in counts.items():
+        yield names[key >> 32], names[key & 0xffffffff], count
+
+
+def edge_attributes(count: int) -> str:
+    """
+    呼び出し回数 count に応じた DOT のエッジ属性を返す (1 回なら空文字列)。
+    weight は dot のレイアウトでエッジを短く・まっすぐにする重み、
+    penwidth は線の太さ (回数の対数で太くし、上限を設ける)。
+    """
+    if count <= 1:
+        return ''
+    penwidth = min(1.0 + math.log2(count), 8.0)
+    return f' [weight={count}, penwidth={penwidth:.1f}, label="{count}"]'
+
+
+def iter_dot_lines(edges, node_attrs=None, counted: bool = False, configs=None):
+    """
+    エッジ列から Graphviz (DOT 形式) の行を 1 行ずつ yield する (改行は含まない)。
+    node_attrs (NodeAttrTable) を渡すと、エッジの後に各関数の定義位置を
+    file / line 属性として出力する。
+    counted が真なら edges は (親, 子, 回数) の列で、回数を edge_attributes() で属性にする。
+    configs (設定名のリスト) を渡すと edges は (親, 子, マスク) の列で、マスクを configs 属性に、
+    設定名の並びをグラフの configs 属性にする。
+    注意: 特殊文字を含む関数名の場合はダブルクォートで囲んでおく
+          ここでは単純にダブルクォートで囲うことにする
+    """
+    yield 'digraph cflow {'
+    yield '    rankdir=TB;'  # 上→下方向に階層を描画 (好みに応じて LR など)
+    yield '    node [shape=box];'
+
+    if configs is not None:
+        yield f'    graph [configs="{",".join(configs)}"];'
+        for src, dst, mask in edges:
+            yield f"    \"{src}\" -> \"{dst}\" [configs={mask}];"
+    elif counted:
+        for src, dst, count in edges:
+            yield f"    \"{src}\" -> \"{dst}\"{edge_attributes(count)};"
+    else:
+        for src, dst in edges:
+            # グラフ中のノード名として安全に扱うため、ダブルクォートで囲む
+            yield f"    \"{src}\" -> \"{dst}\";"
+
+    # node_attrs はエッジを読み終えた時点で揃うので、ノード属性は最後に出す
+    if node_attrs is not None:
+        for func_name, file, line_number in node_attrs:
+            yield f"    \"{func_name}\" [file=\"{file}\", line={line_number}];"
+
+    yield '}'
+
+
+def write_dot(edges, out, node_attrs=None, counted: bool = False, configs=None):
+    """
+    エッジ列を DOT 形式で out に逐次書き出す。
+    入力を読み終える前から出力が始まり、DOT 全体を文字列として保持しない。
+    """
+    for dot_line in iter_dot_lines(edges, node_attrs, counted, configs):
+        out.write(dot_line)
+        out.write('\n')
+
+
+def cflow_to_dot(file_path: str, parser: str = 'mmap') -> str:
+    """
+    cflow の出力 (質問文例にある形式) をパースし、
+    Graphviz (DOT 形式) の文字列を生成して返す。
+    巨大な入力では write_dot() で逐次出力する方を使うこと。
+    """
+    entries = open_cflow_entries(file_path, parser)
+    return "\n".join(iter_dot_lines(unique_edges(edges_from_entries(entries))))
+
+
+def parse_config_arg(value: str):
+    """
+    "名前=パス" を (名前, パス) に分ける。"=" がなければパスのファイル名 (拡張子なし) を名前にする。
+    """
+    name, sep, path = value.partition('=')
+    if not sep:
+        path = value
+        name = os.path.basename(value).split('.')[0]
+    return name, path
+
+
+def benchmark_parsers(file_path: str, repeat: int = 3):
+    """
+    各パーサで file_path を最後まで読み、最良の所要時間 (秒) と行数を
+    {parser: (seconds, entries)} の形で返す。
+    """
+    results = {}
+    for parser in PARSERS:
+        best = None
+        count = 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            count = sum(1 for _ in open_cflow_entries(file_path, parser))
+            elapsed = time.perf_counter() - t0
+            if best is None or elapsed < best:
+                best = elapsed
+        results[parser] = (best, count)
+    return results
+
+
+def print_benchmark(results, out):
+    """
+    benchmark_parsers() の結果を、regex パーサに対する速度比つきで書き出す。
+    """
+    base = results['regex'][0]
+    for parser, (seconds, count) in results.items():
+        rate = count / seconds if seconds > 0 else float('inf')
+        speedup = base / seconds if seconds > 0 else float('inf')
+        print(f"{parser:>6}: {seconds:.3f}s  {rate:,.0f} lines/s  x{speedup:.2f}", file=out)
+
+
+# 入出力のバッファサイズ (パイプや圧縮ストリームでも大きな単位で読み書きする)
+IO_BUFFER_SIZE = 1 << 20
+
+# 先頭のマジックバイトと圧縮形式
+COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+# 出力ファイルの拡張子と圧縮形式
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.xz': 'xz', '.zst': 'zstd'}
+
+
+def sniff_compression(head: bytes):
+    """
+    先頭のバイト列から圧縮形式 ('gzip' / 'xz' / 'zstd') を判定する。非圧縮なら None。
+    """
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def is_plain_file(path: str) -> bool:
+    """
+    path が mmap や seek のできる非圧縮の通常ファイルかどうか。
+    """
+    if path == '-':
+        return False
+    with open(path, 'rb') as f:
+        return sniff_compression(f.read(8)) is None
+
+
+def _copy_stream(src, dst):
+    # サブプロセスの標準入力へ流し込むスレッド
+    try:
+        shutil.copyfileobj(src, dst, IO_BUFFER_SIZE)
+    finally:
+        dst.close()
+
+
+def _import_zstandard():
+    # zstandard モジュールがなければ None (zstd コマンドで代用する)
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _require_zstd_command():
+    if shutil.which('zstd') is None:
+        raise ValueError("zstd compression needs the zstandard module or the zstd command")
+
+
+def _open_zstd_reader(stream):
+    zstandard = _import_zstandard()
+    if zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(stream, read_size=IO_BUFFER_SIZE)
+        return io.BufferedReader(reader, IO_BUFFER_SIZE)
+
+    # zstandard モジュールがなければ zstd コマンドで展開する
+    _require_zstd_command()
+    proc = subprocess.Popen(['zstd', '-dcq'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            bufsize=IO_BUFFER_SIZE)
+    threading.Thread(target=_copy_stream, args=(stream, proc.stdin), daemon=True).start()
+    return proc.stdout
+
+
+def open_cflow_input(path: str):
+    """
+    cflow 出力を読むためのバイナリストリームを返す。
+      - path が '-' なら標準入力
+      - gzip / xz / zstd で圧縮されていれば透過的に展開する
+    zstd を展開する手段がなければ ValueError。
+    """
+    if path == '-':
+        raw = io.BufferedReader(sys.stdin.buffer.raw, IO_BUFFER_SIZE)
+    else:
+        raw = open(path, 'rb', buffering=IO_BUFFER_SIZE)
+
+    compression = sniff_compression(raw.peek(8)[:8])
+    if compression == 'gzip':
+        return io.BufferedReader(gzip.GzipFile(fileobj=raw, mode='rb'), IO_BUFFER_SIZE)
+    if compression == 'xz':
+        return io.BufferedReader(lzma.LZMAFile(raw, 'rb'), IO_BUFFER_SIZE)
+    if compression == 'zstd':
+        try:
+            return _open_zstd_reader(raw)
+        except ValueError:
+            raw.close()
+            raise
+    return raw
+
+
+def dot_output_compression(path: str = None, compression: str = None):
+    """
+    DOT の出力先 path と --compress の指定から圧縮形式を決める (非圧縮なら None)。
+    zstd を圧縮する手段がなければ ValueError。
+    """
+    if compression is None and path not in (None, '-'):
+        compression = COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+    if compression == 'zstd' and _import_zstandard() is None:
+        _require_zstd_command()
+    return compression
+
+
+@contextmanager
+def open_dot_output(path: str = None, compression: str = None):
+    """
+    DOT を書き出すテキストストリームを返すコンテキストマネージャ。
+    path が None か '-' なら標準出力。compression が None の場合は path の拡張子から決める。
+    """
+    compression = dot_output_compression(path, compression)
+
+    if path in (None, '-'):
+        raw = sys.stdout.buffer
+        close_raw = False
+    else:
+        raw = open(path, 'wb', buffering=IO_BUFFER_SIZE)
+        close_raw = True
+
+    proc = None
+    if compression == 'gzip':
+        sink = gzip.GzipFile(fileobj=raw, mode='wb')
+    elif compression == 'xz':
+        sink = lzma.LZMAFile(raw, 'wb')
+    elif compression == 'zstd':
+        zstandard = _import_zstandard()
+        if zstandard is not None:
+            sink = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            raw.flush()
+            proc = subprocess.Popen(['zstd', '-qc'], stdin=subprocess.PIPE, stdout=raw)
+            sink = proc.stdin
+    else:
+        sink = None
+
+    out = io.TextIOWrapper(raw if sink is None else sink, encoding='utf-8', newline='\n')
+    try:
+        yield out
+    finally:
+        if sink is None:
+            out.detach()
+        else:
+            # 圧縮ストリームを閉じて末尾を書き出す (raw 自体は閉じない)
+            out.close()
+        if proc is not None:
+            proc.wait()
+        if close_raw:
+            raw.close()
+        else:
+            raw.flush()
+
+
+def iter_cflow_entries_stream(stream, attrs=None, parse_entry=parse_cflow_bytes):
+    """
+    バイナリストリーム (標準入力や展開中の圧縮ファイル) の行から
+    (indent_level, func_name) を yield する。iter_cflow_entries_mmap() のストリーム版。
+    """
+    names = {}  # 関数名のバイト列 -> デコード済み文字列
+
+    for line in stream:
+        indent_level, raw_name = parse_entry(line)
+        if raw_name is None:
+            continue
+        func_name = names.get(raw_name)
+        if func_name is None:
+            func_name = raw_name.decode('utf-8')
+            names[raw_name] = func_name
+        if attrs is not None:
+            _record_location(attrs, func_name, line)
+        yield indent_level, func_name
+
+
+def open_stream_edges(path: str, input_format: str = 'auto', attrs=None, remove_edge=None,
+                      source_dir: str = None, parser: str = 'mmap', xref_only: bool = False):
+    """
+    標準入力や圧縮ファイルを先頭から 1 回だけ読むエッジ列 (重複あり) を返す。
+    形式と方言は先頭の行を覗いて判定し、その行も捨てずにパースに回す。
+    parser は open_cflow_entries() と同じで、'mmap' はストリーム用のバイト列パーサになる。
+    xref_only が真なら、木形式の入力は ValueError (--counts は xref 形式でしか意味がない)。
+    入力を開けない、形式を判定できない、parser が方言に合わない場合は
+    エッジを読み始める前にその場で例外 (OSError / ValueError) を送出する。
+    """
+    stream = open_cflow_input(path)
+    try:
+        head = list(islice(stream, 2000))
+        lines = chain(head, stream)
+        if input_format == 'auto':
+            input_format = detect_cflow_format_lines(head)
+        elif input_format == 'xref':
+            check_xref_format(head)
+        if xref_only and input_format != 'xref':
+            raise ValueError(COUNTS_NEED_XREF)
+
+        if input_format == 'xref':
+            edges = filter_edges(
+                iter_xref_edges((line.decode('utf-8') for line in lines), attrs, source_dir),
+                remove_edge)
+        else:
+            dialect = detect_cflow_dialect_lines(head)
+            if parser == 'mmap':
+                entries = iter_cflow_entries_stream(lines, attrs, make_cflow_bytes_parser(dialect))
+            elif parser == 'regex':
+                if dialect != DEFAULT_DIALECT:
+                    raise ValueError(f"regex parser does not support {dialect}")
+                entries = iter_cflow_entries((line.decode('utf-8') for line in lines),
+                                             attrs=attrs)
+            else:
+                raise ValueError(f"unknown parser: {parser}")
+            edges = edges_from_entries(entries, remove_edge)
+    except BaseException:
+        stream.close()
+        raise
+    return _closing_edges(edges, stream)
+
+
+# --counts に木形式を渡されたときのメッセージ
+COUNTS_NEED_XREF = ("--counts needs cflow --xref input "
+                    "(tree output repeats expanded subtrees, so its counts are not call sites)")
 
-    lines.append('}')
-    return "\n".join(lines)
+
+def _closing_edges(edges, stream):
+    # エッジを読み終えたら (途中で捨てられても) 入力を閉じる
+    try:
+        yield from edges
+    finally:
+        stream.close()
+
+
+def build_arg_parser():
+    ap = argparse.ArgumentParser(
+        description="cflow の出力を Graphviz (DOT 形式) に変換する")
+    ap.add_argument("cflow_outputs", nargs='+', metavar="cflow_output",
+                    help="cflow の出力ファイル ('-' なら標準入力。gzip / xz / zstd 圧縮も可)。"
+                         "複数指定するとビルド設定ごとの出力とみなし、1 つのグラフにまとめて"
+                         "各エッジにそれを含む設定のビットマスク (configs 属性) を付ける。"
+                         "\"名前=パス\" で設定名を指定できる (既定: ファイル名)")
+    ap.add_argument("-o", "--output", metavar="PATH",
+                    help="DOT の出力先 (既定: 標準出力)。拡張子 .gz / .xz / .zst なら圧縮する")
+    ap.add_argument("--compress", choices=('gzip', 'xz', 'zstd'),
+                    help="DOT を指定の形式で圧縮して出力する")
+    ap.add_argument("--format", choices=('auto', 'tree', 'xref'), default='auto',
+                    help="入力の形式。tree: 通常の木形式、xref: cflow --xref の出力、"
+                         "auto: 先頭の行から判定 (既定)")
+    ap.add_argument("--source-dir", metavar="DIR", default=".",
+                    help="xref 形式のとき、xref に書かれたソースのパスの基準ディレクトリ "
+                         "(cflow を実行したディレクトリ。既定: カレントディレクトリ)。"
+                         "ソースから関数本体の範囲を求め、関数の外の参照をエッジにしない")
+    ap.add_argument("--parser", choices=PARSERS, default='mmap',
+                    help="木形式の行パーサ (既定: mmap。標準入力・圧縮ファイルでは "
+                         "mmap の代わりに同じバイト列パーサで 1 行ずつ読む)")
+    ap.add_argument("-j", "--jobs", type=int, default=1,
+                    help="レベル 0 の木の境界で入力を分割し、N プロセスで並列にパースする "
+                         "(mmap パーサを使う)")
+    ap.add_argument("--dedupe", choices=('stream', 'sort', 'external'), default='stream',
+                    help="エッジの重複除去方式。stream: 見つけた順に逐次出力 (既定)、"
+                         "sort: 整数 ID の int64 配列に詰めてから一括でソート・重複除去、"
+                         "external: --memory-limit ごとにソート済みランを一時ファイルに書き出し、"
+                         "k-way マージで重複除去 (メモリに収まらない入力向け)")
+    ap.add_argument("--memory-limit", metavar="SIZE", type=parse_size, default=DEFAULT_MEMORY_LIMIT,
+                    help="--dedupe external で溜めるエッジのメモリ上限 (例: 512M, 2G。既定: 256M)")
+    ap.add_argument("--tmp-dir", metavar="DIR",
+                    help="--dedupe external のランを書き出すディレクトリ (既定: システムの一時ディレクトリ)")
+    ap.add_argument("--filter-lower-case", action="store_true",
+                    help="filter_lower_case_symbols_from_dots.py と同じ規則 (小文字で始まる関数と "
+                         "Assert を含むエッジを除く。main は残す) をパース中に適用する")
+    ap.add_argument("--counts", action="store_true",
+                    help="同じ (親, 子) の呼び出し箇所の数を数え、DOT の weight / penwidth / label "
+                         "属性にする。xref 形式の入力のみ (木形式は展開済みの部分木を繰り返すので、"
+                         "出現回数が呼び出し箇所の数にならない)")
+    ap.add_argument("--locations", action="store_true",
+                    help="各関数の定義位置を DOT のノード属性 (file, line) として出力する")
+    ap.add_argument("--attrs-json", metavar="PATH",
+                    help="各関数の定義位置を列指向の JSON として PATH に書き出す")
+    ap.add_argument("--snapshot", metavar="PATH",
+                    help="DOT に加えて、グラフのバイナリスナップショット (%s) を PATH に書き出す。"
+                         "split_dots_with_main_suffix_nodes.py などは DOT の代わりにこれを読める。"
+                         "スナップショットのエッジは --dedupe sort と同じ順に並び、"
+                         "定義位置は --locations のときだけ記録する" % SNAPSHOT_SUFFIX)
+    ap.add_argument("--root", metavar="NAME", action="append",
+                    help="NAME を根とするレベル 0 の木だけを変換する (複数指定可)。"
+                         "サイドカー索引 (<cflow_output>%s) を作成・再利用する。"
+                         "mmap パーサで読むので --parser regex とは併用できない" % INDEX_SUFFIX)
+    ap.add_argument("--index", metavar="PATH",
+                    help="--root で使う索引ファイルのパス")
+    ap.add_argument("--select-config", metavar="NAMES",
+                    help="複数の設定をまとめるとき、カンマ区切りの設定のどれかに含まれるエッジだけを出力する")
+    ap.add_argument("--check-refs", action="store_true",
+                    help="DOT を出力する代わりに、後方参照 ([see N] など) がすべて解決できるか調べる")
+    ap.add_argument("--bench", action="store_true",
+                    help="DOT を出力する代わりに各パーサの速度を計測する")
+    return ap
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python cflow2dot.py <cflow_output.txt>", file=sys.stderr)
+    ap = build_arg_parser()
+    args = ap.parse_args()
+    if args.root and (args.jobs > 1 or args.counts):
+        ap.error("--root cannot be combined with --jobs or --counts")
+    if args.root and args.parser != 'mmap':
+        ap.error("--root always uses the mmap parser; it cannot be combined with --parser "
+                 + args.parser)
+    try:
+        dot_output_compression(args.output, args.compress)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    attrs = NodeAttrTable() if (args.locations or args.attrs_json) else None
+    remove_edge = should_remove_edge if args.filter_lower_case else None
+
+    if len(args.cflow_outputs) > 1:
+        _write_config_graph(args, attrs, remove_edge)
+        return
+    if args.select_config:
+        print("--select-config needs two or more cflow outputs", file=sys.stderr)
+        sys.exit(1)
+    cflow_output = args.cflow_outputs[0]
+
+    if args.check_refs or args.bench:
+        if not _is_plain_input(cflow_output):
+            print("--check-refs / --bench need an uncompressed regular file", file=sys.stderr)
+            sys.exit(1)
+        if args.check_refs:
+            refs, unresolved = check_backrefs(cflow_output, detect_cflow_dialect(cflow_output))
+            print(f"back-references: {refs}, unresolved: {len(unresolved)}")
+            if unresolved:
+                print("unresolved lines: " + " ".join(map(str, unresolved[:20])), file=sys.stderr)
+                sys.exit(1)
+        else:
+            print_benchmark(benchmark_parsers(cflow_output), sys.stdout)
+        return
+
+    edges = _open_edges(cflow_output, args, attrs, remove_edge)
+    _write_edges(edges, args, attrs)
+
+
+def _open_edges(cflow_output: str, args, attrs=None, remove_edge=None):
+    """
+    args の指定 (--format / --root / --jobs / --parser) に従って cflow_output のエッジ列
+    (重複あり) を開く。指定と入力が合わなければメッセージを出して終了する。
+    """
+    if not _is_plain_input(cflow_output):
+        # 標準入力・圧縮ファイルは先頭から 1 回だけ読む
+        if args.root or args.jobs > 1:
+            print("--root / --jobs need an uncompressed regular file", file=sys.stderr)
+            sys.exit(1)
+        try:
+            return open_stream_edges(cflow_output, args.format, attrs, remove_edge,
+                                     args.source_dir, args.parser, xref_only=args.counts)
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    dialect = detect_cflow_dialect(cflow_output)
+    input_format = args.format
+    try:
+        if input_format == 'auto':
+            input_format = detect_cflow_format(cflow_output)
+        elif input_format == 'xref':
+            with open(cflow_output, 'rb') as f:
+                check_xref_format(f)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    if input_format == 'xref':
+        if args.root or args.jobs > 1:
+            print("--root / --jobs need the tree format", file=sys.stderr)
+            sys.exit(1)
+        return filter_edges(open_xref_edges(cflow_output, attrs, args.source_dir), remove_edge)
+    if args.counts:
+        print(COUNTS_NEED_XREF, file=sys.stderr)
+        sys.exit(1)
+    if args.root:
+        trees = load_toplevel_index(cflow_output, args.index, dialect)
+        known = {tree.name for tree in trees}
+        missing = [root for root in args.root if root not in known]
+        if missing:
+            print("No such top-level function: " + ", ".join(missing), file=sys.stderr)
+            sys.exit(1)
+        return iter_root_edges(cflow_output, args.root, trees, dialect, remove_edge, attrs)
+    if args.jobs > 1:
+        return parse_cflow_parallel(cflow_output, args.jobs, attrs, dialect, remove_edge)
+    try:
+        entries = open_cflow_entries(cflow_output, args.parser, attrs, dialect)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    return edges_from_entries(entries, remove_edge)
+
+
+def _is_plain_input(path: str) -> bool:
+    # 入力を開けなければメッセージを出して終了する
+    try:
+        return is_plain_file(path)
+    except OSError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+def _write_config_graph(args, attrs, remove_edge):
+    """
+    複数の cflow 出力をビルド設定ごとのグラフとして ConfigGraph にまとめ、
+    エッジごとの設定マスクつきで DOT を書き出す。
+    """
+    if args.counts or args.check_refs or args.bench or args.snapshot:
+        print("--counts / --check-refs / --bench / --snapshot take a single cflow output",
+              file=sys.stderr)
         sys.exit(1)
 
-    file_path = sys.argv[1]
-    dot_text = cflow_to_dot(file_path)
-    print(dot_text)
+    graph = ConfigGraph()
+    for value in args.cflow_outputs:
+        name, path = parse_config_arg(value)
+        edges = _open_edges(path, args, attrs, remove_edge)
+        try:
+            graph.add_config(name, edges)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    mask = None
+    if args.select_config:
+        try:
+            mask = graph.mask_of(args.select_config.split(','))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    with open_dot_output(args.output, args.compress) as out:
+        write_dot(graph.iter_edges(mask), out, attrs if args.locations else None,
+                  configs=graph.configs)
+
+    if args.attrs_json:
+        with open(args.attrs_json, 'w', encoding='utf-8') as f:
+            json.dump(attrs.to_json_obj(), f)
+
+
+def _write_edges(edges, args, attrs):
+    """
+    重複除去 (--counts なら回数の合算) をしてから DOT を書き出し、
+    必要なら定義位置の JSON とスナップショットも書き出す。
+    """
+    # DOT にノード属性を出すときだけ、スナップショットにも定義位置を記録する
+    snapshot_attrs = attrs if args.locations else None
+    if args.dedupe == 'external':
+        with ExternalEdgeSorter(memory_limit=args.memory_limit, tmp_dir=args.tmp_dir) as sorter:
+            sorter.add_counted_edges(edges, counted=False)
+            if not args.snapshot:
+                edges = sorter.iter_counted_edges() if args.counts else sorter.iter_edges()
+                _write_dot_output(edges, args, attrs)
+                return
+            # ランのマージ結果をそのままスナップショットに書き、DOT はそれを読み返して書く
+            write_snapshot_stream(args.snapshot, sorter.symbols, sorter.iter_counted_ids(),
+                                  snapshot_attrs, args.counts, args.tmp_dir)
+        with GraphSnapshot(args.snapshot) as snapshot:
+            edges = snapshot.iter_counted_edges() if args.counts else snapshot.iter_edges()
+            _write_dot_output(edges, args, attrs)
+        return
+
+    graph = CallGraph() if (args.dedupe == 'sort' or args.snapshot) else None
+    if args.dedupe == 'sort':
+        graph.add_counted_edges(edges, counted=False)
+        edges = graph.iter_counted_edges() if args.counts else graph.iter_edges()
+    else:
+        if graph is not None:
+            # DOT は見つけた順に書き、通ったエッジを CallGraph にも溜めてスナップショットにする
+            edges = _collect_edges(edges, graph)
+        if args.counts:
+            edges = count_edges((src, dst, 1) for src, dst in edges)
+        else:
+            edges = unique_edges(edges)
+    _write_dot_output(edges, args, attrs)
+    if args.snapshot:
+        write_snapshot(args.snapshot, graph, snapshot_attrs, counted=args.counts)
+
+
+def _collect_edges(edges, graph):
+    """
+    edges をそのまま yield しながら graph (CallGraph) にも追加する。
+    """
+    for src, dst in edges:
+        graph.add_edge(src, dst)
+        yield src, dst
+
+
+def _write_dot_output(edges, args, attrs):
+    with open_dot_output(args.output, args.compress) as out:
+        write_dot(edges, out, attrs if args.locations else None, args.counts)
+
+    if args.attrs_json:
+        with open(args.attrs_json, 'w', encoding='utf-8') as f:
+            json.dump(attrs.to_json_obj(), f)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cflow を翻訳単位 (.c ファイル) ごと、またはディレクトリごとに並列に実行し、
+それぞれの出力を cflow2dot.py のパーサでエッジにしてから 1 つの DOT にまとめる。
+
+    python cflow_driver.py compile_commands.json -j 8 -o postgres.dot
+    python cflow_driver.py files.txt --group dir -j 8 > postgres.dot
+
+ファイル間の呼び出し (a.c の関数が b.c の関数を呼ぶ) は、a.c の出力に
+"呼び出し元 -> 呼び出し先" として現れ、呼び出し先の先は b.c の出力に現れる。
+エッジは関数名で突き合わせてマージするので、ファイルをまたぐエッジも失われない。
+
+各ユニットのエッジは、ソースファイルの内容と cflow のオプションのハッシュをキーに
+ディスクへキャッシュする (--cache-dir)。再実行時は内容の変わったファイルだけ cflow をかける。
+キーに含まれるのは .c ファイル自身の内容だけなので、ヘッダだけを変更した場合は
+--no-cache で作り直すこと。
+
+--frontend python を指定すると cflow の代わりに c_call_extractor.py の簡易パーサを使う
+(cflow のない環境向け)。--frontend clang は compile_commands.json の -I / -D / -U と
+-isystem / -include / -std= / --sysroot で clang に LLVM IR を出力させ、関数定義 (define) と
+call 命令からエッジを作る。
+実際のビルドと同じく #ifdef やマクロが展開されるので、Assert などのマクロはエッジに現れない。
+
+    python cflow_driver.py compile_commands.json --frontend clang -j 8 -o postgres.dot
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from cflow2dot import (
+    detect_cflow_dialect_lines,
+    edges_from_entries,
+    iter_cflow_entries_stream,
+    make_cflow_bytes_parser,
+    open_dot_output,
+    write_dot,
+)
+from callgraph_core import merge_sorted_edges
+from c_call_extractor import extract_file_edges
+from filter_lower_case_symbols_from_dots import should_remove_edge
+
+# cflow1 回分の入力
+#   directory: cflow を実行するディレクトリ / files: ソースファイル / args: -I, -D, -U などの引数
+TranslationUnit = namedtuple('TranslationUnit', 'directory files args')
+
+# cflow2dot.py が前提とする形式 (POSIX 形式、行番号つき) で、static 関数も含めて
+# すべての関数を根として出力させる。-b で既出の部分木は行番号の参照だけにする。
+DEFAULT_CFLOW_FLAGS = ['--format=posix', '--number', '-AA', '--brief']
+
+# compile_commands.json の引数のうち cflow に渡すもの (プリプロセッサの設定)
+PASSTHROUGH_PREFIXES = ('-I', '-D', '-U')
+
+# compile_commands.json の引数のうち clang にだけ渡すもの (cflow は知らないオプション)。
+# ヘッダの探し方や言語の版が実際のビルドと違うと、同じようにパースできない
+CLANG_PASSTHROUGH_PREFIXES = ('-isystem', '-include', '-std=', '--sysroot')
+
+# 値が次の引数に分かれていることのあるオプション
+SEPARATE_VALUE_OPTIONS = ('-I', '-D', '-U', '-isystem', '-include', '--sysroot')
+
+# エッジの取り出し方。cflow: cflow を実行する / python: c_call_extractor.py で直接読む /
+# clang: clang で LLVM IR にして読む
+FRONTENDS = ('cflow', 'python', 'clang')
+
+# --frontend python のキャッシュのキーに使う名前 (c_call_extractor.py の結果が変わったら番号を上げる)
+EXTRACTOR_CACHE_NAME = 'c_call_extractor-2'
+
+# clang に LLVM IR を標準出力へ書かせるオプション (最適化によるインライン展開はしない)
+DEFAULT_CLANG_FLAGS = ['-S', '-emit-llvm', '-O0', '-g0', '-w', '-o', '-']
+
+# LLVM IR の関数定義と、直接呼び出し (関数ポインタ経由の呼び出しは %レジスタ なので対象外)
+LLVM_DEFINE_RE = re.compile(rb'^define\b[^@]*@([\w.$]+)\(')
+LLVM_CALL_RE = re.compile(rb'\b(?:call|invoke)\b[^@%]*@([\w.$]+)\(')
+
+
+def cflow_args_from_command(arguments, prefixes=PASSTHROUGH_PREFIXES):
+    """
+    コンパイラの引数列から、prefixes で始まる引数 (既定は cflow にも渡せる -I / -D / -U) を抜き出す。
+    "-I dir" のように値が次の引数に分かれている場合もまとめる ("--sysroot dir" は "--sysroot=dir")。
+    """
+    result = []
+    i = 0
+    while i < len(arguments):
+        arg = arguments[i]
+        if arg in prefixes and arg in SEPARATE_VALUE_OPTIONS and i + 1 < len(arguments):
+            separator = '=' if arg.startswith('--') else ''
+            result.append(arg + separator + arguments[i + 1])
+            i += 2
+            continue
+        if arg.startswith(prefixes):
+            result.append(arg)
+        i += 1
+    return result
+
+
+def cflow_args(args):
+    """
+    TranslationUnit.args のうち cflow に渡すもの (clang にだけ渡すオプションを除く)。
+    """
+    return [arg for arg in args if arg.startswith(PASSTHROUGH_PREFIXES)]
+
+
+def load_compile_commands(path: str):
+    """
+    compile_commands.json から .c ファイルごとの TranslationUnit のリストを作る。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        commands = json.load(f)
+
+    units = []
+    for entry in commands:
+        directory = entry.get("directory", os.path.dirname(os.path.abspath(path)))
+        file = entry["file"]
+        if not file.endswith('.c'):
+            continue
+        if "arguments" in entry:
+            arguments = entry["arguments"]
+        else:
+            arguments = shlex.split(entry.get("command", ""))
+        args = cflow_args_from_command(arguments, PASSTHROUGH_PREFIXES + CLANG_PASSTHROUGH_PREFIXES)
+        units.append(TranslationUnit(directory, (file,), tuple(args)))
+    return units
+
+
+def load_file_list(path: str):
+    """
+    1 行に 1 つのソースファイルを書いたリストから TranslationUnit のリストを作る。
+    相対パスはリストのあるディレクトリからの相対とみなす。
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    units = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            file = line.strip()
+            if not file or file.startswith('#'):
+                continue
+            units.append(TranslationUnit(base, (file,), ()))
+    return units
+
+
+def load_units(path: str):
+    if path.endswith('.json'):
+        return load_compile_commands(path)
+    return load_file_list(path)
+
+
+def group_by_directory(units):
+    """
+    同じディレクトリにあり、引数 (-I / -D / -U など) も同じソースファイルを 1 回の cflow 実行にまとめる。
+    引数の違うファイルは、同じディレクトリでも別の実行にする。
+    """
+    groups = {}
+    for unit in units:
+        for file in unit.files:
+            path = os.path.normpath(os.path.join(unit.directory, file))
+            groups.setdefault((os.path.dirname(path), unit.args), []).append(os.path.basename(path))
+    return [TranslationUnit(directory, tuple(files), args)
+            for (directory, args), files in groups.items()]
+
+
+def run_cflow(unit: TranslationUnit, cflow: str = 'cflow', flags=DEFAULT_CFLOW_FLAGS):
+    """
+    unit に対して cflow を実行し、(標準出力のバイト列, 終了ステータス) を返す。
+    cflow が失敗しても、出力された分は返す (エラー内容は標準エラーに出す)。
+    cflow を実行できない場合も標準エラーに出し、(b'', None) を返す。
+    """
+    try:
+        proc = subprocess.run([cflow, *flags, *cflow_args(unit.args), *unit.files],
+                              cwd=unit.directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        print(f"cannot run {cflow} in {unit.directory}: {e.strerror}", file=sys.stderr)
+        return b'', None
+    if proc.returncode != 0:
+        message = proc.stderr.decode('utf-8', 'replace').strip().splitlines()
+        print(f"cflow failed ({proc.returncode}) in {unit.directory}: "
+              f"{' '.join(unit.files)}: {message[0] if message else ''}", file=sys.stderr)
+    return proc.stdout, proc.returncode
+
+
+def edges_from_cflow_output(output: bytes, remove_edge=None):
+    """
+    cflow の出力 (バイト列) をパースし、ソート済みでユニークな (親, 子) のリストを返す。
+    """
+    lines = output.splitlines(keepends=True)
+    parse_entry = make_cflow_bytes_parser(detect_cflow_dialect_lines(lines[:2000]))
+    entries = iter_cflow_entries_stream(lines, parse_entry=parse_entry)
+    return sorted(set(edges_from_entries(entries, remove_edge)))
+
+
+def run_clang(unit: TranslationUnit, clang: str = 'clang', flags=DEFAULT_CLANG_FLAGS):
+    """
+    unit の各ソースファイルを clang で LLVM IR にし、(出力を連結したバイト列, 全ファイル成功したか) を返す。
+    失敗したファイルはエラー内容を標準エラーに出して読み飛ばす。clang を実行できない場合も同じ。
+    """
+    outputs = []
+    ok = True
+    for file in unit.files:
+        try:
+            proc = subprocess.run([clang, *flags, *unit.args, file], cwd=unit.directory,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            print(f"cannot run {clang} in {unit.directory}: {e.strerror}", file=sys.stderr)
+            return b''.join(outputs), False
+        if proc.returncode != 0:
+            message = proc.stderr.decode('utf-8', 'replace').strip().splitlines()
+            print(f"clang failed ({proc.returncode}) in {unit.directory}: "
+                  f"{file}: {message[0] if message else ''}", file=sys.stderr)
+            ok = False
+            continue
+        outputs.append(proc.stdout)
+    return b''.join(outputs), ok
+
+
+def edges_from_llvm_ir(output: bytes, remove_edge=None):
+    """
+    LLVM IR (テキスト形式) から、ソート済みでユニークな (親, 子) のリストを返す。
+    llvm.* の組み込み関数 (memcpy や dbg など) は呼び出しとみなさない。
+    """
+    edges = set()
+    current = None
+    for line in output.splitlines():
+        m = LLVM_DEFINE_RE.match(line)
+        if m:
+            current = m.group(1).decode('utf-8')
+            continue
+        if line.startswith(b'}'):
+            current = None
+            continue
+        if current is None:
+            continue
+        m = LLVM_CALL_RE.search(line)
+        if m and not m.group(1).startswith(b'llvm.'):
+            edges.add((current, m.group(1).decode('utf-8')))
+    if remove_edge is not None:
+        edges = {edge for edge in edges if not remove_edge(*edge)}
+    return sorted(edges)
+
+
+def edges_from_sources(unit: TranslationUnit, remove_edge=None):
+    """
+    cflow を使わず、unit のソースファイルを c_call_extractor.py で読んで
+    (ソート済みでユニークな (親, 子) のリスト, 全ファイル読めたか) を返す。
+    #if は unit.args の -D / -U で評価する。読めないファイルは標準エラーに出して読み飛ばす。
+    """
+    edges = set()
+    ok = True
+    for file in unit.files:
+        try:
+            edges.update(extract_file_edges(os.path.join(unit.directory, file), unit.args))
+        except OSError as e:
+            print(f"cannot read {e.filename}: {e.strerror}", file=sys.stderr)
+            ok = False
+    if remove_edge is not None:
+        edges = {edge for edge in edges if not remove_edge(*edge)}
+    return sorted(edges), ok
+
+
+def _extract_unit(task):
+    """
+    プロセスプールのワーカー。1 つの TranslationUnit からエッジを取り出し、
+    (エッジのリスト, 成功したか) を返す。失敗したユニットのエッジは途中までの出力の分だけになる。
+    """
+    unit, frontend, tool, flags, remove_edge = task
+    if frontend == 'python':
+        return edges_from_sources(unit, remove_edge)
+    if frontend == 'clang':
+        output, ok = run_clang(unit, tool, flags)
+        return edges_from_llvm_ir(output, remove_edge), ok
+    output, returncode = run_cflow(unit, tool, flags)
+    return edges_from_cflow_output(output, remove_edge), returncode == 0
+
+
+def _extract_units(units, jobs: int, tool: str, flags, remove_edge, frontend: str):
+    # ユニットごとの (ソート済みエッジのリスト, 成功したか) のリスト
+    tasks = [(unit, frontend, tool, flags, remove_edge) for unit in units]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_extract_unit, tasks))
+
+
+def extract_edges_parallel(units, jobs: int, tool: str = 'cflow',
+                           flags=DEFAULT_CFLOW_FLAGS, remove_edge=None, frontend: str = 'cflow'):
+    """
+    units を jobs 個のプロセスで並列に処理し、ユニット単位のソート済みエッジのリストを返す。
+    tool / flags は frontend が実行するコマンドとそのオプション (clang なら clang のもの)。
+    """
+    return [edges for edges, _ in _extract_units(units, jobs, tool, flags, remove_edge,
+                                                 frontend)]
+
+
+# キャッシュファイルの形式
+#   ヘッダ: マジック, 関数名の数, エッジの数, 関数名部分のバイト数 (リトルエンディアン)
+#   本体:   関数名を '\n' で連結した UTF-8, (親, 子) の番号の uint32 配列
+CACHE_MAGIC = b'CFE1'
+CACHE_HEADER = struct.Struct('<4sIII')
+
+# キャッシュのキーに含める版。ツールの出力からエッジを作る処理 (edges_from_cflow_output() など)
+# が変わったら番号を上げ、古いエッジを使わないようにする
+CACHE_KEY_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cflow_driver')
+
+
+def unit_cache_key(unit: TranslationUnit, tool: str, flags) -> str:
+    """
+    unit の各ソースファイルの内容と、フロントエンドのコマンド名・オプション・引数、
+    CACHE_KEY_VERSION からキャッシュのキー (SHA-256 の 16 進文字列) を作る。
+    ソースファイルが読めなければ OSError。
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_KEY_VERSION, os.path.basename(tool), list(flags),
+                         list(unit.args)]).encode('utf-8'))
+    for file in unit.files:
+        h.update(b'\0' + os.path.basename(file).encode('utf-8') + b'\0')
+        with open(os.path.join(unit.directory, file), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def encode_edges(edges) -> bytes:
+    """
+    ソート済みのエッジのリストをキャッシュ用のバイト列にする。
+    関数名はユニット内で番号を振り、エッジは番号の組として詰める。
+    """
+    ids = {}
+    pairs = array('I')
+    for src, dst in edges:
+        pairs.append(ids.setdefault(src, len(ids)))
+        pairs.append(ids.setdefault(dst, len(ids)))
+    if sys.byteorder != 'little':
+        pairs.byteswap()
+    names = '\n'.join(ids).encode('utf-8')
+    return CACHE_HEADER.pack(CACHE_MAGIC, len(ids), len(pairs) // 2, len(names)) + names + pairs.tobytes()
+
+
+def decode_edges(data: bytes):
+    """
+    encode_edges() のバイト列をエッジのリスト (ソート済み) に戻す。形式が違えば None。
+    """
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, n_names, n_edges, names_len = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC:
+        return None
+    offset = CACHE_HEADER.size
+    names = data[offset:offset + names_len].decode('utf-8').split('\n') if n_names else []
+    pairs = array('I')
+    pairs.frombytes(data[offset + names_len:])
+    if sys.byteorder != 'little':
+        pairs.byteswap()
+    if len(names) != n_names or len(pairs) != n_edges * 2:
+        return None
+    return [(names[pairs[i]], names[pairs[i + 1]]) for i in range(0, len(pairs), 2)]
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], key + '.bin')
+
+
+def load_cached_edges(cache_dir: str, key: str):
+    try:
+        with open(_cache_path(cache_dir, key), 'rb') as f:
+            return decode_edges(f.read())
+    except OSError:
+        return None
+
+
+def store_cached_edges(cache_dir: str, key: str, edges):
+    """
+    エッジをキャッシュに書き込む。一時ファイルに書いてから置き換えるので、
+    並行して動く別の実行が書きかけのファイルを読むことはない。
+    """
+    path = _cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encode_edges(edges))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def extract_edges_cached(units, jobs: int, cache_dir: str, tool: str = 'cflow',
+                         flags=DEFAULT_CFLOW_FLAGS, remove_edge=None, frontend: str = 'cflow'):
+    """
+    extract_edges_parallel() のキャッシュつき版。キャッシュにあるユニットは読み込むだけにし、
+    ないユニットだけ tool をかけて結果をキャッシュに保存する。
+    tool が失敗したユニット (clang なら 1 ファイルでも失敗したもの) は途中までの出力のエッジを使うが、
+    次回もう一度実行するよう保存しない。
+    戻り値は (ユニット単位のソート済みエッジのリスト, ヒット数, ミス数)。
+    """
+    # フィルタの有無でエッジが変わるので、キーにも含める
+    key_flags = list(flags) + (['--filter-lower-case'] if remove_edge is not None else [])
+    if frontend == 'python':
+        # cflow のコマンドやオプションは使わないので、キーでも区別しない
+        key_tool, key_flags = EXTRACTOR_CACHE_NAME, key_flags[len(flags):]
+    else:
+        key_tool = tool
+    keys = []
+    for unit in units:
+        try:
+            keys.append(unit_cache_key(unit, key_tool, key_flags))
+        except OSError as e:
+            # 読めないソースは、ツールを実行できない場合と同じく報告して、キャッシュを使わずに実行する
+            print(f"cannot read {e.filename}: {e.strerror}", file=sys.stderr)
+            keys.append(None)
+
+    edge_lists = []
+    misses = []
+    for unit, key in zip(units, keys):
+        edges = None if key is None else load_cached_edges(cache_dir, key)
+        if edges is None:
+            misses.append((unit, key))
+        else:
+            edge_lists.append(edges)
+
+    fresh = _extract_units([unit for unit, _ in misses], jobs, tool, flags,
+                           remove_edge, frontend)
+    for (_, key), (edges, ok) in zip(misses, fresh):
+        # コマンドが失敗したユニットは途中までの出力なので、次回もう一度実行するよう保存しない
+        if ok and key is not None:
+            store_cached_edges(cache_dir, key, edges)
+        edge_lists.append(edges)
+
+    return edge_lists, len(units) - len(misses), len(misses)
+
+
+def build_arg_parser():
+    ap = argparse.ArgumentParser(
+        description="cflow をファイルごとに並列実行し、マージしたコールグラフを DOT で出力する")
+    ap.add_argument("sources",
+                    help="compile_commands.json、または 1 行に 1 ファイルのソース一覧")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                    help="同時に実行する cflow の数 (既定: CPU 数)")
+    ap.add_argument("--group", choices=('file', 'dir'), default='file',
+                    help="cflow 1 回あたりの単位。file: .c ファイルごと (既定)、dir: ディレクトリごと")
+    ap.add_argument("--frontend", choices=FRONTENDS, default='cflow',
+                    help="エッジの取り出し方。cflow: cflow を実行する (既定)、"
+                         "python: cflow を使わず c_call_extractor.py で読む、"
+                         "clang: clang で LLVM IR にして読む")
+    ap.add_argument("--cflow", default='cflow', help="cflow コマンドのパス")
+    ap.add_argument("--cflow-flags", default=' '.join(DEFAULT_CFLOW_FLAGS),
+                    help="cflow に渡すオプション (既定: '%(default)s')")
+    ap.add_argument("--clang", default='clang', help="clang コマンドのパス (--frontend clang)")
+    ap.add_argument("--clang-flags", default=' '.join(DEFAULT_CLANG_FLAGS),
+                    help="clang に渡すオプション (既定: '%(default)s')")
+    ap.add_argument("--filter-lower-case", action="store_true",
+                    help="cflow2dot.py --filter-lower-case と同じ規則でエッジを除く")
+    ap.add_argument("--cache-dir", default=default_cache_dir(),
+                    help="ユニットごとのエッジのキャッシュを置くディレクトリ (既定: %(default)s)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="キャッシュを読み書きせず、すべてのユニットに cflow をかける")
+    ap.add_argument("-o", "--output", metavar="PATH",
+                    help="DOT の出力先 (既定: 標準出力)。拡張子 .gz / .xz / .zst なら圧縮する")
+    ap.add_argument("--compress", choices=('gzip', 'xz', 'zstd'),
+                    help="DOT を指定の形式で圧縮して出力する")
+    return ap
+
+
+def main():
+    args = build_arg_parser().parse_args()
+
+    try:
+        units = load_units(args.sources)
+    except OSError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if args.group == 'dir':
+        units = group_by_directory(units)
+    if not units:
+        print("No C sources found in " + args.sources, file=sys.stderr)
+        sys.exit(1)
+
+    if args.frontend == 'clang':
+        tool, flags = args.clang, shlex.split(args.clang_flags)
+    else:
+        tool, flags = args.cflow, shlex.split(args.cflow_flags)
+    if args.frontend != 'python' and shutil.which(tool) is None:
+        print(f"{tool} not found (use --frontend python to run without it)", file=sys.stderr)
+        sys.exit(1)
+
+    remove_edge = should_remove_edge if args.filter_lower_case else None
+    if args.no_cache:
+        edge_lists = extract_edges_parallel(units, args.jobs, tool, flags, remove_edge,
+                                            args.frontend)
+    else:
+        edge_lists, hits, misses = extract_edges_cached(units, args.jobs, args.cache_dir,
+                                                        tool, flags, remove_edge,
+                                                        args.frontend)
+        print(f"cache: {hits} hit, {misses} miss", file=sys.stderr)
+
+    with open_dot_output(args.output, args.compress) as out:
+        write_dot(merge_sorted_edges(edge_lists), out)
+
+
+if __name__ == "__main__":
+    main()
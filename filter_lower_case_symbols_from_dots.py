@@ -1,32 +1,57 @@
 import sys
 import re
 
+from graph_snapshot import GraphSnapshot, is_snapshot
+
+def is_filtered_symbol(name):
+    # 小文字で始まる関数と Assert は除外対象 ("main" の扱いは should_remove_edge を参照)
+    return name[0].islower() or name == "Assert"
+
+def should_remove_edge(left, right):
+    # cflow2dot.py --filter-lower-case もこの規則でパース中にエッジを落とす
+    if left == "main" or right == "main":
+        return False
+    return is_filtered_symbol(left) or is_filtered_symbol(right)
+
 def should_remove_line(line):
     match = re.match(r'\s*"([^"]+)"\s*->\s*"([^"]+)"', line)
     if match:
         left, right = match.groups()
-        if left == "main" or right == "main":
+        return should_remove_edge(left, right)
+    # cflow2dot.py --locations が出力するノード属性の行 ("name" [file=..., line=...];)
+    match = re.match(r'\s*"([^"]+)"\s*\[', line)
+    if match:
+        name = match.group(1)
+        if name == "main":
             return False
-        return left[0].islower() or right[0].islower() or left == "Assert" or right == "Assert"
+        return is_filtered_symbol(name)
     return False
 
-def process_file(input_file):
+def read_lines(input_file):
+    # 行を 1 行ずつ yield する。cflow2dot.py --snapshot のスナップショットなら
+    # エッジを少しずつ復号して DOT の行に戻す (定義位置を記録したものだけノード属性の行も出す)
+    if is_snapshot(input_file):
+        from cflow2dot import iter_dot_lines  # cflow2dot がこのモジュールを import するので遅延 import
+        with GraphSnapshot(input_file) as snapshot:
+            edges = snapshot.iter_counted_edges() if snapshot.has_counts else snapshot.iter_edges()
+            node_attrs = snapshot.iter_node_attrs() if snapshot.has_node_attrs else None
+            for line in iter_dot_lines(edges, node_attrs, snapshot.has_counts):
+                yield line + '\n'
+        return
     with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    main_lines = []
-    other_lines = []
-    
-    for line in lines:
-        if '->' in line and ('"main"' in line):
-            main_lines.append(line)
-        elif not should_remove_line(line):
-            other_lines.append(line)
-    
-    sorted_lines = main_lines + other_lines
-    
-    for line in sorted_lines:
-        print(line, end='')
+        yield from f
+
+def is_main_edge_line(line):
+    return '->' in line and ('"main"' in line)
+
+def process_file(input_file):
+    # main を含むエッジを先に、残りを元の順に出力する。行を溜めないよう入力を 2 回読む
+    for line in read_lines(input_file):
+        if is_main_edge_line(line):
+            print(line, end='')
+    for line in read_lines(input_file):
+        if not is_main_edge_line(line) and not should_remove_line(line):
+            print(line, end='')
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
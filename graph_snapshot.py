@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""
+コールグラフのバイナリスナップショット。
+
+cflow2dot.py --snapshot で書き出し、split_dots_with_main_suffix_nodes.py /
+filter_lower_case_symbols_from_dots.py は DOT の代わりにこれを mmap で開ける。
+開くときはヘッダとセクション表を読むだけで、各配列は mmap 上のビューとして参照する。
+
+形式 (リトルエンディアン、各セクションは 8 バイト境界に置く):
+    ヘッダ:       マジック 'CGSN', 版数, フラグ (FLAG_*), 関数の数, エッジの数, ファイルの数
+    セクション表: SECTIONS の順に (オフセット, バイト数) の uint64 の組
+    names:        関数名の UTF-8 を連結したものと、その区切り位置 (uint32, 関数の数 + 1)
+    name_order:   関数名のバイト列の昇順に並べた関数 ID (名前からの二分探索用)
+    adjacency:    CSR 形式の隣接リスト。関数ごとの子 ID の昇順の列を、先頭は値そのもの、
+                  以降は直前との差分として LEB128 の可変長整数で符号化して連結したもの。
+                  adj_offsets は各関数の列の開始バイト位置 (uint64)、
+                  edge_start は各関数の最初のエッジの通し番号 (uint32)
+    counts:       エッジの通し番号順の呼び出し回数 (uint32。回数を持たなければ空)
+    files / file_ids / lines: NodeAttrTable と同じ定義位置 (不明なら -1。
+                  FLAG_NODE_ATTRS がなければ、定義位置を記録しなかったスナップショット)
+
+書き出しはソート済みのエッジ列をブロックごとに符号化して一時ファイルに溜めるので、
+ExternalEdgeSorter のマージ結果をそのまま書ける。読み出しも関数の範囲ごとに復号する。
+"""
+
+import mmap
+import shutil
+import struct
+import tempfile
+from array import array
+
+import numpy as np
+
+from callgraph_core import ID_BITS, SymbolTable, unpack_edges
+
+SNAPSHOT_MAGIC = b'CGSN'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SUFFIX = '.cgs'
+
+FLAG_COUNTS = 1       # counts セクションがある
+FLAG_NODE_ATTRS = 2   # 定義位置 (files / file_ids / lines) を記録した
+
+# 書き出し・読み出しで一度に符号化・復号するエッジの数の目安
+SNAPSHOT_BLOCK = 1 << 16
+
+SECTIONS = ('name_offsets', 'names', 'name_order', 'adj_offsets', 'edge_start', 'adjacency',
+            'counts', 'file_offsets', 'files', 'file_ids', 'lines')
+
+SNAPSHOT_HEADER = struct.Struct('<4sHHIQI')
+SECTION_TABLE = struct.Struct('<' + 'QQ' * len(SECTIONS))
+
+
+def encode_varints(values):
+    """
+    非負整数の配列を LEB128 (7 ビットずつ、続きがあれば最上位ビットを立てる) で符号化する。
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(nbytes.max()) if len(nbytes) else 0):
+        has = nbytes > k
+        byte = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (nbytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has] + k] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(data):
+    """
+    encode_varints() のバイト列を int64 の配列に戻す。
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int64)
+    last = data < 0x80
+    ends = np.flatnonzero(last)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # 各バイトが値の何バイト目か
+    value_index = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = (np.arange(len(data)) - starts[value_index]) * 7
+    parts = (data & 0x7f).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+def _string_table(strings):
+    """
+    文字列のリストを (区切り位置の uint32 配列, 連結した UTF-8) にする。
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def _fill_backward(first, total: int):
+    """
+    関数ごとの「最初のエッジの位置」(エッジのない関数は -1) に末尾 total を足し、
+    エッジのない関数には次の関数の位置を入れる (CSR の区切り位置にする)。
+    """
+    first = np.append(first, total)
+    first[first < 0] = total
+    return np.minimum.accumulate(first[::-1])[::-1]
+
+
+def _id_blocks(counted_ids, size: int = SNAPSHOT_BLOCK):
+    """
+    (int64 エッジ, 回数) の列を、size 本ずつの (エッジ配列, 回数配列) にまとめる。
+    """
+    edges = array('q')
+    counts = array('q')
+    for edge, count in counted_ids:
+        edges.append(edge)
+        counts.append(count)
+        if len(edges) >= size:
+            yield np.frombuffer(edges, dtype=np.int64), np.frombuffer(counts, dtype=np.int64)
+            edges = array('q')
+            counts = array('q')
+    if edges:
+        yield np.frombuffer(edges, dtype=np.int64), np.frombuffer(counts, dtype=np.int64)
+
+
+def write_snapshot(path: str, graph, node_attrs=None, counted: bool = False):
+    """
+    CallGraph (と NodeAttrTable) を path にスナップショットとして書き出す。
+    counted が真なら各エッジの呼び出し回数も保存する。
+    """
+    _write_snapshot_blocks(path, graph.symbols, [(graph.edges, graph.counts)], node_attrs,
+                           counted)
+
+
+def write_snapshot_stream(path: str, symbols, counted_ids, node_attrs=None,
+                          counted: bool = False, tmp_dir: str = None):
+    """
+    (int64 エッジ, 回数) を昇順に並べた列 (ExternalEdgeSorter.iter_counted_ids() など) を
+    path にスナップショットとして書き出す。エッジ全体をメモリに置かず、
+    SNAPSHOT_BLOCK 本ずつ符号化して tmp_dir の一時ファイルに溜める。
+    symbols は列を読み始める時点ですべての関数を含んでいること。
+    """
+    _write_snapshot_blocks(path, symbols, _id_blocks(counted_ids), node_attrs, counted, tmp_dir)
+
+
+def _write_snapshot_blocks(path: str, symbols, blocks, node_attrs, counted: bool,
+                           tmp_dir: str = None):
+    """
+    write_snapshot() / write_snapshot_stream() の本体。blocks は (エッジ配列, 回数配列) の列で、
+    つなげると (親ID << 32 | 子ID) の昇順になること。
+    """
+    num_nodes = len(symbols)
+    name_offsets, names = _string_table(symbols.names)
+    name_order = np.array(sorted(range(num_nodes), key=lambda i: symbols.names[i].encode('utf-8')),
+                          dtype=np.uint32)
+
+    # 関数ごとの最初のエッジの通し番号と、その値が始まるバイト位置 (エッジがなければ -1)
+    first_edge = np.full(num_nodes, -1, dtype=np.int64)
+    first_byte = np.full(num_nodes, -1, dtype=np.int64)
+    num_edges = 0
+    adj_bytes = 0
+    prev_src = prev_dst = -1
+
+    with tempfile.TemporaryFile(dir=tmp_dir) as adj_file, \
+            tempfile.TemporaryFile(dir=tmp_dir) as counts_file:
+        for edges, counts in blocks:
+            if len(edges) == 0:
+                continue
+            src_ids, dst_ids = unpack_edges(edges)
+            # 子 ID を親ごとの差分にする (親が変わる位置では値そのもの)
+            new_src = src_ids != np.concatenate(([prev_src], src_ids[:-1]))
+            gaps = np.where(new_src, dst_ids,
+                            dst_ids - np.concatenate(([prev_dst], dst_ids[:-1])))
+            data = encode_varints(gaps)
+            value_starts = np.concatenate(([0], np.flatnonzero(data < 0x80)[:-1] + 1))
+
+            first_edge[src_ids[new_src]] = num_edges + np.flatnonzero(new_src)
+            first_byte[src_ids[new_src]] = adj_bytes + value_starts[new_src]
+            adj_file.write(data.tobytes())
+            if counted:
+                counts_file.write(np.asarray(counts).astype(np.uint32).tobytes())
+            num_edges += len(edges)
+            adj_bytes += len(data)
+            prev_src, prev_dst = int(src_ids[-1]), int(dst_ids[-1])
+
+        edge_start = _fill_backward(first_edge, num_edges).astype(np.uint32)
+        adj_offsets = _fill_backward(first_byte, adj_bytes).astype(np.uint64)
+        _write_sections(path, symbols, node_attrs, counted, num_edges, {
+            'name_offsets': name_offsets.tobytes(), 'names': names,
+            'name_order': name_order.tobytes(), 'adj_offsets': adj_offsets.tobytes(),
+            'edge_start': edge_start.tobytes(), 'adjacency': adj_file,
+            'counts': counts_file,
+        })
+
+
+def _write_sections(path: str, symbols, node_attrs, counted: bool, num_edges: int, sections):
+    """
+    定義位置のセクションを足し、ヘッダ・セクション表と各セクションを path に書く。
+    sections の値はバイト列か、先頭から読み直せる一時ファイル。
+    """
+    num_nodes = len(symbols)
+    file_ids = np.full(num_nodes, -1, dtype=np.int32)
+    lines = np.full(num_nodes, -1, dtype=np.int32)
+    files = []
+    if node_attrs is not None:
+        file_index = {}
+        for name, file, line in node_attrs:
+            sym_id = symbols.get(name)
+            if sym_id is None:
+                continue
+            file_ids[sym_id] = file_index.setdefault(file, len(file_index))
+            lines[sym_id] = line
+        files = list(file_index)
+    file_offsets, file_blob = _string_table(files)
+    sections.update({
+        'file_offsets': file_offsets.tobytes(), 'files': file_blob,
+        'file_ids': file_ids.tobytes(), 'lines': lines.tobytes(),
+    })
+
+    sizes = {}
+    for name, data in sections.items():
+        if isinstance(data, bytes):
+            sizes[name] = len(data)
+        else:
+            sizes[name] = data.seek(0, 2)
+            data.seek(0)
+
+    flags = (FLAG_COUNTS if counted else 0) | (FLAG_NODE_ATTRS if node_attrs is not None else 0)
+    offset = SNAPSHOT_HEADER.size + SECTION_TABLE.size
+    table = []
+    for name in SECTIONS:
+        offset = (offset + 7) & ~7
+        table.extend((offset, sizes[name]))
+        offset += sizes[name]
+
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, num_nodes,
+                                     num_edges, len(files)))
+        f.write(SECTION_TABLE.pack(*table))
+        for name, start in zip(SECTIONS, table[::2]):
+            f.write(b'\0' * (start - f.tell()))
+            if isinstance(sections[name], bytes):
+                f.write(sections[name])
+            else:
+                shutil.copyfileobj(sections[name], f)
+
+
+def is_snapshot(path: str) -> bool:
+    """
+    path がスナップショット (先頭がマジック) かどうか。
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+class GraphSnapshot:
+    """
+    write_snapshot() で書いたファイルを mmap で開いたもの。
+    関数名や隣接リストは必要になった分だけ復号する。iter_edges() などもエッジ全体を
+    リストにせず、SNAPSHOT_BLOCK 本程度ずつ復号しながら yield する。
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, num_nodes, num_edges, num_files = \
+            SNAPSHOT_HEADER.unpack_from(self._mm)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path}: not a call graph snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path}: unsupported snapshot version {version}")
+        self.num_nodes = num_nodes
+        self.num_edges = num_edges
+        self.has_counts = bool(flags & FLAG_COUNTS)
+        self.has_node_attrs = bool(flags & FLAG_NODE_ATTRS)
+        table = SECTION_TABLE.unpack_from(self._mm, SNAPSHOT_HEADER.size)
+        self._sections = {name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+
+        self.name_offsets = self._array('name_offsets', np.uint32)
+        self.name_order = self._array('name_order', np.uint32)
+        self.adj_offsets = self._array('adj_offsets', np.uint64)
+        self.edge_start = self._array('edge_start', np.uint32)
+        self.counts = self._array('counts', np.uint32)
+        self.file_offsets = self._array('file_offsets', np.uint32)
+        self.file_ids = self._array('file_ids', np.int32)
+        self.lines = self._array('lines', np.int32)
+        self._names = self._bytes('names')
+        self._files = self._bytes('files')
+        self._adjacency = self._bytes('adjacency')
+
+    def _array(self, section: str, dtype):
+        offset, length = self._sections[section]
+        return np.frombuffer(self._mm, dtype=dtype, count=length // np.dtype(dtype).itemsize,
+                             offset=offset)
+
+    def _bytes(self, section: str):
+        return self._array(section, np.uint8)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        mmap を閉じる。呼び出し側がまだ配列のビュー (counts など) を持っていれば BufferError。
+        """
+        # 自分の持つビューを先に手放さないと mmap を閉じられない
+        for attr in ('name_offsets', 'name_order', 'adj_offsets', 'edge_start', 'counts',
+                     'file_offsets', 'file_ids', 'lines', '_names', '_files', '_adjacency'):
+            setattr(self, attr, None)
+        self._mm.close()
+
+    def __len__(self):
+        return self.num_edges
+
+    def name(self, sym_id: int) -> str:
+        start, end = int(self.name_offsets[sym_id]), int(self.name_offsets[sym_id + 1])
+        return bytes(self._names[start:end]).decode('utf-8')
+
+    def _name_bytes(self, sym_id: int) -> bytes:
+        start, end = int(self.name_offsets[sym_id]), int(self.name_offsets[sym_id + 1])
+        return bytes(self._names[start:end])
+
+    def id_of(self, name: str):
+        """
+        関数名の ID を name_order の二分探索で引く。なければ None。
+        """
+        key = name.encode('utf-8')
+        lo, hi = 0, self.num_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_bytes(int(self.name_order[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_nodes and self._name_bytes(int(self.name_order[lo])) == key:
+            return int(self.name_order[lo])
+        return None
+
+    def names(self):
+        """
+        全関数名を ID 順に復号したリスト。
+        """
+        blob = bytes(self._names)
+        offsets = self.name_offsets.tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.num_nodes)]
+
+    def symbols(self) -> SymbolTable:
+        """
+        全関数名を復号して SymbolTable にする (ID は同じ)。
+        """
+        table = SymbolTable()
+        table.names = self.names()
+        table.ids = {name: i for i, name in enumerate(table.names)}
+        return table
+
+    def successors(self, sym_id: int):
+        """
+        sym_id の子 ID のリスト (昇順)。
+        """
+        start, end = int(self.adj_offsets[sym_id]), int(self.adj_offsets[sym_id + 1])
+        return np.cumsum(decode_varints(self._adjacency[start:end])).tolist()
+
+    def _decode_nodes(self, first: int, last: int):
+        """
+        関数 first .. last - 1 から出るエッジの (親 ID の配列, 子 ID の配列) を復号する。
+        """
+        start, end = int(self.adj_offsets[first]), int(self.adj_offsets[last])
+        gaps = decode_varints(self._adjacency[start:end])
+        edge_start = self.edge_start[first:last + 1].astype(np.int64) - int(self.edge_start[first])
+        src_ids = np.repeat(np.arange(first, last, dtype=np.int64), np.diff(edge_start))
+        # 親ごとに差分の累積和を取り直す
+        total = np.cumsum(gaps)
+        starts = edge_start[:-1]
+        before = np.zeros(last - first, dtype=np.int64)
+        nonempty = starts > 0
+        before[nonempty] = total[starts[nonempty] - 1]
+        return src_ids, total - before[src_ids - first]
+
+    def iter_edge_blocks(self):
+        """
+        (最初のエッジの通し番号, 親 ID の配列, 子 ID の配列) を (親, 子) の昇順に、
+        SNAPSHOT_BLOCK 本程度ずつ yield する。
+        """
+        node = 0
+        while node < self.num_nodes:
+            first_edge = int(self.edge_start[node])
+            # node から、エッジの合計が SNAPSHOT_BLOCK 本を超えない範囲の関数をまとめて復号する
+            last = int(np.searchsorted(self.edge_start, first_edge + SNAPSHOT_BLOCK,
+                                       side='right')) - 1
+            last = min(max(last, node + 1), self.num_nodes)
+            src_ids, dst_ids = self._decode_nodes(node, last)
+            node = last
+            if len(src_ids):
+                yield first_edge, src_ids, dst_ids
+
+    def edge_ids(self):
+        """
+        全エッジの (親 ID の配列, 子 ID の配列) を (親, 子) の昇順で返す。
+        """
+        return self._decode_nodes(0, self.num_nodes)
+
+    def iter_edges(self):
+        """
+        (親関数, 子関数) を関数名で yield する。
+        """
+        names = self.names()
+        for _, src_ids, dst_ids in self.iter_edge_blocks():
+            for src_id, dst_id in zip(src_ids.tolist(), dst_ids.tolist()):
+                yield names[src_id], names[dst_id]
+
+    def iter_counted_edges(self):
+        """
+        (親関数, 子関数, 回数) を関数名で yield する。回数がなければ 1。
+        """
+        names = self.names()
+        for first_edge, src_ids, dst_ids in self.iter_edge_blocks():
+            if self.has_counts:
+                counts = self.counts[first_edge:first_edge + len(src_ids)].tolist()
+            else:
+                counts = [1] * len(src_ids)
+            for src_id, dst_id, count in zip(src_ids.tolist(), dst_ids.tolist(), counts):
+                yield names[src_id], names[dst_id], count
+
+    def iter_node_attrs(self):
+        """
+        定義位置が分かっている関数について (関数名, ファイル, 行番号) を yield する。
+        """
+        blob = bytes(self._files)
+        offsets = self.file_offsets.tolist()
+        files = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        for sym_id in np.flatnonzero(self.file_ids >= 0).tolist():
+            yield self.name(sym_id), files[self.file_ids[sym_id]], int(self.lines[sym_id])
+
+    def packed_edges(self):
+        """
+        CallGraph.edges と同じ (親ID << 32 | 子ID) の int64 配列。
+        """
+        src_ids, dst_ids = self.edge_ids()
+        return (src_ids << ID_BITS) | dst_ids
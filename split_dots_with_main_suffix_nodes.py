@@ -1,35 +1,101 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import hashlib
+import os
 import sys
 import re
-import networkx as nx
-from collections import deque
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
-def parse_dotfile(filename):
+import numpy as np
+
+from callgraph_core import CsrGraph, sorted_unique
+from graph_snapshot import GraphSnapshot, is_snapshot
+
+def parse_dotfile(filename, edge_attrs=None):
     """
     .dotファイルから "XXX" -> "YYY"; の形式のエッジを抽出し (src, dst) のタプルで返す。
+    "XXX" -> "YYY" [weight=3, ...]; のように属性付きのエッジも受け付け、
+    edge_attrs (dict) を渡すと (src, dst) -> 属性部分 (" [weight=3, ...]") を記録する。
     """
     edges = []
-    edge_pattern = re.compile(r'^\s*"([^"]+)"\s*->\s*"([^"]+)";')
+    edge_pattern = re.compile(r'^\s*"([^"]+)"\s*->\s*"([^"]+)"(\s*\[[^\]]*\])?\s*;')
 
     with open(filename, 'r', encoding='utf-8') as f:
         for line in f:
             m = edge_pattern.match(line)
             if m:
-                src, dst = m.groups()
+                src, dst, attrs = m.groups()
                 edges.append((src, dst))
+                if attrs and edge_attrs is not None:
+                    edge_attrs[(src, dst)] = attrs
     return edges
 
 
+def load_snapshot_graph(filename, edge_attrs=None):
+    """
+    cflow2dot.py --snapshot のスナップショットの CSR をそのまま CsrGraph にする
+    (エッジのリストは作らない。エッジの順はスナップショットの順)。
+    回数つきなら、回数が 2 以上のエッジだけ cflow2dot.py --counts と同じ属性を edge_attrs に入れる。
+    """
+    from cflow2dot import edge_attributes
+
+    with GraphSnapshot(filename) as snapshot:
+        names = snapshot.names()
+        offsets = snapshot.edge_start.astype(np.int64)
+        targets = np.empty(snapshot.num_edges, dtype=np.int32)
+        for first_edge, _, dst_ids in snapshot.iter_edge_blocks():
+            targets[first_edge:first_edge + len(dst_ids)] = dst_ids
+        counted = np.flatnonzero(snapshot.counts > 1) if snapshot.has_counts else []
+        if edge_attrs is not None and len(counted):
+            src_ids = np.searchsorted(offsets, counted, side='right') - 1
+            counts = snapshot.counts[counted].tolist()
+            for src_id, dst_id, count in zip(src_ids.tolist(), targets[counted].tolist(), counts):
+                edge_attrs[(names[src_id], names[dst_id])] = edge_attributes(count)
+            del counts
+        del counted
+    return CsrGraph(names, offsets, targets)
+
+
+def parse_config_names(filename):
+    """
+    cflow2dot.py で複数のビルド設定をまとめた DOT から、設定名のリスト (ビット番号順) を返す。
+    "graph [configs="a,b"];" の行がなければ空リスト。
+    """
+    config_pattern = re.compile(r'^\s*graph\s*\[configs="([^"]*)"\]')
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            m = config_pattern.match(line)
+            if m:
+                return m.group(1).split(',')
+            if '->' in line:
+                break
+    return []
+
+
+def select_config_edges(edges, edge_attrs, mask):
+    """
+    エッジ属性 configs=N (設定のビットマスク) が mask と重なるエッジだけを返す。
+    """
+    mask_pattern = re.compile(r'\bconfigs=(\d+)')
+    selected = []
+    for edge in edges:
+        m = mask_pattern.search(edge_attrs.get(edge, ""))
+        if m and int(m.group(1)) & mask:
+            selected.append(edge)
+    return selected
+
+
 def build_digraph(edges):
     """
-    与えられたエッジリストから NetworkX DiGraph を構築して返す
+    与えられたエッジリストから CSR 形式のグラフ (CsrGraph) を構築して返す
+    ノードの並びはエッジに最初に現れた順 (NetworkX DiGraph と同じ)
     """
-    G = nx.DiGraph()
-    for src, dst in edges:
-        G.add_edge(src, dst)
-    return G
+    return CsrGraph.from_edges(edges)
 
 
 def is_ignored_node(node: str) -> bool:
@@ -44,74 +110,314 @@ def is_ignored_node(node: str) -> bool:
     return len(node) > 0 and node[0].islower()
 
 
+def is_main_suffix_node(node: str) -> bool:
+    # 他のルートで止めるための判定 (ルート自身は呼び出し側で除く)
+    return node.endswith("Main")
+
+
 def find_root_candidates(graph):
     """
     グラフ中のノードから「main」または末尾が「Main」のものをルート候補として返す。
     ただし、is_ignored_node(node) == True のノードは候補から除外。
     """
     roots = []
-    for node in graph.nodes():
+    for node in graph.names:
         if not is_ignored_node(node):  # 小文字開始かつ "main" でないものは無視
             if node == 'main' or node.endswith('Main'):
                 roots.append(node)
     return roots
 
 
-def collect_subgraph_nodes_up_to_3_hops(graph, root):
+def collect_subgraph_nodes_up_to_3_hops(graph, root, hops=3):
     """
-    root から最大3ホップ以内で到達可能なノードを BFS で探索。
+    root から最大 hops ホップ (既定 3) 以内で到達可能なノードを BFS で探索。
     - ルート以外の末尾 "Main" ノードに到達した場合は、そのノード自身は含むが
       そこから先は探索を進めない。
     - mainノードを除き、小文字で始まるノードは無視する（visited にも入れない）。
     """
-    visited = set()
-    queue = deque()
-
     # ルートは無視対象ではないはずだが、一応チェックしてから入れる
-    if not is_ignored_node(root):
-        queue.append((root, 0))
-        visited.add(root)
+    if is_ignored_node(root):
+        return set()
 
-    while queue:
-        current_node, depth = queue.popleft()
+    visited = root_subgraph_mask(graph, graph.node_id(root), hops)
+    names = graph.names
+    return {names[i] for i in np.flatnonzero(visited).tolist()}
 
-        # 末尾が "Main" で、かつルートでない場合は先を辿らない
-        if current_node != root and current_node.endswith("Main"):
-            continue
 
-        # 3ホップ以内なら子ノードを探索
-        if depth < 3:
-            for nxt in graph.successors(current_node):
-                # 小文字開始ノード (かつ "main" でない) は無視
-                if is_ignored_node(nxt):
-                    continue
+def root_subgraph_mask(graph, root_id, hops=3):
+    """
+    collect_subgraph_nodes_up_to_3_hops() の本体。ノード ID で受け取り、bool 配列で返す。
+    """
+    ignored = graph.node_mask(is_ignored_node)
+    stops = graph.node_mask(is_main_suffix_node)
+
+    visited = np.zeros(graph.num_nodes, dtype=bool)
+    visited[root_id] = True
+    frontier = np.array([root_id], dtype=np.int64)
+
+    # 深さごとに、前の深さで見つけたノード (frontier) の子をまとめて展開する
+    for depth in range(hops):
+        # 末尾が "Main" で、かつルートでないノードは先を辿らない
+        expand = frontier[~stops[frontier] | (frontier == root_id)]
+        nxt = graph.expand(expand)
+        # 小文字開始ノード (かつ "main" でない) と訪問済みのノードは無視
+        nxt = sorted_unique(nxt[~ignored[nxt] & ~visited[nxt]])
+        if len(nxt) == 0:
+            break
+        visited[nxt] = True
+        frontier = nxt
+
+    return visited
 
-                if nxt not in visited:
-                    visited.add(nxt)
-                    queue.append((nxt, depth + 1))
 
+def collect_all_subgraph_nodes(graph, roots, hops=3, levels=None):
+    """
+    すべての root について collect_subgraph_nodes_up_to_3_hops() と同じノード集合を、
+    グラフを 1 回だけ深さ順にたどって求める。
+    各ルートに 1 ビットを割り当て、ノードごとの「そのノードに到達したルート」の
+    ビット集合 (uint64 の列) を深さごとに子へ伝える。
+    戻り値は (ノード ID × ルートのビット集合) の配列で、ルート i のノードは
+    subgraph_mask(visited, i) で取り出せる。
+    levels (list) を渡すと、距離 d で初めて到達した (ノード ID, ルートのビット集合) を
+    levels[d] に入れる (d = 0 はルート自身)。
+    """
+    n_words = (len(roots) + 63) // 64
+    ignored = graph.node_mask(is_ignored_node)
+    stops = graph.node_mask(is_main_suffix_node)
+
+    visited = np.zeros((graph.num_nodes, n_words), dtype=np.uint64)
+    # 末尾 "Main" のノードからは、そのノード自身がルートのビットだけを先へ伝える
+    own_bits = np.zeros((graph.num_nodes, n_words), dtype=np.uint64)
+    for i, root in enumerate(roots):
+        root_id = graph.node_id(root)
+        # ルートは無視対象ではないはずだが、一応チェックしてから入れる
+        if root_id is None or ignored[root_id]:
+            continue
+        bit = np.uint64(1 << (i % 64))
+        visited[root_id, i // 64] |= bit
+        own_bits[root_id, i // 64] |= bit
+    if levels is not None:
+        seeds = np.flatnonzero(visited.any(axis=1))
+        levels.append((seeds, visited[seeds]))
+
+    frontier = visited.copy()
+    for depth in range(hops):
+        carry = frontier
+        carry[stops] &= own_bits[stops]
+        sources = np.flatnonzero(carry.any(axis=1))
+        index = graph.out_edge_index(sources)
+        if len(index) == 0:
+            break
+        counts = graph.offsets[sources + 1] - graph.offsets[sources]
+        bits = carry[np.repeat(sources, counts)]
+        targets = graph.targets[index]
+
+        # 同じ子に届いたビット集合を OR でまとめる
+        order = np.argsort(targets, kind='stable')
+        targets = targets[order]
+        starts = np.flatnonzero(np.concatenate(([True], targets[1:] != targets[:-1])))
+        reached = np.bitwise_or.reduceat(bits[order], starts, axis=0)
+        reached_ids = targets[starts]
+
+        # 小文字開始ノード (かつ "main" でない) と、そのルートで訪問済みのノードは無視
+        keep = ~ignored[reached_ids]
+        reached_ids = reached_ids[keep]
+        new_bits = reached[keep] & ~visited[reached_ids]
+        frontier = np.zeros_like(visited)
+        frontier[reached_ids] = new_bits
+        visited[reached_ids] |= new_bits
+        if levels is not None:
+            levels.append((reached_ids, new_bits))
+        if not new_bits.any():
+            break
     return visited
 
 
-def filter_sub_edges(edges, sub_nodes, root):
+def subgraph_mask(visited, i):
+    """
+    collect_all_subgraph_nodes() の結果から、i 番目のルートのノードの bool 配列を取り出す。
+    """
+    return (visited[:, i // 64] >> np.uint64(i % 64)) & np.uint64(1) != 0
+
+
+class DistanceIndex:
+    """
+    ルートごとの BFS の距離の索引 (max_depth まで)。
+    ルート i から距離 d のノード ID は、k = i * (max_depth + 1) + d として
+    nodes[offsets[k]:offsets[k + 1]] (昇順)。距離 depth 以内のノードはルートごとに
+    連続した範囲になるので、深さを変えて切り出すのは範囲の終わりを決めるだけで済む。
+    """
+
+    def __init__(self, max_depth, offsets, nodes):
+        self.max_depth = max_depth
+        self.offsets = offsets
+        self.nodes = nodes
+
+    @classmethod
+    def build(cls, graph, roots, max_depth):
+        """
+        collect_all_subgraph_nodes() の 1 回の走査で、すべての root の索引を作る。
+        """
+        levels = []
+        collect_all_subgraph_nodes(graph, roots, hops=max_depth, levels=levels)
+
+        root_parts, depth_parts, node_parts = [], [], []
+        for depth, (ids, bits) in enumerate(levels):
+            # ビット集合を (ノード, ルート) の組に開く
+            flags = np.unpackbits(bits.astype('<u8').view(np.uint8), axis=1, bitorder='little')
+            rows, cols = np.nonzero(flags[:, :len(roots)])
+            root_parts.append(cols)
+            depth_parts.append(np.full(len(cols), depth, dtype=np.int64))
+            node_parts.append(ids[rows])
+        root_ids = np.concatenate(root_parts)
+        depths = np.concatenate(depth_parts)
+        nodes = np.concatenate(node_parts)
+
+        order = np.lexsort((nodes, depths, root_ids))
+        counts = np.bincount(root_ids * (max_depth + 1) + depths,
+                             minlength=len(roots) * (max_depth + 1))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(max_depth, offsets, nodes[order].astype(np.int32))
+
+    def node_ids(self, i, depth):
+        """
+        i 番目のルートから距離 depth 以内のノード ID。
+        """
+        if depth > self.max_depth:
+            raise ValueError(f"depth {depth} exceeds the index depth {self.max_depth}")
+        k = i * (self.max_depth + 1)
+        return self.nodes[self.offsets[k]:self.offsets[k + depth + 1]]
+
+    def mask(self, i, depth, num_nodes):
+        """
+        node_ids() を induced_sub_edges() に渡す bool 配列にする。
+        """
+        inside = np.zeros(num_nodes, dtype=bool)
+        inside[self.node_ids(i, depth)] = True
+        return inside
+
+
+def distance_index_key(graph, roots) -> str:
+    """
+    グラフ (ノード名と CSR の配列) とルートの並びからキャッシュのキー (SHA-256 の 16 進文字列) を作る。
+    """
+    h = hashlib.sha256()
+    h.update('\n'.join(graph.names).encode('utf-8') + b'\0')
+    h.update('\n'.join(roots).encode('utf-8') + b'\0')
+    h.update(np.ascontiguousarray(graph.offsets, dtype='<i8').tobytes())
+    h.update(np.ascontiguousarray(graph.targets, dtype='<i8').tobytes())
+    return h.hexdigest()
+
+
+def load_distance_index(path, key, max_depth):
+    """
+    path に保存した索引を読む。ファイルがない・キーが違う・深さが足りなければ None。
+    """
+    try:
+        with np.load(path) as data:
+            if str(data["key"]) != key or int(data["max_depth"]) < max_depth:
+                return None
+            return DistanceIndex(int(data["max_depth"]), data["offsets"], data["nodes"])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        # 途中で切れた・壊れた .npz も、古いキャッシュと同じく作り直す
+        return None
+
+
+def store_distance_index(path, key, index):
+    """
+    索引を path に保存する。一時ファイルに書いてから置き換える。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, key=np.array(key), max_depth=np.array(index.max_depth),
+                     offsets=index.offsets, nodes=index.nodes)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def get_distance_index(graph, roots, max_depth, cache_path=None):
+    """
+    cache_path に使える索引があれば読み、なければ作って (cache_path があれば) 保存する。
+    キャッシュは省けるものなので、保存できなくても警告だけ出して作った索引を返す。
+    """
+    if cache_path is None:
+        return DistanceIndex.build(graph, roots, max_depth)
+    key = distance_index_key(graph, roots)
+    index = load_distance_index(cache_path, key, max_depth)
+    if index is None:
+        index = DistanceIndex.build(graph, roots, max_depth)
+        try:
+            store_distance_index(cache_path, key, index)
+        except OSError as e:
+            print(f"Warning: distance index not saved: {e}", file=sys.stderr)
+    return index
+
+
+def filter_sub_edges(edges, sub_nodes, root, graph=None):
     """
     sub_nodes に含まれるノード間のエッジのみ抽出。
     さらに「root以外の末尾 'Main' ノード s から出るエッジ」は除外。
+    graph (build_digraph(edges) の CsrGraph) の親ごとの索引で sub_nodes から出るエッジだけを見るので、
+    コストはグラフ全体ではなく部分グラフの大きさに比例する。graph を省くと edges から作る。
+    エッジは edges での順に (重複は 1 本にして) 並べて返す。graph を渡せば edges は使わないので None でもよい。
     """
-    sub_edges = []
-    for (s, t) in edges:
-        if s in sub_nodes and t in sub_nodes:
-            # ルート以外で末尾 "Main" のノード s からのエッジは含めない
-            if s != root and s.endswith("Main"):
-                continue
-            sub_edges.append((s, t))
-    return sub_edges
+    if graph is None:
+        graph = build_digraph(edges)
+    node_ids = np.array([graph.node_id(node) for node in sub_nodes], dtype=np.int64)
+    inside = np.zeros(graph.num_nodes, dtype=bool)
+    inside[node_ids] = True
+    return induced_sub_edges(inside, root, graph)
 
 
-def write_subgraph_dot(output_filename, root, subgraph_edges):
+def induced_sub_edges(inside, root, graph):
+    """
+    filter_sub_edges() の本体。部分グラフのノードを bool 配列 inside で受け取り、
+    エッジを graph の CSR から関数名の組にして返す。
+    """
+    index = induced_edge_index(graph, inside, graph.node_id(root))
+    names = graph.names
+    return [(names[src], names[dst])
+            for src, dst in zip(graph.edge_sources(index).tolist(), graph.targets[index].tolist())]
+
+
+def induced_edge_index(graph, inside, root_id):
+    """
+    部分グラフ inside に含まれるエッジの targets 上の位置を、元の入力での順に並べて返す。
+    """
+    # ルート以外で末尾 "Main" のノード s からのエッジは含めない
+    stops = graph.node_mask(is_main_suffix_node)
+    node_ids = np.flatnonzero(inside)
+    sources = node_ids[~stops[node_ids] | (node_ids == root_id)]
+
+    index = graph.out_edge_index(sources)
+    index = index[inside[graph.targets[index]]]
+    if graph.positions is None:
+        return np.sort(index)
+    return index[np.argsort(graph.positions[index], kind='stable')]
+
+
+def subgraph_filename(root, depth, depths):
+    """
+    出力ファイル名。深さを 1 つだけ指定したときは <root>.dot、複数なら <root>.depth<N>.dot。
+    """
+    if len(depths) == 1:
+        return f"{root}.dot"
+    return f"{root}.depth{depth}.dot"
+
+
+def write_subgraph_dot(output_filename, root, subgraph_edges, edge_attrs=None):
     """
     要件にある固定フォーマットで .dot ファイルを書き出す。
+    edge_attrs があれば、元の DOT のエッジ属性 (weight など) をそのまま付ける。
     """
+    if edge_attrs is None:
+        edge_attrs = {}
+
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write("digraph cflow {\n")
         f.write("    rankdir=TB;\n")
@@ -121,23 +427,230 @@ def write_subgraph_dot(output_filename, root, subgraph_edges):
         f.write(f"    root=\"{root}\";\n\n")
 
         for (src, dst) in subgraph_edges:
-            f.write(f"    \"{src}\" -> \"{dst}\";\n")
+            attrs = edge_attrs.get((src, dst), "")
+            f.write(f"    \"{src}\" -> \"{dst}\"{attrs};\n")
 
         f.write("}\n")
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python split_graph.py <input.dot>")
-        sys.exit(1)
+class _StringTable:
+    """
+    UTF-8 を連結したバイト列と区切り位置の配列を、文字列のリストのように引く。
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
 
-    input_filename = sys.argv[1]
+    def __len__(self):
+        return len(self.offsets) - 1
 
-    # 1. DOTファイルからエッジを抽出
-    edges = parse_dotfile(input_filename)
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
 
-    # 2. DiGraphを構築
-    G = build_digraph(edges)
+
+def _string_arrays(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def share_arrays(arrays):
+    """
+    配列の dict を 1 つの SharedMemory に詰めて、(SharedMemory, 配置表) を返す。
+    配置表は 名前 -> (オフセット, dtype, 形) で、attach_arrays() に渡す。
+    """
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        size = (size + 7) & ~7
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += array.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    except BaseException:
+        # 詰める途中で失敗しても /dev/shm に残さない
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, layout
+
+
+def attach_arrays(shm_name, layout):
+    """
+    share_arrays() で作った SharedMemory に接続し、(SharedMemory, 配列の dict) を返す。
+    配列はコピーせず、共有メモリ上のビューとして参照する。
+    """
+    # 子プロセスは親の resource_tracker を引き継ぐので、後始末 (unlink) は親の 1 回で済む
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+              for name, (offset, dtype, shape) in layout.items()}
+    return shm, arrays
+
+
+# --jobs の子プロセス側の状態 (_init_worker で共有メモリに接続して作る)
+_worker = {}
+
+
+def _init_worker(shm_name, layout, max_depth):
+    shm, arrays = attach_arrays(shm_name, layout)
+    names = _StringTable(arrays["name_offsets"], arrays["names"])
+    graph = CsrGraph(names, arrays["offsets"], arrays["targets"], arrays.get("positions"))
+    graph.set_node_mask(is_ignored_node, arrays["ignored"])
+    graph.set_node_mask(is_main_suffix_node, arrays["stops"])
+    if "index_nodes" in arrays:
+        _worker["index"] = DistanceIndex(max_depth, arrays["index_offsets"], arrays["index_nodes"])
+    _worker.update(shm=shm, arrays=arrays, graph=graph, names=names,
+                   attrs=_StringTable(arrays["attr_offsets"], arrays["attrs"]))
+
+
+def _write_root_subgraph(task):
+    """
+    子プロセスで 1 つのルートの部分グラフを求め、<root>.dot を書き出す。
+    """
+    i, root, root_id, depth, output_filename = task
+    graph = _worker["graph"]
+    names = _worker["names"]
+    attrs = _worker["attrs"]
+
+    if "index" in _worker:
+        inside = _worker["index"].mask(i, depth, graph.num_nodes)
+    else:
+        inside = root_subgraph_mask(graph, root_id, depth)
+
+    sub_edges = []
+    edge_attrs = {}
+    index = induced_edge_index(graph, inside, root_id)
+    for p, src, dst in zip(index.tolist(), graph.edge_sources(index).tolist(),
+                           graph.targets[index].tolist()):
+        edge = (names[src], names[dst])
+        sub_edges.append(edge)
+        attr = attrs[p]
+        if attr:
+            edge_attrs[edge] = attr
+
+    write_subgraph_dot(output_filename, root, sub_edges, edge_attrs)
+    return output_filename
+
+
+def csr_edge_attrs(graph, edge_attrs):
+    """
+    (親, 子) -> 属性 の dict を、graph の targets の位置ごとの属性のリスト (なければ "") にする。
+    """
+    attrs = [""] * graph.num_edges
+    for (src, dst), attr in edge_attrs.items():
+        src_id, dst_id = graph.node_id(src), graph.node_id(dst)
+        if src_id is None or dst_id is None:
+            continue
+        hits = np.flatnonzero(graph.successors(src_id) == dst_id)
+        if len(hits):
+            attrs[int(graph.offsets[src_id]) + int(hits[0])] = attr
+    return attrs
+
+
+def write_subgraphs_parallel(graph, edge_attrs, roots, jobs, depths, index=None):
+    """
+    グラフの配列を共有メモリに 1 回だけ置き、jobs 個のプロセスで各深さ・各ルートの部分グラフを書き出す。
+    index (DistanceIndex) を渡すと、子プロセスは BFS をせずにその索引から切り出す。
+    書き出したファイル名を、書き終わったものから順に返すジェネレータ。
+    """
+    name_offsets, names = _string_arrays(graph.names)
+    attr_offsets, attrs = _string_arrays(csr_edge_attrs(graph, edge_attrs))
+
+    arrays = {
+        "offsets": graph.offsets, "targets": graph.targets,
+        "ignored": graph.node_mask(is_ignored_node), "stops": graph.node_mask(is_main_suffix_node),
+        "name_offsets": name_offsets, "names": names, "attr_offsets": attr_offsets, "attrs": attrs,
+    }
+    if graph.positions is not None:
+        arrays["positions"] = graph.positions
+    if index is not None:
+        arrays["index_offsets"] = index.offsets
+        arrays["index_nodes"] = index.nodes
+
+    shm, layout = share_arrays(arrays)
+    try:
+        tasks = [(i, root, graph.node_id(root), depth, subgraph_filename(root, depth, depths))
+                 for depth in depths for i, root in enumerate(roots)]
+        max_depth = index.max_depth if index is not None else None
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(shm.name, layout, max_depth)) as pool:
+            futures = [pool.submit(_write_root_subgraph, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="DOT から main / *Main ごとに指定したホップ数 (既定 3) までの部分グラフを切り出す")
+    ap.add_argument("input_dot", help="cflow2dot.py の出力 DOT (または --snapshot のスナップショット)")
+    ap.add_argument("--bfs", choices=('sweep', 'root'), default='sweep',
+                    help="sweep: 全ルートの部分グラフを 1 回の走査でまとめて求める (既定)、"
+                         "root: ルートごとに BFS する")
+    ap.add_argument("--depth", default="3",
+                    help="辿るホップ数。カンマ区切りで複数指定すると <root>.depth<N>.dot を深さごとに書き出す"
+                         " (既定: %(default)s)")
+    ap.add_argument("--max-depth", type=int, default=None,
+                    help="sweep で作る距離の索引の深さ (既定: --depth の最大値)。"
+                         "--distance-index と合わせて深めに作っておくと、後で別の深さを試すときに再利用できる")
+    ap.add_argument("--distance-index", metavar="PATH",
+                    help="sweep で作った距離の索引を PATH に保存し、同じグラフなら次回から読み込んで使う")
+    ap.add_argument("-j", "--jobs", type=int, default=1,
+                    help="N プロセスで並列に部分グラフを求めて書き出す。グラフは共有メモリに 1 回だけ置く")
+    ap.add_argument("--config", metavar="NAMES",
+                    help="複数の設定をまとめた DOT で、カンマ区切りの設定のどれかに含まれるエッジだけを使う")
+    args = ap.parse_args()
+
+    input_filename = args.input_dot
+    try:
+        # 同じ深さを繰り返しても、同じファイルを二度書かない
+        depths = list(dict.fromkeys(int(d) for d in args.depth.split(',')))
+    except ValueError:
+        depths = []
+    if not depths or min(depths) < 0:
+        print(f"Invalid --depth: {args.depth}")
+        sys.exit(1)
+    max_depth = max(depths) if args.max_depth is None else args.max_depth
+    if max_depth < max(depths):
+        print(f"--max-depth {max_depth} is smaller than --depth {max(depths)}")
+        sys.exit(1)
+    if args.distance_index and args.bfs != 'sweep':
+        print("--distance-index needs --bfs sweep")
+        sys.exit(1)
+
+    # 1. DOTファイルからエッジを抽出 (cflow2dot.py --counts の weight 属性なども保持)
+    #    スナップショットなら CSR をそのまま読むので、エッジのリストは作らない
+    edge_attrs = {}
+    edges = None
+    if is_snapshot(input_filename):
+        if args.config:
+            print("--config needs a DOT merged from several configs, not a snapshot")
+            sys.exit(1)
+        G = load_snapshot_graph(input_filename, edge_attrs)
+    else:
+        edges = parse_dotfile(input_filename, edge_attrs)
+
+        # 設定を指定されたら、その設定のエッジだけに絞る
+        if args.config:
+            configs = parse_config_names(input_filename)
+            mask = 0
+            for name in args.config.split(','):
+                if name not in configs:
+                    print(f"Unknown config: {name} (available: {', '.join(configs)})")
+                    sys.exit(1)
+                mask |= 1 << configs.index(name)
+            edges = select_config_edges(edges, edge_attrs, mask)
+
+        # 2. DiGraphを構築 (以降のエッジは CSR から取り出すので、元のリストは手放す)
+        G = build_digraph(edges)
+        edges = None
 
     # 3. ルート候補 (main or 末尾が Main のノード) の取得
     root_candidates = find_root_candidates(G)
@@ -145,19 +658,32 @@ def main():
         print("No root candidates found ('main' or '*Main'). Nothing to do.")
         return
 
-    # 4. 各ルートごとに最大3ホップまで辿った部分グラフを抽出・出力
-    for root in root_candidates:
-        # BFSでノード集合を取得
-        sub_nodes = collect_subgraph_nodes_up_to_3_hops(G, root)
-        # 無視対象ノード(小文字始まり)はここでも含まないが、理論上もう既に入っていないはず
-
-        # エッジをフィルタ
-        sub_edges = filter_sub_edges(edges, sub_nodes, root)
-
-        # 書き出し
-        output_filename = f"{root}.dot"
-        write_subgraph_dot(output_filename, root, sub_edges)
-        print(f"Generated: {output_filename}")
+    # 4. 各ルートごとに指定したホップ数まで辿った部分グラフを抽出・出力
+    # sweep ではルートごとの距離の索引を 1 回だけ作り、各深さはそこから切り出す
+    index = None
+    if args.bfs == 'sweep':
+        index = get_distance_index(G, root_candidates, max_depth, args.distance_index)
+    if args.jobs > 1:
+        for output_filename in write_subgraphs_parallel(G, edge_attrs, root_candidates,
+                                                        args.jobs, depths, index):
+            print(f"Generated: {output_filename}")
+        return
+    for depth in depths:
+        for i, root in enumerate(root_candidates):
+            if index is not None:
+                sub_edges = induced_sub_edges(index.mask(i, depth, G.num_nodes), root, G)
+            else:
+                # BFSでノード集合を取得
+                sub_nodes = collect_subgraph_nodes_up_to_3_hops(G, root, depth)
+                # 無視対象ノード(小文字始まり)はここでも含まないが、理論上もう既に入っていないはず
+
+                # エッジをフィルタ
+                sub_edges = filter_sub_edges(edges, sub_nodes, root, G)
+
+            # 書き出し
+            output_filename = subgraph_filename(root, depth, depths)
+            write_subgraph_dot(output_filename, root, sub_edges, edge_attrs)
+            print(f"Generated: {output_filename}")
 
 
 if __name__ == "__main__":
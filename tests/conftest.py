@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+テスト共通のフィクスチャと補助関数。
+
+リポジトリのスクリプトはパッケージではないので、ルートを sys.path に入れて import する。
+baseline_* は最初の版のスクリプトの処理の写しで、新しい経路の結果と突き合わせる基準に使う。
+"""
+
+import os
+import re
+import subprocess
+import sys
+from collections import deque
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'tests', 'data')
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.synth_cflow import generate_cflow  # noqa: E402
+
+DOT_EDGE_RE = re.compile(r'^\s*"([^"]+)"\s*->\s*"([^"]+)"')
+
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+
+def run_script(script: str, *args, cwd=None, check: bool = True, stdin: bytes = None, env=None):
+    """
+    リポジトリのスクリプトを別プロセスで実行し、CompletedProcess (stdout / stderr はバイト列) を返す。
+    """
+    return subprocess.run([sys.executable, os.path.join(ROOT, script), *map(str, args)],
+                          cwd=cwd, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          check=check, env=env)
+
+
+def dot_edges(text: str):
+    """
+    DOT のテキストから (親, 子) のリストを出現順に取り出す。
+    """
+    edges = []
+    for line in text.splitlines():
+        m = DOT_EDGE_RE.match(line)
+        if m:
+            edges.append(m.groups())
+    return edges
+
+
+def baseline_parse_cflow_line(line: str):
+    """
+    最初の版の cflow2dot.parse_cflow_line()。
+    """
+    line = line.rstrip()
+    if not line:
+        return None, None
+    match_line_num = re.match(r'^\s*(\d+)(.*)$', line)
+    if not match_line_num:
+        return None, None
+    rest = match_line_num.group(2)
+    match_spaces = re.match(r'^(\s+)(.*)$', rest)
+    if match_spaces:
+        leading_spaces = match_spaces.group(1)
+        after_spaces = match_spaces.group(2)
+    else:
+        leading_spaces = ""
+        after_spaces = rest
+    indent_level = len(leading_spaces) // 4
+    if ':' in after_spaces:
+        func_name = after_spaces.partition(':')[0].strip()
+    else:
+        func_name = after_spaces.strip()
+    if not func_name:
+        return None, None
+    return indent_level, func_name
+
+
+def baseline_cflow_edges(file_path: str):
+    """
+    最初の版の cflow2dot.cflow_to_dot() が出力するエッジの集合。
+    """
+    edges = set()
+    stack = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            indent_level, func_name = baseline_parse_cflow_line(line)
+            if func_name is None:
+                continue
+            while stack and stack[-1][0] >= indent_level:
+                stack.pop()
+            if indent_level > 0 and stack:
+                edges.add((stack[-1][1], func_name))
+            stack.append((indent_level, func_name))
+    return edges
+
+
+def baseline_is_ignored_node(node: str) -> bool:
+    """
+    最初の版の split_dots_with_main_suffix_nodes.is_ignored_node()。
+    """
+    if node == "main":
+        return False
+    return len(node) > 0 and node[0].islower()
+
+
+def baseline_split_subgraphs(edges, hops=3):
+    """
+    最初の版の split_dots_with_main_suffix_nodes.main() が書き出す部分グラフ。
+    networkx.DiGraph の代わりに dict で隣接を持ち (ノードと子は最初に現れた順)、
+    深さの上限を hops にしたもの。ルート -> エッジのリスト の dict をルート候補の順で返す。
+    """
+    successors = {}
+    for src, dst in edges:
+        successors.setdefault(src, {})[dst] = None
+        successors.setdefault(dst, {})
+    roots = [node for node in successors
+             if not baseline_is_ignored_node(node) and (node == 'main' or node.endswith('Main'))]
+
+    subgraphs = {}
+    for root in roots:
+        visited = {root}
+        queue = deque([(root, 0)])
+        while queue:
+            current_node, depth = queue.popleft()
+            if current_node != root and current_node.endswith("Main"):
+                continue
+            if depth < hops:
+                for nxt in successors[current_node]:
+                    if baseline_is_ignored_node(nxt):
+                        continue
+                    if nxt not in visited:
+                        visited.add(nxt)
+                        queue.append((nxt, depth + 1))
+        subgraphs[root] = [(s, t) for s, t in edges
+                           if s in visited and t in visited and not (s != root and s.endswith("Main"))]
+    return subgraphs
+
+
+@pytest.fixture
+def sample_cflow():
+    """
+    手で書いた小さな cflow 出力 (POSIX 形式、行番号つき、-b の後方参照あり)。
+    """
+    return data_path('sample_posix.txt')
+
+
+@pytest.fixture(scope='session')
+def synth_cflow(tmp_path_factory):
+    """
+    bench.synth_cflow で生成した 2 万行程度の cflow 出力。
+    """
+    path = tmp_path_factory.mktemp('synth') / 'synth.txt'
+    with open(path, 'w', encoding='utf-8') as f:
+        generate_cflow(f, 20000, seed=1)
+    return str(path)
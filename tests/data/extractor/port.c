@@ -0,0 +1,52 @@
+#include <stdio.h>
+
+#define USE_LOCKS 1
+#define MASK 0x1f
+
+struct handler {
+    int (*callback)(int);
+};
+
+static int counter;
+
+#ifdef WIN32
+static void open_port(void)
+{
+    CreateFileA("COM1", 0x80000000);
+}
+#else
+static void open_port(void)
+{
+    open("/dev/ttyS0", 02);
+}
+#endif
+
+#if USE_LOCKS && MASK > 0x10
+static void lock_port(void)
+{
+    flock(0, 2);
+}
+#elif defined(WIN32)
+static void lock_port(void)
+{
+    LockFile(0, 0);
+}
+#endif
+
+static int apply(struct handler *h, int (*fp)(int), int value)
+{
+    /* メンバと関数ポインタ経由の呼び出しは呼び出し先が分からない */
+    value = h->callback(value & MASK);
+    value += (*fp)(value);
+    return value + 0x1f + 1e5;
+}
+
+int main(void)
+{
+    struct handler h = {0};
+    open_port();
+    lock_port();
+    counter = apply(&h, 0, 0x1f);
+    printf("%d\n", counter);
+    return 0;
+}
@@ -0,0 +1,37 @@
+#include <stdio.h>
+
+static int counter;
+
+static int helper(int x)
+{
+    counter += x;   /* { not a brace } */
+    return x * 2;
+}
+
+static void run(void)
+{
+    helper(1);
+    puts("run {");
+}
+
+static void stop(void)
+{
+    puts("stop");
+}
+
+struct ops {
+    void (*start)(void);
+    void (*finish)(void);
+};
+
+static struct ops table = {
+    run,
+    stop,
+};
+
+int main(void)
+{
+    run();
+    stop();
+    return helper(counter);
+}
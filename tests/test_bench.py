@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+bench.run_parsers (パーサ経路ごとの計測) のテスト。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from bench import run_parsers
+from conftest import ROOT
+
+
+def test_default_results_path_is_inside_bench():
+    path = run_parsers.default_results_path()
+    assert os.path.dirname(path) == os.path.join(ROOT, 'bench')
+    result = subprocess.run(['git', 'check-ignore', '-q', path], cwd=ROOT)
+    assert result.returncode == 0
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason="needs /proc")
+def test_process_tree_rss_includes_children():
+    own = run_parsers.process_tree_rss_kb(os.getpid())
+    # 32 MiB を確保 (全ページに書き込む) して止まる子プロセス
+    script = ('import time\n'
+              'b = bytearray(32 << 20)\n'
+              'b[::4096] = b"x" * len(b[::4096])\n'
+              'print(flush=True)\n'
+              'time.sleep(30)\n')
+    child = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+    try:
+        child.stdout.readline()
+        total = run_parsers.process_tree_rss_kb(os.getpid())
+        child_alone = run_parsers.process_tree_rss_kb(child.pid)
+    finally:
+        child.kill()
+        child.wait()
+    assert child_alone >= 32 << 10
+    assert total >= own + child_alone - (8 << 10)
+
+
+def test_tree_rss_sampler_records_peak():
+    sampler = run_parsers.TreeRssSampler()
+    sampler.start()
+    time.sleep(3 * run_parsers.RSS_SAMPLE_INTERVAL)
+    sampler.stop()
+    if os.path.isdir('/proc'):
+        assert sampler.peak_kb > 0
+    assert not sampler.is_alive()
+
+
+def test_lines_per_sec_handles_zero_time():
+    assert run_parsers.lines_per_sec(3000, 1.5) == 2000
+    assert run_parsers.lines_per_sec(10, 0.0) is None
+
+
+def test_cli_reports_zero_time_without_overflow(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(run_parsers, 'measure', lambda *a: {
+        "seconds": 0.0, "items": 1, "base_rss_kb": 1, "peak_rss_kb": 1})
+    results = tmp_path / 'results.json'
+    argv = ['run_parsers', '--sizes', '10', '--paths', 'mmap', '--repeat', '1',
+            '--data-dir', str(tmp_path / 'data'), '--results', str(results)]
+    monkeypatch.setattr(sys, 'argv', argv)
+    run_parsers.main()
+    run_parsers.main()
+    assert 'n/a lines/s' in capsys.readouterr().out
+    assert json.loads(results.read_text())[-1]['results'][0]['lines_per_sec'] is None
+
+
+def test_paths_agree_on_entry_counts(synth_cflow):
+    counts = {path: run_parsers.run_path(path, synth_cflow, 2)
+              for path in ('regex', 'mmap', 'stream')}
+    assert len(set(counts.values())) == 1 and counts['mmap'] > 0
+
+
+def test_cli_appends_results(tmp_path):
+    results = tmp_path / 'results.json'
+    args = [sys.executable, '-m', 'bench.run_parsers', '--sizes', '2k', '--paths', 'mmap,parallel',
+            '--jobs', '2', '--repeat', '1', '--data-dir', str(tmp_path / 'data'),
+            '--results', str(results)]
+    subprocess.run(args, cwd=ROOT, check=True, stdout=subprocess.PIPE)
+    second = subprocess.run(args, cwd=ROOT, check=True, stdout=subprocess.PIPE)
+    assert b'vs previous' in second.stdout
+
+    runs = json.loads(results.read_text())
+    assert len(runs) == 2
+    assert [(r['lines'], r['path']) for r in runs[-1]['results']] == \
+        [(2000, 'mmap'), (2000, 'parallel')]
+    assert all(r['peak_rss_kb'] >= r['base_rss_kb'] > 0 for r in runs[-1]['results'])
+    assert os.listdir(tmp_path / 'data') == ['synth-2000-0.txt']
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+c_call_extractor.py (cflow を使わない簡易フロントエンド) のテスト。
+
+tests/data/extractor の port.tree / port_win32.tree は、port.c に対する
+"cflow --cpp port.c" / "cflow --cpp -DWIN32 port.c" の出力と同じ形で書いたもの。
+cflow が入っていれば、実際の出力とも突き合わせる。
+"""
+
+import shutil
+import subprocess
+
+import pytest
+
+import c_call_extractor
+import cflow2dot
+from conftest import data_path, dot_edges, run_script
+
+PORT_C = data_path('extractor/port.c')
+
+
+def tree_edges(path: str):
+    entries = cflow2dot.open_cflow_entries(path, dialect=cflow2dot.detect_cflow_dialect(path))
+    return set(cflow2dot.edges_from_entries(entries))
+
+
+@pytest.mark.parametrize('args, tree', [
+    ((), 'extractor/port.tree'),
+    (('-DWIN32',), 'extractor/port_win32.tree'),
+])
+def test_edges_match_cflow_tree(args, tree):
+    assert set(c_call_extractor.extract_file_edges(PORT_C, args)) == tree_edges(data_path(tree))
+
+
+@pytest.mark.skipif(shutil.which('cflow') is None, reason="cflow is not installed")
+@pytest.mark.parametrize('args', [(), ('-DWIN32',)])
+def test_edges_match_real_cflow(tmp_path, args):
+    out = tmp_path / 'port.tree'
+    with open(out, 'wb') as f:
+        subprocess.run(['cflow', '--cpp', *args, 'port.c'], cwd=data_path('extractor'),
+                       stdout=f, check=True)
+    assert set(c_call_extractor.extract_file_edges(PORT_C, args)) == tree_edges(str(out))
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('0', False),
+    ('1', True),
+    ('0x10 > 3 && 010 == 8', False),
+    ('0x10 > 3 && 10 == 10', True),
+    ('defined FOO', True),
+    ('defined(BAR)', False),
+    ('!defined(BAR) && FOO', True),
+    ('FOO + 1 == 2 ? 1 : 0', True),
+    ('LEVEL >= 3', True),
+    ('UNKNOWN', False),
+    ('__has_attribute(noreturn) || 1 << 2 == 4', True),
+    ('(1 - 2) < 0 && ~0 == -1', True),
+    ('4 / 0', False),
+    ('1 +', False),
+])
+def test_evaluate_pp_condition(expression, expected):
+    macros = {'FOO': '1', 'LEVEL': 'FOO + 2'}
+    assert c_call_extractor.evaluate_pp_condition(expression, macros) is expected
+
+
+def test_parse_macro_args():
+    args = ['-DA', '-DB=2', '-Iinclude', '-DC=x=y', '-UA', '-UMISSING']
+    assert c_call_extractor.parse_macro_args(args) == {'B': '2', 'C': 'x=y'}
+
+
+def test_conditionals_follow_defines_and_nesting():
+    text = '''
+#define LEVEL 2
+#if LEVEL > 2
+void f(void) { high(); }
+#elif LEVEL == 2
+void f(void) { middle(); }
+#  ifdef EXTRA
+void g(void) { extra(); }
+#  endif
+#else
+void f(void) { low(); }
+#endif
+#undef LEVEL
+#ifndef LEVEL
+void h(void) { undefined(); }
+#endif
+'''
+    assert sorted(set(c_call_extractor.extract_calls(text))) == \
+        [('f', 'middle'), ('h', 'undefined')]
+    assert sorted(set(c_call_extractor.extract_calls(text, {'EXTRA': '1'}))) == \
+        [('f', 'middle'), ('g', 'extra'), ('h', 'undefined')]
+
+
+def test_member_pointer_calls_and_numbers_are_skipped():
+    text = '''
+int f(struct s *p, struct s v)
+{
+    p->run(1);
+    v.stop(2);
+    (*p->fp)(3);
+    return 0x1f + 1e5 + 0x10UL + call(0xff);
+}
+'''
+    assert list(c_call_extractor.extract_calls(text)) == [('f', 'call')]
+
+
+def test_cli_defines_and_jobs():
+    out = run_script('c_call_extractor.py', '-DWIN32', '-j', '2', PORT_C).stdout.decode('utf-8')
+    assert set(dot_edges(out)) == tree_edges(data_path('extractor/port_win32.tree'))
+    out = run_script('c_call_extractor.py', '-DWIN32', '-UWIN32', PORT_C).stdout.decode('utf-8')
+    assert set(dot_edges(out)) == tree_edges(data_path('extractor/port.tree'))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+callgraph_core のデータ構造のテスト。
+"""
+
+import numpy as np
+import pytest
+
+from callgraph_core import (
+    CallGraph,
+    ExternalEdgeSorter,
+    NodeAttrTable,
+    SymbolTable,
+    pack_edges,
+    parse_size,
+    sorted_unique,
+    sorted_unique_counts,
+    unpack_edges,
+)
+from conftest import dot_edges, run_script
+
+
+def test_symbol_table_assigns_ids_in_order():
+    table = SymbolTable(['main', 'Foo'])
+    assert table.intern('Foo') == 1
+    assert table.intern('Bar') == 2
+    assert table.names == ['main', 'Foo', 'Bar']
+    assert 'Bar' in table and 'Baz' not in table
+    assert table.get('Baz') is None and table.name(0) == 'main'
+
+
+def test_pack_unpack_round_trip():
+    src = np.array([0, 1, 2 ** 31 - 1, 7], dtype=np.int64)
+    dst = np.array([5, 0, 3, 2 ** 32 - 1], dtype=np.int64)
+    src2, dst2 = unpack_edges(pack_edges(src, dst))
+    assert src2.tolist() == src.tolist() and dst2.tolist() == dst.tolist()
+
+
+def test_sorted_unique_matches_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 50, size=1000)
+    assert sorted_unique(values).tolist() == np.unique(values).tolist()
+    assert sorted_unique([]).tolist() == []
+
+    weights = rng.integers(1, 5, size=1000)
+    uniq, totals = sorted_unique_counts(values, weights)
+    assert uniq.tolist() == np.unique(values).tolist()
+    assert totals.tolist() == [int(weights[values == v].sum()) for v in uniq]
+
+
+@pytest.mark.parametrize('pending_limit', [None, 7])
+def test_call_graph_dedupes_and_counts(monkeypatch, pending_limit):
+    if pending_limit is not None:
+        # 途中の finalize() を何度も起こす
+        monkeypatch.setattr('callgraph_core.PENDING_LIMIT', pending_limit)
+    edges = [('a', 'b'), ('b', 'c'), ('a', 'b'), ('c', 'a'), ('b', 'c'), ('a', 'b')] * 3
+    graph = CallGraph.from_edges(edges)
+    assert set(graph.iter_edges()) == set(edges)
+    assert len(graph) == 3 and graph.num_nodes == 3
+    counts = {(src, dst): count for src, dst, count in graph.iter_counted_edges()}
+    assert counts == {('a', 'b'): 9, ('b', 'c'): 6, ('c', 'a'): 3}
+    # (親 ID, 子 ID) の昇順
+    assert graph.edges.tolist() == sorted(graph.edges.tolist())
+
+
+def test_dedupe_sort_matches_stream_edge_set(synth_cflow):
+    stream = dot_edges(run_script('cflow2dot.py', synth_cflow).stdout.decode('utf-8'))
+    sort = dot_edges(run_script('cflow2dot.py', synth_cflow, '--dedupe', 'sort').stdout.decode('utf-8'))
+    assert sorted(stream) == sorted(sort)
+    assert len(sort) == len(set(sort))
+
+
+def test_node_attr_table_round_trip():
+    attrs = NodeAttrTable()
+    attrs.set('main', 'src/backend/main/main.c', 58)
+    attrs.symbols.intern('printf')  # 位置の分からない関数
+    attrs.set('PostmasterMain', 'src/backend/postmaster/postmaster.c', 490)
+    assert attrs.has('main') and not attrs.has('printf') and not attrs.has('missing')
+    assert attrs.get('printf') == (None, None)
+    assert len(attrs) == 2
+    assert attrs.names_in_file('src/backend/main/main.c') == ['main']
+
+    copy = NodeAttrTable.from_json_obj(attrs.to_json_obj())
+    assert list(copy) == list(attrs) == [
+        ('main', 'src/backend/main/main.c', 58),
+        ('PostmasterMain', 'src/backend/postmaster/postmaster.c', 490),
+    ]
+
+
+def random_edges(n, names=300, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, names, size=(n, 2)).tolist()
+    return [(f'F{src}', f'F{dst}') for src, dst in ids]
+
+
+@pytest.mark.parametrize('memory_limit', [1, 1 << 20])
+def test_external_sorter_matches_call_graph(tmp_path, memory_limit):
+    edges = random_edges(5000)
+    graph = CallGraph.from_edges(edges)
+    with ExternalEdgeSorter(memory_limit=memory_limit, tmp_dir=str(tmp_path)) as sorter:
+        sorter.add_edges(edges[:2500])
+        sorter.add_counted_edges(((src, dst, 2) for src, dst in edges[2500:]))
+        # 上限が小さければバッファ (最低 1024 エッジ) ごとにランを書き出す
+        assert len(sorter.runs) == (5000 // 1024 if memory_limit == 1 else 0)
+        counted = list(sorter.iter_counted_edges())
+    # ランの一時ファイルは close() で消える
+    assert list(tmp_path.iterdir()) == []
+
+    expected = {}
+    for i, edge in enumerate(edges):
+        expected[edge] = expected.get(edge, 0) + (1 if i < 2500 else 2)
+    assert {(src, dst): count for src, dst, count in counted} == expected
+    # CallGraph と同じ (親 ID, 子 ID) の昇順
+    assert [(src, dst) for src, dst, _ in counted] == list(graph.iter_edges())
+
+
+def test_external_sorter_empty(tmp_path):
+    with ExternalEdgeSorter(tmp_dir=str(tmp_path)) as sorter:
+        assert list(sorter.iter_edges()) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('65536', 65536), ('512K', 512 << 10), ('256M', 256 << 20), ('2g', 2 << 30),
+    ('1.5GB', 3 << 29),
+])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+def test_dedupe_external_matches_sort(synth_cflow, tmp_path):
+    sort = run_script('cflow2dot.py', synth_cflow, '--dedupe', 'sort').stdout
+    external = run_script('cflow2dot.py', synth_cflow, '--dedupe', 'external',
+                          '--memory-limit', '64K', '--tmp-dir', tmp_path).stdout
+    assert external == sort
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+cflow2dot.py の木形式の変換 (逐次出力・パーサ・並列パース・方言の判定) のテスト。
+"""
+
+import io
+import json
+import re
+from itertools import islice
+
+import pytest
+
+import cflow2dot
+from callgraph_core import NodeAttrTable
+from conftest import baseline_cflow_edges, baseline_parse_cflow_line, dot_edges, run_script
+
+
+@pytest.fixture(params=['sample_cflow', 'synth_cflow'])
+def cflow_file(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_cli_matches_baseline(cflow_file):
+    out = run_script('cflow2dot.py', cflow_file).stdout.decode('utf-8')
+    lines = out.splitlines()
+    assert lines[:3] == ['digraph cflow {', '    rankdir=TB;', '    node [shape=box];']
+    assert lines[-1] == '}'
+    edges = dot_edges(out)
+    assert len(edges) == len(set(edges))
+    assert set(edges) == baseline_cflow_edges(cflow_file)
+
+
+def test_cflow_to_dot_matches_write_dot(sample_cflow):
+    text = cflow2dot.cflow_to_dot(sample_cflow)
+    out = io.StringIO()
+    entries = cflow2dot.open_cflow_entries(sample_cflow)
+    cflow2dot.write_dot(cflow2dot.unique_edges(cflow2dot.edges_from_entries(entries)), out)
+    assert out.getvalue() == text + '\n'
+
+
+def test_iter_dot_lines_does_not_consume_edges_up_front():
+    consumed = []
+
+    def edges():
+        for edge in [('a', 'b'), ('b', 'c')]:
+            consumed.append(edge)
+            yield edge
+
+    lines = cflow2dot.iter_dot_lines(edges())
+    head = list(islice(lines, 3))
+    assert head[0] == 'digraph cflow {'
+    assert consumed == []
+    assert next(lines) == '    "a" -> "b";'
+    assert consumed == [('a', 'b')]
+
+
+def test_unique_edges_keeps_first_occurrence_order():
+    edges = [('a', 'b'), ('b', 'c'), ('a', 'b'), ('c', 'a'), ('b', 'c')]
+    assert list(cflow2dot.unique_edges(iter(edges))) == [('a', 'b'), ('b', 'c'), ('c', 'a')]
+
+
+def test_mmap_and_regex_parsers_agree_with_baseline(cflow_file):
+    with open(cflow_file, 'r', encoding='utf-8') as f:
+        baseline = [entry for entry in map(baseline_parse_cflow_line, f) if entry[1] is not None]
+    mmap_entries = list(cflow2dot.open_cflow_entries(cflow_file, 'mmap'))
+    regex_entries = list(cflow2dot.open_cflow_entries(cflow_file, 'regex'))
+    assert mmap_entries == regex_entries == baseline
+
+
+@pytest.mark.parametrize('line', [
+    '    1 main: int (int argc, char *argv[]), <src/backend/main/main.c 71>',
+    '   12         InitPostgres: 14',
+    '    7         foo() <int foo (void) at foo.c:3> [see 12]',
+    '    8             foo() <int foo (void) at foo.c:3> (recursive: see 4) [see 4]',
+    '    9     setvbuf: <>',
+    '',
+    'no line number here',
+])
+def test_parse_cflow_bytes_matches_parse_cflow_line(line):
+    indent_level, name = cflow2dot.parse_cflow_bytes(line.encode('utf-8') + b'\n')
+    expected = cflow2dot.parse_cflow_line(line + '\n')
+    assert (indent_level, name.decode('utf-8') if name is not None else None) == expected
+
+
+def test_cli_parsers_produce_identical_dot(synth_cflow):
+    mmap_out = run_script('cflow2dot.py', synth_cflow, '--parser', 'mmap').stdout
+    regex_out = run_script('cflow2dot.py', synth_cflow, '--parser', 'regex').stdout
+    assert mmap_out == regex_out
+
+
+@pytest.mark.parametrize('n_chunks', [1, 2, 3, 8, 64])
+def test_toplevel_chunks_split_only_before_level_zero_lines(cflow_file, n_chunks):
+    chunks = cflow2dot.find_toplevel_chunks(cflow_file, n_chunks)
+    with open(cflow_file, 'rb') as f:
+        data = f.read()
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+        line = data[start:data.index(b'\n', start) + 1]
+        assert cflow2dot.parse_cflow_bytes(line)[0] == 0
+
+
+@pytest.mark.parametrize('jobs', [2, 3, 7])
+def test_parallel_parse_matches_sequential(cflow_file, jobs):
+    sequential = list(cflow2dot.unique_edges(
+        cflow2dot.edges_from_entries(cflow2dot.open_cflow_entries(cflow_file))))
+    parallel = list(cflow2dot.unique_edges(cflow2dot.parse_cflow_parallel(cflow_file, jobs)))
+    assert parallel == sequential
+
+
+def test_chunks_of_empty_and_single_tree_files(tmp_path):
+    empty = tmp_path / 'empty.txt'
+    empty.write_bytes(b'')
+    assert cflow2dot.find_toplevel_chunks(str(empty), 4) == []
+
+    single = tmp_path / 'single.txt'
+    single.write_text('    1 main: <>\n    2     Foo: <>\n    3     Bar: <>\n')
+    assert cflow2dot.find_toplevel_chunks(str(single), 4) == [(0, single.stat().st_size)]
+
+
+def test_cli_jobs_output_identical(synth_cflow):
+    assert run_script('cflow2dot.py', synth_cflow, '-j', '4').stdout == \
+        run_script('cflow2dot.py', synth_cflow).stdout
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('    1 main: int (int argc, char *argv[]), <src/backend/main/main.c 71>',
+     ('src/backend/main/main.c', 71)),
+    ('main() <int main (int argc,char **argv) at src/main.c:71>:', ('src/main.c', 71)),
+    (b'    2     setvbuf: <>', (None, None)),
+    ('    3     InitPostgres: 14', (None, None)),
+])
+def test_parse_cflow_location(line, expected):
+    assert cflow2dot.parse_cflow_location(line) == expected
+
+
+def expected_locations(cflow_file):
+    # 各関数について、最初に位置が書かれた行の位置
+    locations = {}
+    with open(cflow_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            _, name = cflow2dot.parse_cflow_line(line)
+            file, line_number = cflow2dot.parse_cflow_location(line)
+            if name is not None and file is not None:
+                locations.setdefault(name, (file, line_number))
+    return locations
+
+
+@pytest.mark.parametrize('extra', [[], ['-j', '3'], ['--parser', 'regex']])
+def test_cli_locations_and_attrs_json(cflow_file, tmp_path, extra):
+    attrs_json = tmp_path / 'attrs.json'
+    out = run_script('cflow2dot.py', cflow_file, '--locations', '--attrs-json', attrs_json,
+                     *extra).stdout.decode('utf-8')
+    node_re = re.compile(r'^    "([^"]+)" \[file="([^"]*)", line=(\d+)\];$')
+    nodes = {m.group(1): (m.group(2), int(m.group(3)))
+             for m in map(node_re.match, out.splitlines()) if m}
+    expected = expected_locations(cflow_file)
+    assert nodes == expected
+
+    with open(attrs_json, encoding='utf-8') as f:
+        table = NodeAttrTable.from_json_obj(json.load(f))
+    assert {name: (file, line) for name, file, line in table} == expected
+
+
+def test_check_backrefs_resolves_sample(sample_cflow):
+    assert cflow2dot.check_backrefs(sample_cflow) == (7, [])
+
+
+def test_check_backrefs_reports_unresolved(tmp_path):
+    path = tmp_path / 'unresolved.txt'
+    path.write_text('    1 main: <>\n'
+                    '    2     Foo: <a.c 3>\n'
+                    '    3         Bar: <>\n'
+                    '    4     Foo: 2\n'
+                    '    5     Baz: 9\n')
+    assert cflow2dot.check_backrefs(str(path)) == (2, [9])
+
+    result = run_script('cflow2dot.py', path, '--check-refs', check=False)
+    assert result.returncode == 1
+    assert result.stdout.decode('utf-8').strip() == 'back-references: 2, unresolved: 1'
+    assert b'unresolved lines: 9' in result.stderr
+
+
+def test_iter_cflow_nodes_records_index_only_on_request(sample_cflow):
+    index = {}
+    with_index = list(cflow2dot.iter_cflow_nodes(sample_cflow, index=index))
+    assert list(cflow2dot.iter_cflow_nodes(sample_cflow)) == with_index
+    # 部分木を展開した行だけが記録される
+    assert index[1] == 'main'
+    assert all(node.ref is None for node in with_index if node.line_number in index)
+    refs = [node for node in with_index if node.ref is not None]
+    assert all(index[node.ref] == node.func_name for node in refs)
+
+
+def reachable_edges(edges, root):
+    # root から辿れるエッジ (cflow の木は到達可能な呼び出しをすべて含む)
+    children = {}
+    for src, dst in edges:
+        children.setdefault(src, []).append(dst)
+    reached, seen, stack = set(), {root}, [root]
+    while stack:
+        node = stack.pop()
+        for child in children.get(node, []):
+            reached.add((node, child))
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return reached
+
+
+def test_toplevel_index_of_sample(sample_cflow):
+    trees = cflow2dot.build_toplevel_index(sample_cflow)
+    assert [(tree.name, tree.first_line) for tree in trees] == \
+        [('main', 1), ('CheckpointerMain', 24), ('WalWriterMain', 31)]
+    assert trees[0].start == 0
+    assert all(a.end == b.start for a, b in zip(trees, trees[1:]))
+
+
+@pytest.mark.parametrize('root', ['main', 'CheckpointerMain', 'WalWriterMain'])
+def test_root_edges_follow_backrefs_into_other_trees(sample_cflow, root):
+    trees = cflow2dot.build_toplevel_index(sample_cflow)
+    edges = set(cflow2dot.iter_root_edges(sample_cflow, [root], trees))
+    assert edges == reachable_edges(baseline_cflow_edges(sample_cflow), root)
+
+
+BACKREF_INTO_SCANNED_PREFIX = (
+    '    1 main: <>\n'
+    '    2     A: <>\n'
+    '    3         C: <>\n'
+    '    4             D: <>\n'
+    '    5     B: <>\n'
+    '    6         C: 3\n'
+    '    7 PostgresMain: <>\n'
+    '    8     B: 5\n'
+)
+
+
+def test_root_edges_follow_backref_to_an_earlier_line_of_the_fetched_tree(tmp_path):
+    # B (5 行目) を取りに main の木を頭から読むとき、C (3 行目) の展開も読み飛ばす。
+    # それで B の中の "C: 3" を展開済みとみなしてはいけない
+    path = tmp_path / 'cflow.txt'
+    path.write_text(BACKREF_INTO_SCANNED_PREFIX)
+    trees = cflow2dot.build_toplevel_index(str(path))
+    edges = set(cflow2dot.iter_root_edges(str(path), ['PostgresMain'], trees))
+    assert edges == {('PostgresMain', 'B'), ('B', 'C'), ('C', 'D')}
+    assert edges == reachable_edges(baseline_cflow_edges(str(path)), 'PostgresMain')
+
+    out = run_script('cflow2dot.py', path, '--root', 'PostgresMain', '--index',
+                     tmp_path / 'cflow.idx').stdout.decode('utf-8')
+    assert set(dot_edges(out)) == edges
+
+
+def test_toplevel_index_sidecar_is_reused_and_rebuilt(sample_cflow, tmp_path):
+    path = tmp_path / 'cflow.txt'
+    path.write_bytes(open(sample_cflow, 'rb').read())
+    sidecar = tmp_path / ('cflow.txt' + cflow2dot.INDEX_SUFFIX)
+
+    trees = cflow2dot.load_toplevel_index(str(path))
+    assert trees == cflow2dot.build_toplevel_index(str(path))
+    saved = json.loads(sidecar.read_text())
+    saved['trees'][0][0] = 'renamed'
+    sidecar.write_text(json.dumps(saved))
+    assert cflow2dot.load_toplevel_index(str(path))[0].name == 'renamed'
+
+    # cflow 出力が変われば作り直す
+    with open(path, 'ab') as f:
+        f.write(b'   36 BackgroundWriterMain: <>\n')
+    trees = cflow2dot.load_toplevel_index(str(path))
+    assert [tree.name for tree in trees][0] == 'main'
+    assert trees[-1].name == 'BackgroundWriterMain'
+
+
+def test_cli_root_with_locations(sample_cflow, tmp_path):
+    attrs_json = tmp_path / 'attrs.json'
+    index = tmp_path / 'sample.idx.json'
+    out = run_script('cflow2dot.py', sample_cflow, '--root', 'WalWriterMain', '--index', index,
+                     '--locations', '--attrs-json', attrs_json).stdout.decode('utf-8')
+    assert set(dot_edges(out)) == \
+        reachable_edges(baseline_cflow_edges(sample_cflow), 'WalWriterMain')
+    assert '    "AbsorbSyncRequests" [file="src/backend/postmaster/checkpointer.c", line=1290];' \
+        in out.splitlines()
+    with open(attrs_json, encoding='utf-8') as f:
+        table = NodeAttrTable.from_json_obj(json.load(f))
+    assert {name for name, _, _ in table} == \
+        {'WalWriterMain', 'XLogBackgroundFlush', 'XLogWrite', 'AbsorbSyncRequests',
+         'RememberSyncRequest'}
+
+
+@pytest.mark.parametrize('extra', [['-j', '2'], ['--counts']])
+def test_cli_root_rejects_jobs_and_counts(sample_cflow, tmp_path, extra):
+    result = run_script('cflow2dot.py', sample_cflow, '--root', 'main',
+                        '--index', tmp_path / 'sample.idx.json', *extra, check=False)
+    assert result.returncode == 2
+    assert b'--root cannot be combined' in result.stderr
+
+
+def test_cli_root_rejects_regex_parser(sample_cflow, tmp_path):
+    result = run_script('cflow2dot.py', sample_cflow, '--root', 'main', '--parser', 'regex',
+                        '--index', tmp_path / 'sample.idx.json', check=False)
+    assert result.returncode == 2
+    assert b'cannot be combined with --parser regex' in result.stderr
+    assert not (tmp_path / 'sample.idx.json').exists()
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+cflow_driver.py のユニットの読み込み・まとめ方と、cflow の実行のテスト。
+cflow はインストールされていないことが多いので、引数を記録して決まった木を出力する
+Python 製の偽の cflow を使う。
+"""
+
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import cflow_driver
+from cflow_driver import TranslationUnit
+from conftest import data_path, dot_edges, run_script
+
+FAKE_CFLOW = '''#!{python}
+# 引数を記録し、ソースファイルごとに "Main_<名前> -> Helper" の木を出力する
+import json, os, sys
+with open(os.environ['FAKE_CFLOW_LOG'], 'a') as log:
+    log.write(json.dumps([os.getcwd(), sys.argv[1:]]) + '\\n')
+files = [arg for arg in sys.argv[1:] if arg.endswith('.c')]
+n = 0
+for file in files:
+    stem = os.path.splitext(os.path.basename(file))[0]
+    n += 1
+    print('%5d Main_%s: int (void), <%s 1>' % (n, stem, file))
+    n += 1
+    print('%5d     Helper: <>' % n)
+sys.exit(int(os.environ.get('FAKE_CFLOW_STATUS', '0')))
+'''
+
+
+class FakeTool:
+    """
+    script を実行可能なファイルとして tmp_path に置き、呼び出しの記録を読めるようにする。
+    """
+
+    def __init__(self, tmp_path, name, script, monkeypatch):
+        self.path = tmp_path / name
+        self.path.write_text(script.format(python=sys.executable))
+        self.path.chmod(self.path.stat().st_mode | stat.S_IXUSR)
+        self.log = tmp_path / (name + '.log')
+        monkeypatch.setenv('FAKE_CFLOW_LOG', str(self.log))
+
+    def __str__(self):
+        return str(self.path)
+
+    def calls(self):
+        if not self.log.exists():
+            return []
+        with open(self.log) as f:
+            return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def fake_cflow(tmp_path, monkeypatch):
+    return FakeTool(tmp_path, 'fake-cflow', FAKE_CFLOW, monkeypatch)
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    for name in ('a/x.c', 'a/y.c', 'a/z.c', 'b/w.c'):
+        path = tmp_path / 'src' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('int %s(void) { return 0; }\n' % name[2])
+    return tmp_path / 'src'
+
+
+def test_cflow_args_from_command():
+    args = ['cc', '-c', '-I', 'include', '-Isrc', '-DFOO=1', '-U', 'BAR', '-O2', '-o', 'x.o', 'x.c']
+    assert cflow_driver.cflow_args_from_command(args) == ['-Iinclude', '-Isrc', '-DFOO=1', '-UBAR']
+
+
+def test_load_compile_commands(tmp_path):
+    path = tmp_path / 'compile_commands.json'
+    path.write_text(json.dumps([
+        {'directory': '/src/a', 'file': 'x.c', 'arguments': ['cc', '-DX', '-c', 'x.c']},
+        {'directory': '/src/b', 'file': 'y.c', 'command': 'cc -I ../inc -c y.c'},
+        {'directory': '/src/b', 'file': 'z.cpp', 'command': 'c++ -c z.cpp'},
+    ]))
+    assert cflow_driver.load_units(str(path)) == [
+        TranslationUnit('/src/a', ('x.c',), ('-DX',)),
+        TranslationUnit('/src/b', ('y.c',), ('-I../inc',)),
+    ]
+
+
+CLANG_ONLY_COMMAND = ['cc', '-std=gnu99', '-isystem', '/usr/include/llvm', '-isystem/opt/inc',
+                      '-include', 'pg_config.h', '--sysroot', '/sdk', '-I', 'inc', '-DX',
+                      '-O2', '-c', 'x.c']
+CLANG_ONLY_ARGS = ('-std=gnu99', '-isystem/usr/include/llvm', '-isystem/opt/inc',
+                   '-includepg_config.h', '--sysroot=/sdk', '-Iinc', '-DX')
+
+
+def test_load_compile_commands_keeps_clang_only_options(tmp_path):
+    path = tmp_path / 'compile_commands.json'
+    path.write_text(json.dumps([{'directory': '/src', 'file': 'x.c', 'arguments': CLANG_ONLY_COMMAND}]))
+    assert cflow_driver.load_units(str(path)) == [TranslationUnit('/src', ('x.c',), CLANG_ONLY_ARGS)]
+    # cflow には -I / -D / -U だけを渡す
+    assert cflow_driver.cflow_args(CLANG_ONLY_ARGS) == ['-Iinc', '-DX']
+
+
+def test_load_file_list(tmp_path):
+    path = tmp_path / 'files.txt'
+    path.write_text('# sources\na/x.c\n\nb/w.c\n')
+    assert cflow_driver.load_units(str(path)) == [
+        TranslationUnit(str(tmp_path), ('a/x.c',), ()),
+        TranslationUnit(str(tmp_path), ('b/w.c',), ()),
+    ]
+
+
+def test_group_by_directory_keeps_arguments_apart():
+    units = [
+        TranslationUnit('/src', ('a/x.c',), ('-DX',)),
+        TranslationUnit('/src/a', ('y.c',), ('-DX',)),
+        TranslationUnit('/src', ('a/z.c',), ('-DZ',)),
+        TranslationUnit('/src', ('b/w.c',), ('-DX',)),
+    ]
+    assert cflow_driver.group_by_directory(units) == [
+        TranslationUnit('/src/a', ('x.c', 'y.c'), ('-DX',)),
+        TranslationUnit('/src/a', ('z.c',), ('-DZ',)),
+        TranslationUnit('/src/b', ('w.c',), ('-DX',)),
+    ]
+
+
+@pytest.mark.parametrize('name', ['files.txt', 'compile_commands.json'])
+def test_cli_missing_source_list(tmp_path, name):
+    result = run_script('cflow_driver.py', tmp_path / name, '--frontend', 'python', check=False)
+    assert result.returncode == 1
+    assert result.stderr.decode('utf-8').strip() == \
+        f"[Errno 2] No such file or directory: '{tmp_path / name}'"
+
+
+def test_run_cflow_without_binary(tmp_path, capsys):
+    unit = TranslationUnit(str(tmp_path), ('x.c',), ())
+    assert cflow_driver.run_cflow(unit, str(tmp_path / 'missing-cflow')) == (b'', None)
+    assert 'cannot run' in capsys.readouterr().err
+
+
+def test_run_cflow_passes_flags_and_args(fake_cflow, source_tree):
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c', 'y.c'), ('-DX',))
+    output, returncode = cflow_driver.run_cflow(unit, str(fake_cflow), ['--number'])
+    assert returncode == 0
+    assert cflow_driver.edges_from_cflow_output(output) == \
+        [('Main_x', 'Helper'), ('Main_y', 'Helper')]
+    assert fake_cflow.calls() == [[str(source_tree / 'a'), ['--number', '-DX', 'x.c', 'y.c']]]
+
+
+def test_extract_edges_parallel_and_merge(fake_cflow, source_tree):
+    units = [TranslationUnit(str(source_tree / 'a'), ('x.c',), ()),
+             TranslationUnit(str(source_tree / 'b'), ('w.c',), ())]
+    edge_lists = cflow_driver.extract_edges_parallel(units, 2, str(fake_cflow))
+    assert edge_lists == [[('Main_x', 'Helper')], [('Main_w', 'Helper')]]
+    assert list(cflow_driver.merge_sorted_edges(edge_lists)) == \
+        [('Main_w', 'Helper'), ('Main_x', 'Helper')]
+
+
+def test_cli_group_dir_runs_once_per_directory_and_args(fake_cflow, source_tree, tmp_path):
+    commands = tmp_path / 'compile_commands.json'
+    commands.write_text(json.dumps([
+        {'directory': str(source_tree), 'file': 'a/x.c', 'arguments': ['cc', '-DX', 'a/x.c']},
+        {'directory': str(source_tree), 'file': 'a/y.c', 'arguments': ['cc', '-DX', 'a/y.c']},
+        {'directory': str(source_tree), 'file': 'a/z.c', 'arguments': ['cc', '-DZ', 'a/z.c']},
+        {'directory': str(source_tree), 'file': 'b/w.c', 'arguments': ['cc', 'b/w.c']},
+    ]))
+    out = run_script('cflow_driver.py', commands, '--group', 'dir', '--cflow', fake_cflow,
+                     '--no-cache', '-j', '2').stdout.decode('utf-8')
+    assert sorted(dot_edges(out)) == [('Main_w', 'Helper'), ('Main_x', 'Helper'),
+                                      ('Main_y', 'Helper'), ('Main_z', 'Helper')]
+    flags = len(cflow_driver.DEFAULT_CFLOW_FLAGS)
+    calls = sorted((os.path.relpath(cwd, source_tree), argv[flags:])
+                   for cwd, argv in fake_cflow.calls())
+    assert calls == [('a', ['-DX', 'x.c', 'y.c']), ('a', ['-DZ', 'z.c']), ('b', ['w.c'])]
+
+
+def test_cli_missing_cflow(source_tree, tmp_path):
+    files = tmp_path / 'files.txt'
+    files.write_text(str(source_tree / 'a' / 'x.c') + '\n')
+    result = run_script('cflow_driver.py', files, '--cflow', tmp_path / 'missing-cflow',
+                        '--no-cache', check=False)
+    assert result.returncode == 1
+    assert b'not found' in result.stderr
+    assert b'Traceback' not in result.stderr
+
+
+@pytest.mark.parametrize('edges', [
+    [],
+    [('a', 'b'), ('a', 'c'), ('b', 'a')],
+    [('関数', 'ヘルパ'), ('x' * 300, 'y')],
+])
+def test_encode_decode_edges_round_trip(edges):
+    data = cflow_driver.encode_edges(edges)
+    assert data[:4] == cflow_driver.CACHE_MAGIC
+    assert cflow_driver.decode_edges(data) == edges
+
+
+def test_decode_edges_rejects_broken_data():
+    data = cflow_driver.encode_edges([('a', 'b'), ('b', 'c')])
+    assert cflow_driver.decode_edges(b'') is None
+    assert cflow_driver.decode_edges(b'XXXX' + data[4:]) is None
+    assert cflow_driver.decode_edges(data[:-4]) is None
+
+
+def test_unit_cache_key(source_tree, monkeypatch):
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c',), ('-DX',))
+    key = cflow_driver.unit_cache_key(unit, 'cflow', ['--number'])
+    assert key == cflow_driver.unit_cache_key(unit, '/usr/bin/cflow', ['--number'])
+    assert key != cflow_driver.unit_cache_key(unit, 'cflow', ['--brief'])
+    assert key != cflow_driver.unit_cache_key(unit._replace(args=('-DY',)), 'cflow', ['--number'])
+    (source_tree / 'a' / 'x.c').write_text('int x(void) { return 1; }\n')
+    changed = cflow_driver.unit_cache_key(unit, 'cflow', ['--number'])
+    assert changed != key
+    # 出力からエッジを作る処理の版が変われば、同じソースでもキーが変わる
+    monkeypatch.setattr(cflow_driver, 'CACHE_KEY_VERSION', cflow_driver.CACHE_KEY_VERSION + 1)
+    assert cflow_driver.unit_cache_key(unit, 'cflow', ['--number']) != changed
+
+
+def test_store_and_load_cached_edges(tmp_path):
+    key = 'ab' + '0' * 62
+    assert cflow_driver.load_cached_edges(str(tmp_path), key) is None
+    cflow_driver.store_cached_edges(str(tmp_path), key, [('a', 'b')])
+    assert cflow_driver.load_cached_edges(str(tmp_path), key) == [('a', 'b')]
+    assert os.listdir(tmp_path / 'ab') == [key + '.bin']
+
+
+def test_extract_edges_cached_hits_and_misses(fake_cflow, source_tree, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    units = [TranslationUnit(str(source_tree / 'a'), ('x.c',), ()),
+             TranslationUnit(str(source_tree / 'b'), ('w.c',), ())]
+    expected = [[('Main_x', 'Helper')], [('Main_w', 'Helper')]]
+
+    assert cflow_driver.extract_edges_cached(units, 2, cache_dir, str(fake_cflow)) == \
+        (expected, 0, 2)
+    assert cflow_driver.extract_edges_cached(units, 2, cache_dir, str(fake_cflow)) == \
+        (expected, 2, 0)
+    assert len(fake_cflow.calls()) == 2
+
+    (source_tree / 'b' / 'w.c').write_text('int w(void) { return 1; }\n')
+    edge_lists, hits, misses = cflow_driver.extract_edges_cached(units, 2, cache_dir,
+                                                                 str(fake_cflow))
+    assert sorted(edge_lists) == sorted(expected)
+    assert (hits, misses) == (1, 1)
+
+
+def test_extract_edges_cached_does_not_store_failed_units(fake_cflow, source_tree, tmp_path,
+                                                          monkeypatch, capfd):
+    cache_dir = str(tmp_path / 'cache')
+    units = [TranslationUnit(str(source_tree / 'a'), ('x.c',), ())]
+
+    monkeypatch.setenv('FAKE_CFLOW_STATUS', '1')
+    # 失敗しても途中までの出力は使う
+    assert cflow_driver.extract_edges_cached(units, 1, cache_dir, str(fake_cflow)) == \
+        ([[('Main_x', 'Helper')]], 0, 1)
+    assert 'cflow failed (1)' in capfd.readouterr().err
+    assert cflow_driver.extract_edges_cached(units, 1, cache_dir, str(fake_cflow))[1:] == (0, 1)
+
+    monkeypatch.setenv('FAKE_CFLOW_STATUS', '0')
+    assert cflow_driver.extract_edges_cached(units, 1, cache_dir, str(fake_cflow))[1:] == (0, 1)
+    assert cflow_driver.extract_edges_cached(units, 1, cache_dir, str(fake_cflow))[1:] == (1, 0)
+
+
+def test_cli_reports_cache_hits(fake_cflow, source_tree, tmp_path):
+    files = tmp_path / 'files.txt'
+    files.write_text('src/a/x.c\nsrc/a/y.c\n')
+    args = ('cflow_driver.py', files, '--cflow', fake_cflow, '--cache-dir', tmp_path / 'cache')
+    first = run_script(*args)
+    second = run_script(*args)
+    assert b'cache: 0 hit, 2 miss' in first.stderr
+    assert b'cache: 2 hit, 0 miss' in second.stderr
+    assert first.stdout == second.stdout
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_cli_reports_missing_source_and_keeps_going(source_tree, tmp_path, cache):
+    files = tmp_path / 'files.txt'
+    files.write_text('src/a/x.c\nsrc/nosuch.c\n')
+    (source_tree / 'a' / 'x.c').write_text('int x(void) { return Helper(); }\n')
+    args = ['cflow_driver.py', files, '--frontend', 'python', '--cache-dir', tmp_path / 'cache']
+    if not cache:
+        args.append('--no-cache')
+    result = run_script(*args)
+    assert f"cannot read {source_tree / 'nosuch.c'}: No such file or directory".encode('utf-8') \
+        in result.stderr
+    assert b'Traceback' not in result.stderr
+    assert b'"x" -> "Helper";' in result.stdout
+    if cache:
+        assert b'cache: 0 hit, 2 miss' in result.stderr
+        # 読めなかったユニットは保存しないので、次回も実行する
+        assert b'cache: 1 hit, 1 miss' in run_script(*args).stderr
+
+
+@pytest.mark.parametrize('args, expected', [
+    ((), ('open_port', 'open')),
+    (('-DWIN32',), ('open_port', 'CreateFileA')),
+])
+def test_python_frontend_evaluates_unit_defines(args, expected):
+    unit = TranslationUnit(data_path('extractor'), ('port.c',), args)
+    edges, ok = cflow_driver.edges_from_sources(unit)
+    assert ok and expected in edges
+    assert ('apply', 'callback') not in edges
+
+
+FAKE_CLANG = '''#!{python}
+# 引数を記録し、bad.c 以外のソースファイルごとに "<名前> -> helper" の LLVM IR を出力する
+import json, os, sys
+with open(os.environ['FAKE_CFLOW_LOG'], 'a') as log:
+    log.write(json.dumps([os.getcwd(), sys.argv[1:]]) + '\\n')
+file = sys.argv[-1]
+stem = os.path.splitext(os.path.basename(file))[0]
+if stem == 'bad':
+    sys.stderr.write(file + ': error: broken\\n')
+    sys.exit(1)
+print('define dso_local i32 @%s() #0 {{' % stem)
+print('  %%1 = call i32 @helper(i32 noundef 1)')
+print('  call void @llvm.memcpy.p0.p0.i64(ptr %%2, ptr %%3, i64 4, i1 false)')
+print('  ret i32 %%1')
+print('}}')
+'''
+
+
+@pytest.fixture
+def fake_clang(tmp_path, monkeypatch):
+    return FakeTool(tmp_path, 'fake-clang', FAKE_CLANG, monkeypatch)
+
+
+def test_edges_from_llvm_ir():
+    output = (b'define dso_local i32 @main(i32 noundef %0) #0 {\n'
+              b'  %2 = call i32 @run(i32 noundef 1)\n'
+              b'  call void @llvm.dbg.declare(metadata ptr %2)\n'
+              b'  invoke void @Stop() to label %3 unwind label %4\n'
+              b'}\n'
+              b'declare i32 @run(i32 noundef)\n'
+              b'define internal void @run.cold() {\n'
+              b'  tail call void @abort()\n'
+              b'}\n')
+    assert cflow_driver.edges_from_llvm_ir(output) == \
+        [('main', 'Stop'), ('main', 'run'), ('run.cold', 'abort')]
+    assert cflow_driver.edges_from_llvm_ir(output, lambda src, dst: dst[0].islower()) == \
+        [('main', 'Stop')]
+
+
+def test_run_clang_reports_failed_files(fake_clang, source_tree, capsys):
+    (source_tree / 'a' / 'bad.c').write_text('int bad(void) {\n')
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c', 'bad.c', 'y.c'), ('-DX',))
+    output, ok = cflow_driver.run_clang(unit, str(fake_clang), ['-S'])
+    assert not ok
+    assert cflow_driver.edges_from_llvm_ir(output) == [('x', 'helper'), ('y', 'helper')]
+    assert 'clang failed (1)' in capsys.readouterr().err
+    assert [args for _, args in fake_clang.calls()] == \
+        [['-S', '-DX', 'x.c'], ['-S', '-DX', 'bad.c'], ['-S', '-DX', 'y.c']]
+
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c',), ())
+    assert cflow_driver.run_clang(unit, str(fake_clang), ['-S'])[1]
+    output, ok = cflow_driver.run_clang(unit, str(source_tree / 'no-clang'), ['-S'])
+    assert (output, ok) == (b'', False)
+    assert 'cannot run' in capsys.readouterr().err
+
+
+def test_run_clang_passes_clang_only_options(fake_clang, source_tree):
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c',), CLANG_ONLY_ARGS)
+    assert cflow_driver.run_clang(unit, str(fake_clang), ['-S'])[1]
+    assert [args for _, args in fake_clang.calls()] == [['-S', *CLANG_ONLY_ARGS, 'x.c']]
+
+
+def test_run_cflow_drops_clang_only_options(fake_cflow, source_tree):
+    unit = TranslationUnit(str(source_tree / 'a'), ('x.c',), CLANG_ONLY_ARGS)
+    assert cflow_driver.run_cflow(unit, str(fake_cflow), ['--number'])[1] == 0
+    assert [args for _, args in fake_cflow.calls()] == [['--number', '-Iinc', '-DX', 'x.c']]
+
+
+def test_extract_edges_cached_does_not_store_partial_clang_output(fake_clang, source_tree,
+                                                                  tmp_path, capfd):
+    cache_dir = str(tmp_path / 'cache')
+    (source_tree / 'a' / 'bad.c').write_text('int bad(void) {\n')
+    units = [TranslationUnit(str(source_tree / 'a'), ('x.c', 'bad.c'), ()),
+             TranslationUnit(str(source_tree / 'a'), ('y.c',), ())]
+
+    def extract():
+        return cflow_driver.extract_edges_cached(units, 1, cache_dir, tool=str(fake_clang),
+                                                 flags=['-S'], frontend='clang')
+
+    assert extract() == ([[('x', 'helper')], [('y', 'helper')]], 0, 2)
+    assert 'clang failed' in capfd.readouterr().err
+    # 1 ファイルでも失敗したユニットは保存されず、次回も clang をかける
+    assert sorted(extract()[0]) == [[('x', 'helper')], [('y', 'helper')]]
+    assert extract()[1:] == (1, 1)
+
+    (source_tree / 'a' / 'bad.c').write_text('int bad(void) { return 0; }\n')
+    (source_tree / 'a' / 'bad.c').rename(source_tree / 'a' / 'good.c')
+    units[0] = TranslationUnit(str(source_tree / 'a'), ('x.c', 'good.c'), ())
+    assert extract()[1:] == (1, 1)
+    assert extract() == ([[('good', 'helper'), ('x', 'helper')], [('y', 'helper')]], 2, 0)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+複数のビルド設定をまとめたグラフ (ConfigGraph、cflow2dot.py の複数入力と --select-config、
+split_dots_with_main_suffix_nodes.py --config) のテスト。
+"""
+
+import re
+
+import numpy as np
+import pytest
+
+from callgraph_core import MAX_CONFIGS, ConfigGraph
+from conftest import dot_edges, run_script
+from split_dots_with_main_suffix_nodes import parse_dotfile
+
+CONFIG_EDGES = {
+    'posix': [('main', 'OpenPort'), ('OpenPort', 'PosixOpen'), ('main', 'Lock'),
+              ('OpenPort', 'PosixOpen')],
+    'win32': [('main', 'OpenPort'), ('OpenPort', 'WinOpen'), ('main', 'Lock')],
+    'debug': [('main', 'Lock'), ('Lock', 'CheckLock')],
+}
+
+CONFIG_TREES = {
+    'posix': '    1 main: <>\n'
+             '    2     OpenPort: <>\n'
+             '    3         PosixOpen: <>\n'
+             '    4     Lock: <>\n'
+             '    5     OpenPort: 2\n',
+    'win32': '    1 main: <>\n'
+             '    2     OpenPort: <>\n'
+             '    3         WinOpen: <>\n'
+             '    4     Lock: <>\n',
+}
+
+EDGE_MASK_RE = re.compile(r'^    "([^"]+)" -> "([^"]+)" \[configs=(\d+)\];$')
+
+
+def build_config_graph():
+    graph = ConfigGraph()
+    for name, edges in CONFIG_EDGES.items():
+        graph.add_config(name, edges)
+    return graph
+
+
+def expected_masks(configs):
+    masks = {}
+    for bit, name in enumerate(configs):
+        for edge in CONFIG_EDGES[name]:
+            masks[edge] = masks.get(edge, 0) | (1 << bit)
+    return masks
+
+
+def test_config_graph_masks():
+    graph = build_config_graph()
+    assert graph.configs == ['posix', 'win32', 'debug']
+    assert graph.all_mask == 0b111
+    assert len(graph) == 5
+    assert np.all(np.diff(graph.edges) > 0)
+    assert {(src, dst): mask for src, dst, mask in graph.iter_edges()} == \
+        expected_masks(graph.configs)
+
+
+@pytest.mark.parametrize('names, require_all, expected', [
+    (['posix'], False, {('main', 'OpenPort'), ('OpenPort', 'PosixOpen'), ('main', 'Lock')}),
+    (['win32', 'debug'], False, {('main', 'OpenPort'), ('OpenPort', 'WinOpen'), ('main', 'Lock'),
+                                 ('Lock', 'CheckLock')}),
+    (['posix', 'win32'], True, {('main', 'OpenPort'), ('main', 'Lock')}),
+    (['posix', 'win32', 'debug'], True, {('main', 'Lock')}),
+])
+def test_config_graph_select(names, require_all, expected):
+    graph = build_config_graph()
+    mask = graph.mask_of(names)
+    edges, masks = graph.select(mask, require_all)
+    assert len(edges) == len(masks) == len(expected)
+    assert {(src, dst) for src, dst, _ in graph.iter_edges(mask, require_all)} == expected
+
+
+def test_config_graph_errors():
+    graph = build_config_graph()
+    with pytest.raises(ValueError, match='duplicate config name'):
+        graph.add_config('posix', [])
+    with pytest.raises(ValueError, match='unknown config'):
+        graph.mask_of(['posix', 'aix'])
+
+    graph = ConfigGraph()
+    for i in range(MAX_CONFIGS):
+        assert graph.add_config(f'c{i}', [('main', f'F{i}')]) == i
+    assert int(graph.masks.max()) == 1 << (MAX_CONFIGS - 1)
+    with pytest.raises(ValueError, match='too many configs'):
+        graph.add_config('one_more', [])
+
+
+@pytest.fixture
+def config_outputs(tmp_path):
+    paths = {}
+    for name, text in CONFIG_TREES.items():
+        paths[name] = tmp_path / f'{name}.txt'
+        paths[name].write_text(text)
+    return paths
+
+
+def cli_edge_masks(out: str):
+    return {(m.group(1), m.group(2)): int(m.group(3))
+            for m in map(EDGE_MASK_RE.match, out.splitlines()) if m}
+
+
+def test_cli_merges_configs(config_outputs):
+    out = run_script('cflow2dot.py', config_outputs['posix'],
+                     f"win={config_outputs['win32']}").stdout.decode('utf-8')
+    assert '    graph [configs="posix,win"];' in out.splitlines()
+    assert cli_edge_masks(out) == {
+        ('main', 'OpenPort'): 3, ('OpenPort', 'PosixOpen'): 1, ('main', 'Lock'): 3,
+        ('OpenPort', 'WinOpen'): 2}
+
+
+def test_cli_select_config(config_outputs):
+    out = run_script('cflow2dot.py', config_outputs['posix'], config_outputs['win32'],
+                     '--select-config', 'win32').stdout.decode('utf-8')
+    assert set(dot_edges(out)) == {('main', 'OpenPort'), ('OpenPort', 'WinOpen'), ('main', 'Lock')}
+    # 設定名とビット番号は絞り込んでも変わらない
+    assert '    graph [configs="posix,win32"];' in out.splitlines()
+
+
+@pytest.mark.parametrize('select, message', [
+    ('aix', b'unknown config: aix'),
+    (None, b'duplicate config name: posix'),
+])
+def test_cli_config_errors(config_outputs, select, message):
+    if select is None:
+        args = [config_outputs['posix'], config_outputs['posix']]
+    else:
+        args = [config_outputs['posix'], config_outputs['win32'], '--select-config', select]
+    result = run_script('cflow2dot.py', *args, check=False)
+    assert result.returncode == 1
+    assert message in result.stderr
+
+
+def test_cli_select_config_needs_several_outputs(config_outputs):
+    result = run_script('cflow2dot.py', config_outputs['posix'], '--select-config', 'posix',
+                        check=False)
+    assert result.returncode == 1
+    assert b'--select-config needs two or more cflow outputs' in result.stderr
+
+
+@pytest.mark.parametrize('config, expected', [
+    ('posix', {('main', 'OpenPort'), ('OpenPort', 'PosixOpen'), ('main', 'Lock')}),
+    ('win32', {('main', 'OpenPort'), ('OpenPort', 'WinOpen'), ('main', 'Lock')}),
+    ('posix,win32', {('main', 'OpenPort'), ('OpenPort', 'PosixOpen'), ('OpenPort', 'WinOpen'),
+                     ('main', 'Lock')}),
+])
+def test_splitter_config(config_outputs, tmp_path, config, expected):
+    merged = tmp_path / 'merged.dot'
+    run_script('cflow2dot.py', config_outputs['posix'], config_outputs['win32'], '-o', merged)
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    run_script('split_dots_with_main_suffix_nodes.py', merged, '--config', config, cwd=out_dir)
+    assert set(parse_dotfile(str(out_dir / 'main.dot'))) == expected
+
+
+def test_splitter_unknown_config(config_outputs, tmp_path):
+    merged = tmp_path / 'merged.dot'
+    run_script('cflow2dot.py', config_outputs['posix'], config_outputs['win32'], '-o', merged)
+    result = run_script('split_dots_with_main_suffix_nodes.py', merged, '--config', 'aix',
+                        cwd=tmp_path, check=False)
+    assert result.returncode == 1
+    assert b'Unknown config: aix (available: posix, win32)' in result.stdout
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+cflow2dot.py の方言 (GNU / POSIX、行番号の有無、インデント幅) の判定と方言別パーサのテスト。
+
+tests/data/sample_posix.txt を各方言の書き方に描き直し、
+どの方言でも元と同じ (インデントレベル, 関数名) の列とエッジになることを確かめる。
+"""
+
+import pytest
+
+import cflow2dot
+from conftest import baseline_parse_cflow_line, dot_edges, run_script
+
+
+def sample_nodes(sample_cflow):
+    """
+    sample_posix.txt の各行を (レベル, 関数名, 宣言, ファイル, 行番号, 参照先) にする。
+    """
+    nodes = []
+    with open(sample_cflow, encoding='utf-8') as f:
+        for line in f:
+            level, name = baseline_parse_cflow_line(line)
+            tail = line.partition(':')[2].strip()
+            ref = int(tail) if tail.isdigit() else None
+            decl = tail.partition(', <')[0] if ', <' in tail else ''
+            file, def_line = cflow2dot.parse_cflow_location(line)
+            nodes.append((level, name, decl, file, def_line, ref))
+    return nodes
+
+
+def render(nodes, style, numbered, indent_width):
+    """
+    nodes を cflow の style 形式 (--number なら行番号つき、--level-indent は indent_width) で書く。
+    """
+    lines = []
+    for i, (level, name, decl, file, def_line, ref) in enumerate(nodes):
+        has_children = i + 1 < len(nodes) and nodes[i + 1][0] > level
+        if style == 'gnu':
+            text = name + '()'
+            if file is not None:
+                text += f' <{decl} at {file}:{def_line}>'
+            if ref is not None:
+                text += f' [see {ref}]'
+            elif has_children:
+                text += ':'
+        elif ref is not None:
+            text = f'{name}: {ref}'
+        elif file is not None:
+            text = f'{name}: {decl}, <{file} {def_line}>'
+        else:
+            text = f'{name}: <>'
+        text = ' ' * (indent_width * level) + text
+        if numbered:
+            text = f'{i + 1:5d} {text}'
+        lines.append(text + '\n')
+    return ''.join(lines)
+
+
+DIALECTS = [(style, numbered, width)
+            for style in ('posix', 'gnu') for numbered in (True, False) for width in (2, 4, 8)]
+
+
+@pytest.fixture(params=DIALECTS, ids=lambda d: '%s-%s-%d' % (d[0], 'n' if d[1] else 'plain', d[2]))
+def dialect_file(request, sample_cflow, tmp_path):
+    style, numbered, width = request.param
+    path = tmp_path / 'cflow.txt'
+    path.write_text(render(sample_nodes(sample_cflow), style, numbered, width))
+    return str(path), cflow2dot.CflowDialect(style, numbered, 1 if numbered else 0, width)
+
+
+def test_render_reproduces_sample(sample_cflow):
+    with open(sample_cflow, encoding='utf-8') as f:
+        assert render(sample_nodes(sample_cflow), 'posix', True, 4) == f.read()
+
+
+def test_detect_cflow_dialect(dialect_file):
+    path, expected = dialect_file
+    assert cflow2dot.detect_cflow_dialect(path) == expected
+
+
+def test_dialect_parser_matches_sample(sample_cflow, dialect_file):
+    path, dialect = dialect_file
+    expected = list(cflow2dot.open_cflow_entries(sample_cflow))
+    assert list(cflow2dot.open_cflow_entries(path, dialect=dialect)) == expected
+
+
+def test_dialect_backrefs_and_locations(sample_cflow, dialect_file):
+    path, dialect = dialect_file
+    nodes = list(cflow2dot.iter_cflow_nodes(path, dialect=dialect))
+    expected = list(cflow2dot.iter_cflow_nodes(sample_cflow))
+    if dialect.numbered:
+        assert nodes == expected
+        assert cflow2dot.check_backrefs(path, dialect) == (7, [])
+    else:
+        assert [(node.indent_level, node.func_name) for node in nodes] == \
+            [(node.indent_level, node.func_name) for node in expected]
+        assert all(node.line_number is None for node in nodes)
+
+
+def test_cli_dialects_produce_identical_dot(sample_cflow, dialect_file):
+    path, _ = dialect_file
+    expected = run_script('cflow2dot.py', sample_cflow).stdout
+    assert run_script('cflow2dot.py', path).stdout == expected
+    assert run_script('cflow2dot.py', path, '-j', '2').stdout == expected
+
+
+def test_detect_cflow_dialect_defaults():
+    assert cflow2dot.detect_cflow_dialect_lines([]) == cflow2dot.DEFAULT_DIALECT
+    assert cflow2dot.detect_cflow_dialect_lines([b'\n', b'   \n']) == cflow2dot.DEFAULT_DIALECT
+    # 子を持たない 1 行だけでは幅が分からないので 4 とする
+    assert cflow2dot.detect_cflow_dialect_lines([b'main() <int main (void) at m.c:3>\n']) == \
+        cflow2dot.CflowDialect('gnu', False, 0, 4)
+
+
+def test_make_cflow_bytes_parser_default_is_parse_cflow_bytes():
+    assert cflow2dot.make_cflow_bytes_parser() is cflow2dot.parse_cflow_bytes
+
+
+def test_regex_parser_rejects_other_dialects(sample_cflow, tmp_path):
+    path = tmp_path / 'gnu.txt'
+    path.write_text(render(sample_nodes(sample_cflow), 'gnu', False, 4))
+    result = run_script('cflow2dot.py', path, '--parser', 'regex', check=False)
+    assert result.returncode == 1
+    assert b'regex parser does not support' in result.stderr
+    assert dot_edges(run_script('cflow2dot.py', path).stdout.decode('utf-8'))
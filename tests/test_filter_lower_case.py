@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+filter_lower_case_symbols_from_dots.py と、同じ規則をパース中に適用する
+cflow2dot.py --filter-lower-case のテスト。
+"""
+
+import re
+
+import pytest
+
+from conftest import baseline_cflow_edges, data_path, dot_edges, run_script
+from filter_lower_case_symbols_from_dots import should_remove_edge, should_remove_line
+
+
+def baseline_should_remove_line(line):
+    # 最初の版の filter_lower_case_symbols_from_dots.should_remove_line()
+    match = re.match(r'\s*"([^"]+)"\s*->\s*"([^"]+)"', line)
+    if match:
+        left, right = match.groups()
+        if left == "main" or right == "main":
+            return False
+        return left[0].islower() or right[0].islower() or left == "Assert" or right == "Assert"
+    return False
+
+
+@pytest.mark.parametrize('src, dst, removed', [
+    ('main', 'pg_strdup', False),
+    ('setvbuf', 'main', False),
+    ('PostgresMain', 'InitPostgres', False),
+    ('InitPostgres', 'Assert', True),
+    ('Assert', 'InitPostgres', True),
+    ('ProcessInterrupts', 'ereport', True),
+    ('get_progname', 'LastDir', True),
+])
+def test_should_remove_edge(src, dst, removed):
+    assert should_remove_edge(src, dst) is removed
+    line = f'    "{src}" -> "{dst}";\n'
+    assert should_remove_line(line) is removed is baseline_should_remove_line(line)
+
+
+def test_should_remove_line_handles_node_attributes():
+    assert should_remove_line('    "pg_strdup" [file="a.c", line=3];\n')
+    assert should_remove_line('    "Assert" [file="a.c", line=3];\n')
+    assert not should_remove_line('    "main" [file="main.c", line=58];\n')
+    assert not should_remove_line('    "InitPostgres" [file="a.c", line=3];\n')
+    assert not should_remove_line('digraph cflow {\n')
+
+
+@pytest.fixture(params=['sample_cflow', 'synth_cflow'])
+def cflow_input(request):
+    return request.getfixturevalue(request.param)
+
+
+def filtered_by_script(dot_path):
+    return run_script('filter_lower_case_symbols_from_dots.py', dot_path).stdout.decode('utf-8')
+
+
+@pytest.mark.parametrize('extra', [[], ['-j', '3'], ['--parser', 'regex'], ['--dedupe', 'sort']])
+def test_cli_filter_matches_filter_script(cflow_input, tmp_path, extra):
+    dot_path = tmp_path / 'full.dot'
+    dot_path.write_bytes(run_script('cflow2dot.py', cflow_input).stdout)
+    expected = filtered_by_script(dot_path)
+
+    out = run_script('cflow2dot.py', cflow_input, '--filter-lower-case', *extra).stdout
+    edges = dot_edges(out.decode('utf-8'))
+    assert len(edges) == len(set(edges))
+    assert set(edges) == set(dot_edges(expected))
+    assert set(edges) == {edge for edge in baseline_cflow_edges(cflow_input)
+                          if not baseline_should_remove_line('"%s" -> "%s"' % edge)}
+
+
+def test_filter_script_keeps_main_edges_first(sample_cflow, tmp_path):
+    dot_path = tmp_path / 'full.dot'
+    dot_path.write_bytes(run_script('cflow2dot.py', sample_cflow).stdout)
+    lines = filtered_by_script(dot_path).splitlines()
+    edge_lines = [line for line in lines if '->' in line]
+    main_lines = [line for line in edge_lines if '"main"' in line]
+    assert edge_lines[:len(main_lines)] == main_lines
+    assert '    "main" -> "pgwin32_install_crashdump_handler";' in main_lines
+    assert lines[-1] == '}'
+
+
+def test_cli_filter_on_xref():
+    out = run_script('cflow2dot.py', data_path('xref/ops.xref'), '--filter-lower-case',
+                     cwd=data_path('xref')).stdout.decode('utf-8')
+    # main 以外は小文字で始まるので、main からのエッジだけが残る
+    assert set(dot_edges(out)) == {('main', 'run'), ('main', 'stop'), ('main', 'helper')}
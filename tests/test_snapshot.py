@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+graph_snapshot (cflow2dot.py --snapshot) の符号化・読み書きと、
+フィルタ / 分割スクリプトがスナップショットを DOT と同じように読めることのテスト。
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import graph_snapshot
+from callgraph_core import CallGraph, ExternalEdgeSorter, NodeAttrTable
+from conftest import data_path, run_script
+from graph_snapshot import (
+    GraphSnapshot,
+    decode_varints,
+    encode_varints,
+    is_snapshot,
+    write_snapshot,
+    write_snapshot_stream,
+)
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [0],
+    [127, 128, 255, 16383, 16384],
+    [2 ** 32 - 1, 2 ** 40, 2 ** 62, 0, 1],
+])
+def test_varint_round_trip(values):
+    data = encode_varints(values)
+    assert decode_varints(data.tobytes()).tolist() == values
+
+
+def test_varint_random_round_trip():
+    rng = np.random.default_rng(0)
+    values = (rng.integers(0, 2 ** 20, size=5000) >> rng.integers(0, 20, size=5000)).tolist()
+    data = encode_varints(values)
+    # 1 バイトに 7 ビット
+    assert len(data) == sum(max(1, (v.bit_length() + 6) // 7) for v in values)
+    assert decode_varints(data).tolist() == values
+
+
+def random_graph(n=3000, names=200, seed=0):
+    rng = np.random.default_rng(seed)
+    edges = [(f'F{src}', f'F{dst}') for src, dst in rng.integers(0, names, size=(n, 2)).tolist()]
+    # エッジのない関数も混ぜる
+    graph = CallGraph()
+    for i in range(0, names + 20, 7):
+        graph.symbols.intern(f'F{i}')
+    graph.add_edges(edges)
+    return graph, edges
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # ブロックの境目をまたぐ経路を通す
+    monkeypatch.setattr(graph_snapshot, 'SNAPSHOT_BLOCK', 97)
+
+
+def test_snapshot_round_trip(tmp_path, small_blocks):
+    graph, _ = random_graph()
+    attrs = NodeAttrTable()
+    attrs.set('F3', 'a.c', 10)
+    attrs.set('F7', 'b.c', 20)
+    attrs.set('unused', 'c.c', 30)
+    path = str(tmp_path / 'graph.cgs')
+    write_snapshot(path, graph, attrs, counted=True)
+
+    assert is_snapshot(path) and not is_snapshot(data_path('sample_posix.txt'))
+    with GraphSnapshot(path) as snapshot:
+        assert (snapshot.num_nodes, len(snapshot)) == (graph.num_nodes, len(graph))
+        assert snapshot.has_counts and snapshot.has_node_attrs
+        assert snapshot.names() == graph.symbols.names
+        assert list(snapshot.iter_counted_edges()) == list(graph.iter_counted_edges())
+        assert list(snapshot.iter_edges()) == list(graph.iter_edges())
+        assert snapshot.packed_edges().tolist() == graph.edges.tolist()
+        src_ids, dst_ids = graph.edge_ids()
+        f3 = graph.symbols.get('F3')
+        assert snapshot.successors(f3) == dst_ids[src_ids == f3].tolist()
+        assert snapshot.id_of('F3') == f3 and snapshot.id_of('missing') is None
+        assert sorted(snapshot.iter_node_attrs()) == [('F3', 'a.c', 10), ('F7', 'b.c', 20)]
+
+
+def test_snapshot_without_counts_or_attrs(tmp_path):
+    graph, _ = random_graph(seed=1)
+    path = str(tmp_path / 'graph.cgs')
+    write_snapshot(path, graph)
+    with GraphSnapshot(path) as snapshot:
+        assert not snapshot.has_counts and not snapshot.has_node_attrs
+        assert list(snapshot.iter_counted_edges()) == \
+            [(src, dst, 1) for src, dst in graph.iter_edges()]
+        assert list(snapshot.iter_node_attrs()) == []
+
+
+def test_stream_writer_matches_call_graph(tmp_path, small_blocks):
+    graph, edges = random_graph(seed=2)
+    write_snapshot(str(tmp_path / 'graph.cgs'), graph, counted=True)
+    with ExternalEdgeSorter(symbols=graph.symbols, memory_limit=1) as sorter:
+        sorter.add_edges(edges)
+        write_snapshot_stream(str(tmp_path / 'stream.cgs'), sorter.symbols,
+                              sorter.iter_counted_ids(), counted=True, tmp_dir=str(tmp_path))
+    assert (tmp_path / 'stream.cgs').read_bytes() == (tmp_path / 'graph.cgs').read_bytes()
+
+
+def test_close_does_not_hide_held_views(tmp_path):
+    graph, _ = random_graph(seed=3)
+    path = str(tmp_path / 'graph.cgs')
+    write_snapshot(path, graph)
+    snapshot = GraphSnapshot(path)
+    lines = snapshot.lines
+    with pytest.raises(BufferError):
+        snapshot.close()
+    del lines
+    snapshot.close()
+
+
+@pytest.fixture
+def snapshot_dir(synth_cflow, tmp_path):
+    for dedupe in ('stream', 'sort', 'external'):
+        run_script('cflow2dot.py', synth_cflow, '--dedupe', dedupe, '--memory-limit', '64K',
+                   '--snapshot', tmp_path / f'{dedupe}.cgs', '-o', tmp_path / f'{dedupe}.dot')
+    return tmp_path
+
+
+def test_cli_snapshot_is_the_same_for_every_dedupe(snapshot_dir):
+    sort = (snapshot_dir / 'sort.cgs').read_bytes()
+    assert (snapshot_dir / 'stream.cgs').read_bytes() == sort
+    assert (snapshot_dir / 'external.cgs').read_bytes() == sort
+    # external の DOT はスナップショットを読み返したもので、sort と同じ順
+    assert (snapshot_dir / 'external.dot').read_bytes() == (snapshot_dir / 'sort.dot').read_bytes()
+    # stream は見つけた順のまま
+    stream = (snapshot_dir / 'stream.dot').read_text().splitlines()
+    assert stream != (snapshot_dir / 'sort.dot').read_text().splitlines()
+    assert sorted(stream) == sorted((snapshot_dir / 'sort.dot').read_text().splitlines())
+
+
+def test_filter_reads_snapshot_like_dot(snapshot_dir):
+    from_dot = run_script('filter_lower_case_symbols_from_dots.py', snapshot_dir / 'sort.dot')
+    from_snapshot = run_script('filter_lower_case_symbols_from_dots.py', snapshot_dir / 'sort.cgs')
+    assert from_snapshot.stdout == from_dot.stdout
+    assert b'[file=' not in from_snapshot.stdout
+
+
+def test_filter_emits_node_attrs_only_from_located_snapshot(synth_cflow, tmp_path):
+    run_script('cflow2dot.py', synth_cflow, '--locations', '--snapshot', tmp_path / 'loc.cgs',
+               '-o', tmp_path / 'loc.dot')
+    from_dot = run_script('filter_lower_case_symbols_from_dots.py', tmp_path / 'loc.dot')
+    from_snapshot = run_script('filter_lower_case_symbols_from_dots.py', tmp_path / 'loc.cgs')
+    dot_lines = from_dot.stdout.decode('utf-8').splitlines()
+    snapshot_lines = from_snapshot.stdout.decode('utf-8').splitlines()
+    assert any('[file=' in line for line in snapshot_lines)
+    # ノード属性の行の順は関数 ID の順なので、集合で比べる
+    assert sorted(snapshot_lines) == sorted(dot_lines)
+
+
+def split_outputs(input_path, out_dir, *args):
+    out_dir.mkdir()
+    run_script('split_dots_with_main_suffix_nodes.py', input_path, *args, cwd=out_dir)
+    return {name: (out_dir / name).read_bytes() for name in sorted(os.listdir(out_dir))}
+
+
+@pytest.mark.parametrize('args', [(), ('--depth', '1,3'), ('-j', '2'), ('--bfs', 'root')])
+def test_splitter_reads_snapshot_like_dot(snapshot_dir, tmp_path, args):
+    from_dot = split_outputs(snapshot_dir / 'sort.dot', tmp_path / 'dot', *args)
+    from_snapshot = split_outputs(snapshot_dir / 'sort.cgs', tmp_path / 'cgs', *args)
+    assert from_dot and from_snapshot == from_dot
+
+
+@pytest.mark.parametrize('args', [(), ('-j', '2')])
+def test_splitter_keeps_counts_from_snapshot(tmp_path, args):
+    xref_dir = data_path('xref')
+    run_script('cflow2dot.py', data_path('xref/ops.xref'), '--counts', '--snapshot',
+               tmp_path / 'ops.cgs', '-o', tmp_path / 'ops.dot', cwd=xref_dir)
+    from_dot = split_outputs(tmp_path / 'ops.dot', tmp_path / 'dot', *args)
+    from_snapshot = split_outputs(tmp_path / 'ops.cgs', tmp_path / 'cgs', *args)
+    assert from_snapshot == from_dot
+
+
+def test_splitter_rejects_config_on_snapshot(snapshot_dir):
+    result = run_script('split_dots_with_main_suffix_nodes.py', snapshot_dir / 'sort.cgs',
+                        '--config', 'posix', cwd=snapshot_dir, check=False)
+    assert result.returncode == 1
+    assert b'--config needs a DOT' in result.stdout
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+split_dots_with_main_suffix_nodes.py (CSR のグラフと部分グラフの切り出し) のテスト。
+結果は conftest.baseline_split_subgraphs() (最初の版の networkx を使った処理の写し) と突き合わせる。
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import split_dots_with_main_suffix_nodes as split
+from callgraph_core import CsrGraph
+from conftest import baseline_split_subgraphs, run_script
+
+
+@pytest.fixture(scope='module')
+def synth_dot(synth_cflow, tmp_path_factory):
+    path = tmp_path_factory.mktemp('split') / 'synth.dot'
+    run_script('cflow2dot.py', synth_cflow, '-o', path)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def synth_edges(synth_dot):
+    return split.parse_dotfile(synth_dot)
+
+
+def expected_dot(root, edges):
+    lines = ["digraph cflow {", "    rankdir=TB;", "    node [shape=box];", "    overlap=false;",
+             "    splines=true;", f"    root=\"{root}\";", ""]
+    lines += [f"    \"{src}\" -> \"{dst}\";" for src, dst in edges]
+    return "\n".join(lines) + "\n}\n"
+
+
+def split_outputs(input_path, out_dir, *args):
+    out_dir.mkdir()
+    result = run_script('split_dots_with_main_suffix_nodes.py', input_path, *args, cwd=out_dir)
+    files = {name: (out_dir / name).read_text(encoding='utf-8') for name in sorted(os.listdir(out_dir))}
+    return files, result.stdout.decode('utf-8').splitlines()
+
+
+def test_csr_from_edges_dedupes_in_input_order():
+    edges = [('c', 'a'), ('a', 'b'), ('c', 'b'), ('a', 'b'), ('c', 'a')]
+    graph = CsrGraph.from_edges(edges)
+    assert graph.names == ['c', 'a', 'b']
+    assert graph.num_edges == 3
+    assert graph.successors(0).tolist() == [1, 2]
+    assert graph.targets.dtype == graph.positions.dtype == np.int32
+    # CSR (親ごと) の並びの各エッジが、重複を除いた入力の何番目か
+    assert graph.positions.tolist() == [0, 2, 1]
+    assert graph.nbytes() == graph.offsets.nbytes + 8 * graph.num_edges
+
+
+@pytest.mark.parametrize('hops', [0, 1, 3, 5])
+def test_collect_subgraph_nodes_matches_baseline(synth_edges, hops):
+    graph = split.build_digraph(synth_edges)
+    expected = baseline_split_subgraphs(synth_edges, hops)
+    assert split.find_root_candidates(graph) == list(expected)
+    for root, sub_edges in expected.items():
+        sub_nodes = split.collect_subgraph_nodes_up_to_3_hops(graph, root, hops)
+        assert split.filter_sub_edges(None, sub_nodes, root, graph) == sub_edges
+
+
+def test_filter_sub_edges_builds_graph_when_omitted(synth_edges):
+    graph = split.build_digraph(synth_edges)
+    for root in split.find_root_candidates(graph):
+        sub_nodes = split.collect_subgraph_nodes_up_to_3_hops(graph, root)
+        assert split.filter_sub_edges(synth_edges, sub_nodes, root) == \
+            split.filter_sub_edges(synth_edges, sub_nodes, root, graph)
+
+
+def test_ignored_root_has_no_nodes():
+    graph = split.build_digraph([('helper', 'Foo'), ('main', 'helper')])
+    assert split.collect_subgraph_nodes_up_to_3_hops(graph, 'helper') == set()
+    assert split.collect_subgraph_nodes_up_to_3_hops(graph, 'main') == {'main'}
+
+
+@pytest.mark.parametrize('args', [(), ('--bfs', 'root')])
+def test_cli_matches_baseline(synth_dot, synth_edges, tmp_path, args):
+    files, stdout = split_outputs(synth_dot, tmp_path / 'out', *args)
+    expected = baseline_split_subgraphs(synth_edges)
+    assert files == {f'{root}.dot': expected_dot(root, edges) for root, edges in expected.items()}
+    assert stdout == [f'Generated: {root}.dot' for root in expected]
+
+
+def test_cli_collapses_duplicate_edges(tmp_path):
+    dot = tmp_path / 'dup.dot'
+    dot.write_text('digraph cflow {\n'
+                   '    "main" -> "Init";\n'
+                   '    "Init" -> "Load";\n'
+                   '    "main" -> "Init";\n'
+                   '}\n', encoding='utf-8')
+    files, _ = split_outputs(dot, tmp_path / 'out')
+    assert files == {'main.dot': expected_dot('main', [('main', 'Init'), ('Init', 'Load')])}
+
+
+def test_out_edge_index_lists_only_frontier_edges():
+    graph = split.build_digraph([('A', 'B'), ('B', 'C'), ('A', 'C'), ('C', 'A'), ('B', 'D')])
+    a, b, c = graph.node_id('A'), graph.node_id('B'), graph.node_id('C')
+    index = graph.out_edge_index(np.array([b, a], dtype=np.int64))
+    assert sorted(zip(graph.edge_sources(index).tolist(), graph.targets[index].tolist())) == \
+        [(a, b), (a, c), (b, c), (b, graph.node_id('D'))]
+    assert graph.out_edge_index(np.array([], dtype=np.int64)).tolist() == []
+    assert graph.expand(np.array([c], dtype=np.int64)).tolist() == [a]
+
+
+def test_induced_sub_edges_keeps_input_order_and_stops_at_other_mains():
+    edges = [('main', 'WorkerMain'), ('WorkerMain', 'Loop'), ('Init', 'Load'), ('main', 'Init'),
+             ('Load', 'Init'), ('main', 'Other')]
+    graph = split.build_digraph(edges)
+    inside = np.zeros(graph.num_nodes, dtype=bool)
+    inside[[graph.node_id(n) for n in ('main', 'WorkerMain', 'Loop', 'Init', 'Load')]] = True
+    assert split.induced_sub_edges(inside, 'main', graph) == \
+        [('main', 'WorkerMain'), ('Init', 'Load'), ('main', 'Init'), ('Load', 'Init')]
+    assert split.induced_sub_edges(inside, 'WorkerMain', graph)[:2] == \
+        [('main', 'WorkerMain'), ('WorkerMain', 'Loop')]
+
+
+def many_roots_edges(roots=150, names=400, n=3000, seed=0):
+    # 64 を超えるルート (ビット集合が 2 語以上) と、小文字始まりのノードを混ぜる
+    rng = np.random.default_rng(seed)
+    nodes = [f'Worker{i}Main' for i in range(roots)] + \
+        [f'F{i}' if i % 9 else f'f{i}' for i in range(names)] + ['main']
+    pairs = rng.integers(0, len(nodes), size=(n, 2)).tolist()
+    edges = list(dict.fromkeys((nodes[s], nodes[t]) for s, t in pairs if s != t))
+    return [('main', nodes[0])] + edges
+
+
+@pytest.mark.parametrize('hops', [0, 1, 2, 3])
+def test_sweep_matches_per_root_bfs_and_baseline(hops):
+    edges = many_roots_edges()
+    graph = split.build_digraph(edges)
+    roots = split.find_root_candidates(graph)
+    assert len(roots) > 128
+    visited = split.collect_all_subgraph_nodes(graph, roots, hops)
+    assert visited.shape == (graph.num_nodes, (len(roots) + 63) // 64)
+    expected = baseline_split_subgraphs(edges, hops)
+    for i, root in enumerate(roots):
+        inside = split.subgraph_mask(visited, i)
+        assert np.array_equal(inside, split.root_subgraph_mask(graph, graph.node_id(root), hops))
+        assert split.induced_sub_edges(inside, root, graph) == expected[root]
+
+
+def test_sweep_levels_partition_visited():
+    edges = many_roots_edges(seed=1)
+    graph = split.build_digraph(edges)
+    roots = split.find_root_candidates(graph)
+    levels = []
+    visited = split.collect_all_subgraph_nodes(graph, roots, 3, levels)
+    # 各ルートのビットは、ちょうど 1 つの深さで立つ
+    seen = np.zeros_like(visited)
+    for ids, bits in levels:
+        assert not (seen[ids] & bits).any()
+        seen[ids] |= bits
+    assert np.array_equal(seen, visited)
+
+
+def test_sweep_skips_unknown_and_ignored_roots():
+    graph = split.build_digraph([('main', 'A'), ('lowerMain', 'B')])
+    visited = split.collect_all_subgraph_nodes(graph, ['main', 'missingMain', 'lowerMain'])
+    assert [graph.names[n] for n in np.flatnonzero(split.subgraph_mask(visited, 0))] == ['main', 'A']
+    assert not split.subgraph_mask(visited, 1).any()
+    assert not split.subgraph_mask(visited, 2).any()
+
+
+def test_cli_sweep_matches_root_bfs_with_many_roots(tmp_path):
+    edges = many_roots_edges(seed=2)
+    dot = tmp_path / 'many.dot'
+    dot.write_text('digraph cflow {\n' + ''.join(f'    "{s}" -> "{t}";\n' for s, t in edges) + '}\n',
+                   encoding='utf-8')
+    sweep, _ = split_outputs(dot, tmp_path / 'sweep', '--bfs', 'sweep')
+    per_root, _ = split_outputs(dot, tmp_path / 'root', '--bfs', 'root')
+    assert len(sweep) > 128 and sweep == per_root
+
+
+def shm_entries():
+    return set(os.listdir('/dev/shm'))
+
+
+needs_dev_shm = pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="needs /dev/shm")
+
+
+class BrokenArray:
+    """
+    配置は決められるが、中身を共有メモリに写すところで失敗する配列もどき。
+    """
+    dtype = np.dtype(np.int64)
+    shape = (4,)
+    nbytes = 32
+
+    def __array__(self, dtype=None, copy=None):
+        raise RuntimeError("broken")
+
+
+@needs_dev_shm
+def test_share_arrays_round_trip_and_unlink_on_failure():
+    before = shm_entries()
+    arrays = {"a": np.arange(5, dtype=np.int64), "b": np.array([1, 2, 3], dtype=np.int32),
+              "empty": np.empty(0, dtype=np.uint8)}
+    shm, layout = split.share_arrays(arrays)
+    try:
+        other, shared = split.attach_arrays(shm.name, layout)
+        assert all(np.array_equal(shared[name], arrays[name]) for name in arrays)
+        del shared
+        other.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+    with pytest.raises(RuntimeError):
+        split.share_arrays({"a": np.arange(3), "bad": BrokenArray()})
+    assert shm_entries() == before
+
+
+@needs_dev_shm
+@pytest.mark.parametrize('sweep', [False, True])
+def test_write_subgraphs_parallel_matches_sequential(synth_edges, tmp_path, monkeypatch, sweep):
+    graph = split.build_digraph(synth_edges)
+    roots = split.find_root_candidates(graph)
+    index = split.DistanceIndex.build(graph, roots, 3) if sweep else None
+    before = shm_entries()
+    monkeypatch.chdir(tmp_path)
+    written = list(split.write_subgraphs_parallel(graph, {}, roots, 2, [3], index))
+    assert sorted(written) == sorted(f'{root}.dot' for root in roots)
+    expected = baseline_split_subgraphs(synth_edges)
+    for root in roots:
+        assert (tmp_path / f'{root}.dot').read_text(encoding='utf-8') == expected_dot(root, expected[root])
+    assert shm_entries() == before
+
+
+@needs_dev_shm
+def test_write_subgraphs_parallel_unlinks_when_closed_early(synth_edges, tmp_path, monkeypatch):
+    graph = split.build_digraph(synth_edges)
+    roots = split.find_root_candidates(graph)
+    before = shm_entries()
+    monkeypatch.chdir(tmp_path)
+    results = split.write_subgraphs_parallel(graph, {}, roots, 2, [3])
+    assert next(results) in {f'{root}.dot' for root in roots}
+    results.close()
+    assert shm_entries() == before
+
+
+@pytest.mark.parametrize('args', [(), ('--bfs', 'root'), ('--depth', '2,4')])
+def test_cli_jobs_matches_sequential(synth_dot, tmp_path, args):
+    sequential, sequential_stdout = split_outputs(synth_dot, tmp_path / 'seq', *args)
+    parallel, parallel_stdout = split_outputs(synth_dot, tmp_path / 'par', '-j', '3', *args)
+    assert parallel == sequential
+    # 書き終わった順に出すので、並びは実行ごとに変わりうる
+    assert sorted(parallel_stdout) == sorted(sequential_stdout)
+
+
+def test_distance_index_matches_per_root_bfs(synth_edges):
+    graph = split.build_digraph(synth_edges)
+    roots = split.find_root_candidates(graph)
+    index = split.DistanceIndex.build(graph, roots, 5)
+    for depth in range(6):
+        for i, root in enumerate(roots):
+            expected = np.flatnonzero(split.root_subgraph_mask(graph, graph.node_id(root), depth))
+            assert np.array_equal(np.sort(index.node_ids(i, depth)), expected)
+            assert np.array_equal(index.mask(i, depth, graph.num_nodes),
+                                  split.root_subgraph_mask(graph, graph.node_id(root), depth))
+    with pytest.raises(ValueError, match='exceeds the index depth 5'):
+        index.node_ids(0, 6)
+
+
+def test_distance_index_cache_is_reused_until_the_key_changes(tmp_path, monkeypatch):
+    edges = many_roots_edges(roots=20, seed=3)
+    graph = split.build_digraph(edges)
+    roots = split.find_root_candidates(graph)
+    path = str(tmp_path / 'index.npz')
+    built = split.get_distance_index(graph, roots, 4, path)
+    assert os.path.exists(path)
+
+    builds = []
+    real_build = split.DistanceIndex.build.__func__
+    monkeypatch.setattr(split.DistanceIndex, 'build',
+                        classmethod(lambda cls, *a: builds.append(a) or real_build(cls, *a)))
+    # 浅い深さは保存した索引から切り出す
+    loaded = split.get_distance_index(graph, roots, 2, path)
+    assert builds == [] and loaded.max_depth == 4
+    assert np.array_equal(loaded.nodes, built.nodes) and np.array_equal(loaded.offsets, built.offsets)
+
+    # 深さが足りない、ルートが違う、グラフが違う、読めないファイルは作り直す
+    split.get_distance_index(graph, roots, 5, path)
+    split.get_distance_index(graph, roots[:-1], 2, path)
+    split.get_distance_index(split.build_digraph(edges[:-1]), roots, 2, path)
+    (tmp_path / 'index.npz').write_bytes(b'not an index')
+    split.get_distance_index(graph, roots, 2, path)
+    assert len(builds) == 4
+    assert split.load_distance_index(path, split.distance_index_key(graph, roots), 2) is not None
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+
+@pytest.mark.parametrize('args', [(), ('-j', '2'), ('--bfs', 'root')])
+def test_cli_multiple_depths(synth_dot, synth_edges, tmp_path, args):
+    files, _ = split_outputs(synth_dot, tmp_path / 'out', '--depth', '0,2,5', *args)
+    expected = {}
+    for depth in (0, 2, 5):
+        for root, edges in baseline_split_subgraphs(synth_edges, depth).items():
+            expected[f'{root}.depth{depth}.dot'] = expected_dot(root, edges)
+    assert files == expected
+
+
+def test_cli_reuses_distance_index(synth_dot, synth_edges, tmp_path):
+    path = tmp_path / 'index.npz'
+    split_outputs(synth_dot, tmp_path / 'first', '--max-depth', '5', '--distance-index', path)
+    stamp = path.stat().st_mtime_ns
+    files, _ = split_outputs(synth_dot, tmp_path / 'second', '--depth', '4',
+                             '--distance-index', path)
+    assert path.stat().st_mtime_ns == stamp
+    expected = baseline_split_subgraphs(synth_edges, 4)
+    assert files == {f'{root}.dot': expected_dot(root, edges) for root, edges in expected.items()}
+
+
+@pytest.mark.parametrize('args, message', [
+    (('--depth', 'x'), b'Invalid --depth: x'),
+    (('--depth', '2,-1'), b'Invalid --depth: 2,-1'),
+    (('--depth', '2,4', '--max-depth', '3'), b'--max-depth 3 is smaller than --depth 4'),
+])
+def test_cli_depth_errors(synth_dot, tmp_path, args, message):
+    result = run_script('split_dots_with_main_suffix_nodes.py', synth_dot, *args, cwd=tmp_path,
+                        check=False)
+    assert result.returncode == 1
+    assert message in result.stdout
+    assert os.listdir(tmp_path) == []
+
+
+def test_distance_index_rebuilds_corrupt_zip_and_warns_when_unsaved(tmp_path, capsys):
+    edges = many_roots_edges(roots=10, seed=4)
+    graph = split.build_digraph(edges)
+    roots = split.find_root_candidates(graph)
+    path = tmp_path / 'index.npz'
+    built = split.get_distance_index(graph, roots, 3, str(path))
+    # zip の先頭はあるが途中で切れたファイル
+    path.write_bytes(path.read_bytes()[:40])
+    key = split.distance_index_key(graph, roots)
+    assert split.load_distance_index(str(path), key, 3) is None
+    rebuilt = split.get_distance_index(graph, roots, 3, str(path))
+    assert np.array_equal(rebuilt.nodes, built.nodes)
+    assert split.load_distance_index(str(path), key, 3) is not None
+
+    missing = split.get_distance_index(graph, roots, 3, str(tmp_path / 'nodir' / 'index.npz'))
+    assert np.array_equal(missing.nodes, built.nodes)
+    assert 'Warning: distance index not saved' in capsys.readouterr().err
+    assert not (tmp_path / 'nodir').exists()
+
+
+def test_cli_repeated_depth_is_written_once(synth_dot, synth_edges, tmp_path):
+    files, stdout = split_outputs(synth_dot, tmp_path / 'out', '--depth', '3,2,3')
+    roots = list(baseline_split_subgraphs(synth_edges))
+    assert stdout == [f'Generated: {root}.depth{depth}.dot' for depth in (3, 2) for root in roots]
+    assert len(files) == 2 * len(roots)
+
+
+def test_cli_distance_index_into_missing_directory(synth_dot, tmp_path):
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    result = run_script('split_dots_with_main_suffix_nodes.py', synth_dot, '--distance-index',
+                        tmp_path / 'nodir' / 'index.npz', cwd=out_dir)
+    assert b'Warning: distance index not saved' in result.stderr
+    assert b'Traceback' not in result.stderr
+    assert 'main.dot' in os.listdir(out_dir)
+
+
+def test_cli_rejects_distance_index_with_root_bfs(synth_dot, tmp_path):
+    result = run_script('split_dots_with_main_suffix_nodes.py', synth_dot, '--bfs', 'root',
+                        '--distance-index', tmp_path / 'index.npz', cwd=tmp_path, check=False)
+    assert result.returncode == 1
+    assert b'--distance-index needs --bfs sweep' in result.stdout
+    assert os.listdir(tmp_path) == []
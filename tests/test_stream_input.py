@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+cflow2dot.py の標準入力・圧縮ファイルの入力と、圧縮した DOT の出力のテスト。
+"""
+
+import gzip
+import lzma
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import cflow2dot
+from conftest import data_path, run_script
+
+needs_zstd = pytest.mark.skipif(shutil.which('zstd') is None, reason="zstd command not found")
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.compress(data)
+    if compression == 'xz':
+        return lzma.compress(data)
+    return subprocess.run(['zstd', '-qc'], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'xz':
+        return lzma.decompress(data)
+    return subprocess.run(['zstd', '-dcq'], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+COMPRESSIONS = [('gzip', '.gz'), ('xz', '.xz'), pytest.param('zstd', '.zst', marks=needs_zstd)]
+
+
+@pytest.mark.parametrize('compression, suffix', COMPRESSIONS)
+def test_sniff_compression(tmp_path, compression, suffix):
+    path = tmp_path / ('cflow.txt' + suffix)
+    path.write_bytes(compress(b'    1 main: <>\n', compression))
+    assert cflow2dot.sniff_compression(path.read_bytes()[:8]) == compression
+    assert not cflow2dot.is_plain_file(str(path))
+    assert cflow2dot.is_plain_file(data_path('sample_posix.txt'))
+    assert not cflow2dot.is_plain_file('-')
+
+
+@pytest.mark.parametrize('compression, suffix', COMPRESSIONS)
+@pytest.mark.parametrize('parser', ['mmap', 'regex'])
+def test_cli_compressed_input_matches_plain(synth_cflow, tmp_path, compression, suffix, parser):
+    with open(synth_cflow, 'rb') as f:
+        data = f.read()
+    path = tmp_path / ('synth.txt' + suffix)
+    path.write_bytes(compress(data, compression))
+    expected = run_script('cflow2dot.py', synth_cflow).stdout
+    assert run_script('cflow2dot.py', path, '--parser', parser).stdout == expected
+
+
+@pytest.mark.parametrize('extra', [[], ['--parser', 'regex'], ['--locations']])
+def test_cli_stdin_matches_plain(sample_cflow, extra):
+    with open(sample_cflow, 'rb') as f:
+        data = f.read()
+    expected = run_script('cflow2dot.py', sample_cflow, *extra).stdout
+    assert run_script('cflow2dot.py', '-', *extra, stdin=data).stdout == expected
+
+
+def test_cli_stdin_xref_uses_source_dir():
+    with open(data_path('xref/ops.xref'), 'rb') as f:
+        data = f.read()
+    expected = run_script('cflow2dot.py', data_path('xref/ops.xref'), '--source-dir',
+                          data_path('xref')).stdout
+    result = run_script('cflow2dot.py', '-', '--source-dir', data_path('xref'), stdin=data)
+    assert result.stdout == expected
+    assert result.stderr == b''
+
+
+def test_cli_stdin_regex_rejects_other_dialects():
+    data = b'main() <int main (void) at m.c:3>:\n    foo() <int foo (void) at m.c:9>\n'
+    result = run_script('cflow2dot.py', '-', '--parser', 'regex', stdin=data, check=False)
+    assert result.returncode == 1
+    assert b'regex parser does not support' in result.stderr
+    assert result.stdout == b''
+
+
+def test_open_stream_edges_fails_before_iteration(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        cflow2dot.open_stream_edges(str(tmp_path / 'missing.gz'))
+    path = tmp_path / 'mixed.gz'
+    path.write_bytes(gzip.compress(b'main * m.c:3 int main (void)\n    1 main: <>\n'))
+    with pytest.raises(ValueError, match='--format'):
+        cflow2dot.open_stream_edges(str(path))
+    assert list(cflow2dot.open_stream_edges(str(path), 'xref')) == []
+
+
+def test_cli_missing_input(tmp_path):
+    for extra in ([], ['--check-refs']):
+        result = run_script('cflow2dot.py', tmp_path / 'missing.txt', *extra, check=False)
+        assert result.returncode == 1
+        assert b'No such file or directory' in result.stderr
+        assert b'Traceback' not in result.stderr
+
+
+@pytest.mark.parametrize('compression, suffix', COMPRESSIONS)
+def test_cli_compressed_output(sample_cflow, tmp_path, compression, suffix):
+    expected = run_script('cflow2dot.py', sample_cflow).stdout
+    path = tmp_path / ('out.dot' + suffix)
+    run_script('cflow2dot.py', sample_cflow, '-o', path)
+    assert decompress(path.read_bytes(), compression) == expected
+    piped = run_script('cflow2dot.py', sample_cflow, '--compress', compression).stdout
+    assert decompress(piped, compression) == expected
+
+
+@pytest.mark.skipif(cflow2dot._import_zstandard() is not None,
+                    reason="zstandard module is installed")
+@needs_zstd
+def test_cli_zstd_without_module_or_command(sample_cflow, tmp_path):
+    path = tmp_path / 'cflow.txt.zst'
+    path.write_bytes(compress(open(sample_cflow, 'rb').read(), 'zstd'))
+    env = dict(os.environ, PATH=str(tmp_path / 'empty'))
+
+    result = run_script('cflow2dot.py', path, check=False, env=env)
+    assert result.returncode == 1
+    assert b'needs the zstandard module or the zstd command' in result.stderr
+
+    output = tmp_path / 'out.dot.zst'
+    result = run_script('cflow2dot.py', sample_cflow, '-o', output, check=False, env=env)
+    assert result.returncode == 1
+    assert b'needs the zstandard module or the zstd command' in result.stderr
+    assert not output.exists()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+cflow2dot.py の --xref 形式の変換と、形式の自動判定のテスト。
+
+tests/data/xref の ops.xref / ops.tree は、ops.c に対する
+"cflow -x -i x ops.c" / "cflow ops.c" の出力と同じ形で書いたもの。
+"""
+
+import re
+
+import pytest
+
+import cflow2dot
+from callgraph_core import NodeAttrTable
+from conftest import data_path, dot_edges, run_script
+
+XREF_DIR = data_path('xref')
+
+
+def tree_edges():
+    entries = cflow2dot.open_cflow_entries(
+        data_path('xref/ops.tree'),
+        dialect=cflow2dot.detect_cflow_dialect(data_path('xref/ops.tree')))
+    return set(cflow2dot.edges_from_entries(entries))
+
+
+def test_xref_edges_match_tree_output():
+    edges = set(cflow2dot.open_xref_edges(data_path('xref/ops.xref'), source_dir=XREF_DIR))
+    assert edges == tree_edges()
+    assert edges == {('main', 'run'), ('main', 'stop'), ('main', 'helper'),
+                     ('run', 'helper'), ('run', 'puts'), ('stop', 'puts')}
+
+
+def test_xref_without_sources_guesses_from_definition_lines(capsys):
+    edges = set(cflow2dot.open_xref_edges(data_path('xref/ops.xref'), source_dir='/nonexistent'))
+    # 関数ポインタ表の初期化子の参照が、直前に定義された stop に付いてしまう
+    assert edges - tree_edges() == {('stop', 'run'), ('stop', 'stop')}
+    assert 'ops.c: source not found' in capsys.readouterr().err
+
+    # source_dir を渡さなければソースを探さない
+    assert set(cflow2dot.open_xref_edges(data_path('xref/ops.xref'))) == edges
+    assert capsys.readouterr().err == ''
+
+
+def test_xref_skips_variables_and_records_function_locations():
+    attrs = NodeAttrTable()
+    edges = set(cflow2dot.open_xref_edges(data_path('xref/ops.xref'), attrs, XREF_DIR))
+    assert not {name for edge in edges for name in edge} & {'counter', 'table'}
+    assert {name: (file, line) for name, file, line in attrs} == \
+        {'helper': ('ops.c', 5), 'main': ('ops.c', 32), 'run': ('ops.c', 11),
+         'stop': ('ops.c', 17)}
+
+
+@pytest.mark.parametrize('name, declaration, expected', [
+    ('main', 'int main (int argc, char *argv[])', True),
+    ('get', 'char *get(void)', True),
+    ('handler_for', 'void (*handler_for (int sig)) (int)', True),
+    ('counter', 'static int counter', False),
+    ('hook', 'int (*hook) (int)', False),
+    ('table', 'static struct ops table[]', False),
+    ('unknown', '', True),
+])
+def test_is_function_declaration(name, declaration, expected):
+    assert cflow2dot.is_function_declaration(name, declaration) is expected
+
+
+def test_toplevel_blocks_skip_comments_and_strings():
+    with open(data_path('xref/ops.c'), encoding='utf-8') as f:
+        text = f.read()
+    assert cflow2dot.toplevel_blocks(text) == \
+        [(6, 9), (12, 15), (18, 20), (22, 25), (27, 30), (33, 37)]
+    assert cflow2dot.function_extents(text, [5, 11, 17, 32]) == {5: 9, 11: 15, 17: 20, 32: 37}
+
+
+def test_toplevel_blocks_skip_preprocessor_lines():
+    text = ('#define BEGIN {\n'
+            '#define LONG \\\n'
+            '    }\n'
+            'int f(void)\n'
+            '{\n'
+            "    return '}';\n"
+            '}\n')
+    assert cflow2dot.toplevel_blocks(text) == [(5, 7)]
+
+
+@pytest.mark.parametrize('name, expected', [('ops.xref', 'xref'), ('ops.tree', 'tree')])
+def test_detect_cflow_format(name, expected):
+    assert cflow2dot.detect_cflow_format(data_path('xref/' + name)) == expected
+
+
+def test_detect_cflow_format_of_numbered_tree(sample_cflow):
+    assert cflow2dot.detect_cflow_format(sample_cflow) == 'tree'
+    assert cflow2dot.detect_cflow_format_lines([]) == 'tree'
+
+
+def test_detect_cflow_format_rejects_mixed_lines():
+    lines = [b'main * main.c:3 int main (void)\n'] + [b'    %d     foo: <>\n' % i for i in range(50)]
+    with pytest.raises(ValueError, match='--format'):
+        cflow2dot.detect_cflow_format_lines(lines)
+    # 判定に使うのは先頭の FORMAT_SAMPLE_LINES 行だけ
+    lines = [b'foo   main.c:%d\n' % i for i in range(cflow2dot.FORMAT_SAMPLE_LINES)]
+    lines.append(b'    1 main: <>\n')
+    assert cflow2dot.detect_cflow_format_lines(lines) == 'xref'
+
+
+def test_cli_xref_matches_tree():
+    xref_out = run_script('cflow2dot.py', data_path('xref/ops.xref'), cwd=XREF_DIR).stdout
+    tree_out = run_script('cflow2dot.py', data_path('xref/ops.tree')).stdout
+    assert set(dot_edges(xref_out.decode('utf-8'))) == set(dot_edges(tree_out.decode('utf-8')))
+
+
+def test_cli_mixed_format_needs_explicit_format(tmp_path):
+    path = tmp_path / 'mixed.txt'
+    path.write_text('main * main.c:3 int main (void)\n    1 main: <>\n')
+    result = run_script('cflow2dot.py', path, check=False)
+    assert result.returncode == 1
+    assert b'use --format' in result.stderr
+    assert run_script('cflow2dot.py', path, '--format', 'tree').returncode == 0
+
+
+def test_check_xref_format():
+    with open(data_path('xref/ops.xref'), 'rb') as f:
+        cflow2dot.check_xref_format(f)
+    cflow2dot.check_xref_format([b'\n', b''])
+    with open(data_path('xref/ops.tree'), 'rb') as f:
+        with pytest.raises(ValueError, match='no cflow --xref records'):
+            cflow2dot.check_xref_format(f)
+
+
+@pytest.mark.parametrize('stdin', [False, True])
+def test_cli_forced_xref_rejects_tree_input(sample_cflow, tmp_path, stdin):
+    out = tmp_path / 'out.dot'
+    if stdin:
+        with open(sample_cflow, 'rb') as f:
+            result = run_script('cflow2dot.py', '-', '--format', 'xref', '-o', out,
+                                stdin=f.read(), check=False)
+    else:
+        result = run_script('cflow2dot.py', sample_cflow, '--format', 'xref', '-o', out, check=False)
+    assert result.returncode == 1
+    assert result.stderr.decode('utf-8').strip() == cflow2dot.XREF_FORMAT_MISMATCH
+    assert not out.exists()
+
+
+COUNTED_SOURCE = '''int main(void)
+{
+    foo();
+    foo();
+    bar();
+    return 0;
+}
+
+int foo(void)
+{
+    return bar();
+}
+'''
+
+COUNTED_XREF = '''bar   m.c:5
+bar   m.c:11
+foo * m.c:9 int foo (void)
+foo   m.c:3
+foo   m.c:4
+main * m.c:1 int main (void)
+'''
+
+
+@pytest.fixture
+def counted_xref(tmp_path):
+    (tmp_path / 'm.c').write_text(COUNTED_SOURCE)
+    path = tmp_path / 'm.xref'
+    path.write_text(COUNTED_XREF)
+    return path
+
+
+def counted_dot_edges(text):
+    edge_re = re.compile(r'^    "([^"]+)" -> "([^"]+)"(?: \[weight=(\d+), penwidth=[\d.]+, '
+                         r'label="(\d+)"\])?;$')
+    counts = {}
+    for m in filter(None, map(edge_re.match, text.splitlines())):
+        src, dst, weight, label = m.groups()
+        assert weight == label
+        counts[(src, dst)] = int(weight or 1)
+    return counts
+
+
+@pytest.mark.parametrize('dedupe', ['stream', 'sort', 'external'])
+def test_cli_counts_are_call_sites(counted_xref, dedupe):
+    result = run_script('cflow2dot.py', counted_xref, '--counts', '--dedupe', dedupe,
+                        cwd=counted_xref.parent)
+    assert result.stderr == b''
+    assert counted_dot_edges(result.stdout.decode('utf-8')) == \
+        {('main', 'foo'): 2, ('main', 'bar'): 1, ('foo', 'bar'): 1}
+
+
+def test_count_edges_and_attributes():
+    edges = [('a', 'b', 1), ('b', 'c', 2), ('a', 'b', 3)]
+    assert list(cflow2dot.count_edges(edges)) == [('a', 'b', 4), ('b', 'c', 2)]
+    assert cflow2dot.edge_attributes(1) == ''
+    assert cflow2dot.edge_attributes(4) == ' [weight=4, penwidth=3.0, label="4"]'
+    assert cflow2dot.edge_attributes(1 << 20) == \
+        ' [weight=1048576, penwidth=8.0, label="1048576"]'
+
+
+@pytest.mark.parametrize('stdin', [False, True])
+def test_cli_counts_rejects_tree_input(sample_cflow, stdin):
+    if stdin:
+        with open(sample_cflow, 'rb') as f:
+            result = run_script('cflow2dot.py', '-', '--counts', stdin=f.read(), check=False)
+    else:
+        result = run_script('cflow2dot.py', sample_cflow, '--counts', check=False)
+    assert result.returncode == 1
+    assert b'--counts needs cflow --xref input' in result.stderr
+    assert result.stdout == b''
+
+
+def test_cli_xref_rejects_jobs():
+    result = run_script('cflow2dot.py', data_path('xref/ops.xref'), '-j', '2', check=False)
+    assert result.returncode == 1
+    assert b'--jobs need the tree format' in result.stderr